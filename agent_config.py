@@ -9,4 +9,12 @@ MODEL_NAME = "gpt-4o"  # Change this to "o3" once your verification is complete
 
 # You can also set this via environment variable
 import os
-MODEL_NAME = os.getenv("CONTENT_AGENT_MODEL", MODEL_NAME)
\ No newline at end of file
+MODEL_NAME = os.getenv("CONTENT_AGENT_MODEL", MODEL_NAME)
+
+# "handoff" runs the content coordinator with handoffs, "pipeline" generates
+# the instructor, script and conversation states concurrently
+CONTENT_AGENT_MODE = os.getenv("CONTENT_AGENT_MODE", "handoff")
+
+# Agents search an index of the source document for the passages they need
+# instead of reading the whole document (set to 0 to read it whole)
+CONTENT_DOC_RETRIEVAL = os.getenv("CONTENT_DOC_RETRIEVAL", "1").lower() in ("1", "true", "yes")
@@ -0,0 +1,163 @@
+"""
+Whole-flow audio bundles for one-shot client preloading.
+
+A bundle is an uncompressed tar archive (MP3 does not compress further)
+holding manifest.json followed by one file per rendered step. Archives are
+streamed straight from disk: member files are opened up front, so a cache
+eviction mid-download cannot truncate them, and the total length is known
+before the first byte so clients can show progress. The manifest inside the
+archive and the ETag describe the members that were actually opened, and
+ArchiveResponse closes them however the response ends, including when the
+client disconnects before the first byte.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import tarfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
+
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from mp3_frames import FrameReader
+
+BLOCK_SIZE = tarfile.BLOCKSIZE
+READ_SIZE = 1024 * 1024
+MANIFEST_NAME = "manifest.json"
+
+# Memoized durations, keyed by file identity like audio_http's ETags
+_DURATION_CACHE_SIZE = 4096
+_durations: "OrderedDict[Tuple[str, int, int], Optional[float]]" = OrderedDict()
+
+
+class BundleMember(NamedTuple):
+    name: str
+    fd: int
+    size: int
+    mtime: float
+
+
+def _mp3_duration(path: Path) -> Optional[float]:
+    reader = FrameReader()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(READ_SIZE), b""):
+            reader.feed(block)
+    reader.flush()
+    return round(reader.duration, 3) if reader.frames else None
+
+
+async def file_duration(path: Path, stat: os.stat_result) -> Optional[float]:
+    """Playback seconds of an MP3 file, from its frame headers"""
+    identity = (str(path), stat.st_ino, stat.st_size)
+    if identity in _durations:
+        _durations.move_to_end(identity)
+        return _durations[identity]
+    duration = await asyncio.to_thread(_mp3_duration, path)
+    _durations[identity] = duration
+    while len(_durations) > _DURATION_CACHE_SIZE:
+        _durations.popitem(last=False)
+    return duration
+
+
+def _padding(size: int) -> int:
+    return -size % BLOCK_SIZE
+
+
+def _header(name: str, size: int, mtime: float) -> bytes:
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(mtime)
+    info.mode = 0o644
+    return info.tobuf(format=tarfile.USTAR_FORMAT)
+
+
+def bundle_etag(manifest: Dict[str, Any]) -> str:
+    """Strong ETag for a bundle: it changes whenever any member's content does"""
+    members = [(step["step"], step["key"], step["bytes"]) for step in manifest["steps"] if step["available"]]
+    digest = hashlib.sha256(json.dumps(members).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def open_members(files: List[Tuple[str, Path]]) -> List[BundleMember]:
+    """Open member files now so later evictions cannot change the archive"""
+    members = []
+    for name, path in files:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        stat = os.fstat(fd)
+        members.append(BundleMember(name, fd, stat.st_size, stat.st_mtime))
+    return members
+
+
+def close_members(members: List[BundleMember]):
+    for member in members:
+        os.close(member.fd)
+
+
+def opened_manifest(manifest: Dict[str, Any], members: List[BundleMember]) -> Dict[str, Any]:
+    """The manifest with only the opened members available, at their opened sizes"""
+    sizes = {member.name: member.size for member in members}
+    steps = []
+    for step in manifest["steps"]:
+        opened = step["file"] in sizes
+        steps.append({
+            **step,
+            "available": opened,
+            "bytes": sizes.get(step["file"]),
+            "duration": step["duration"] if opened else None,
+        })
+    return {
+        **manifest,
+        "complete": all(step["available"] for step in steps),
+        "total_bytes": sum(step["bytes"] or 0 for step in steps),
+        "total_duration": round(sum(step["duration"] or 0 for step in steps), 3),
+        "steps": steps,
+    }
+
+
+def archive_size(manifest_bytes: bytes, members: List[BundleMember]) -> int:
+    size = BLOCK_SIZE + len(manifest_bytes) + _padding(len(manifest_bytes))
+    for member in members:
+        size += BLOCK_SIZE + member.size + _padding(member.size)
+    return size + 2 * BLOCK_SIZE
+
+
+async def stream_archive(manifest_bytes: bytes, members: List[BundleMember]) -> AsyncIterator[bytes]:
+    """Yield a tar archive of the manifest and member files"""
+    yield _header(MANIFEST_NAME, len(manifest_bytes), time.time())
+    yield manifest_bytes + bytes(_padding(len(manifest_bytes)))
+
+    for member in members:
+        yield _header(member.name, member.size, member.mtime)
+        offset = 0
+        while offset < member.size:
+            data = await asyncio.to_thread(os.pread, member.fd, min(READ_SIZE, member.size - offset), offset)
+            if not data:
+                break
+            offset += len(data)
+            yield data
+        # Keep the archive well-formed even if a file shrank underneath us
+        yield bytes(member.size - offset + _padding(member.size))
+
+    yield bytes(2 * BLOCK_SIZE)
+
+
+class ArchiveResponse(StreamingResponse):
+    """Streams a bundle archive and closes its member files when done"""
+
+    def __init__(self, manifest_bytes: bytes, members: List[BundleMember], headers: Dict[str, str]):
+        super().__init__(stream_archive(manifest_bytes, members), media_type="application/x-tar", headers=headers)
+        self.members = members
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            close_members(self.members)
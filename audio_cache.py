@@ -0,0 +1,149 @@
+"""
+Content-addressed on-disk cache for rendered TTS audio.
+
+Entries are keyed by a hash of everything that determines the synthesized
+audio (model, voice, input and instructions), so every new hire hitting the
+same step shares a single rendering. The cache is bounded by total size and
+evicts least recently used files first.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional
+
+# Cache configuration
+AUDIO_CACHE_DIR = Path(os.getenv("AUDIO_CACHE_DIR", Path(__file__).parent / "audio_cache"))
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def content_key(step_config: Dict[str, Any], model: str) -> str:
+    """Hash the (model, voice, input, instructions) tuple that defines a rendering"""
+    payload = json.dumps(
+        {
+            "model": model,
+            "voice": step_config["voice"],
+            "input": step_config["input"],
+            "instructions": step_config["instructions"],
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """Size-bounded LRU cache of audio files stored under their content key"""
+
+    def __init__(self, directory: Path = AUDIO_CACHE_DIR, max_bytes: int = AUDIO_CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        # The directory also holds in-progress renders, even when caching is off
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self.enabled:
+            self._scan()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _scan(self):
+        """Rebuild the LRU order from the files already on disk"""
+        files = []
+        for path in self.directory.iterdir():
+            if not path.is_file():
+                continue
+            if path.suffix == ".part":
+                # Left behind by an interrupted render
+                path.unlink(missing_ok=True)
+                continue
+            stat = path.stat()
+            files.append((stat.st_mtime, path.name, stat.st_size))
+
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total_bytes += size
+        self._evict()
+
+    def path(self, key: str, ext: str = "mp3") -> Path:
+        return self.directory / f"{key}.{ext}"
+
+    def get(self, key: str, ext: str = "mp3") -> Optional[Path]:
+        """Return the cached file for a key, marking it as recently used"""
+        name = f"{key}.{ext}"
+        if name not in self._entries:
+            return None
+
+        path = self.directory / name
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self._total_bytes -= self._entries.pop(name)
+            return None
+
+        self._entries.move_to_end(name)
+        return path
+
+    def put_file(self, key: str, ext: str, tmp_path: Path) -> Path:
+        """Move a fully written temporary file into the cache"""
+        name = f"{key}.{ext}"
+        path = self.directory / name
+        os.replace(tmp_path, path)
+
+        if name in self._entries:
+            self._total_bytes -= self._entries.pop(name)
+        size = path.stat().st_size
+        self._entries[name] = size
+        self._total_bytes += size
+        self._evict()
+        return path
+
+    def tmp_path(self, key: str, ext: str = "mp3") -> Path:
+        return self.directory / f"{key}.{ext}.{uuid.uuid4().hex}.part"
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            (self.directory / name).unlink(missing_ok=True)
+
+    def discard(self, key: str) -> int:
+        """Remove every cached format of a key, returning the number of files"""
+        prefix = f"{key}."
+        names = [name for name in self._entries if name.startswith(prefix)]
+        for name in names:
+            self._total_bytes -= self._entries.pop(name)
+            (self.directory / name).unlink(missing_ok=True)
+        return len(names)
+
+    def clear(self):
+        """Remove every cached file"""
+        for name in list(self._entries):
+            (self.directory / name).unlink(missing_ok=True)
+        self._entries.clear()
+        self._total_bytes = 0
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+async def read_file(path: Path, chunk_size: int = READ_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Stream a cached file without blocking the event loop on disk reads"""
+    with open(path, "rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
@@ -0,0 +1,309 @@
+"""
+HTTP caching semantics for rendered audio files.
+
+The audio format is negotiated per request from an explicit ?format= or
+?quality= parameter, the Accept header and the Save-Data hint.
+
+Audio that is already on disk is served with a strong ETag derived from a
+SHA-256 of the file's bytes, answers If-None-Match with 304 Not Modified, and
+supports single byte-range requests (206 Partial Content) so browsers and
+CDNs can replay and seek without refetching the whole MP3.
+
+File bodies are handed to the server with the ASGI zero-copy send extension
+(sendfile) when the server offers it, and otherwise read in large blocks so a
+typical step is sent with one or two reads instead of a chunk per 64 KB.
+The file is opened before any headers are sent, so a file evicted from the
+cache in the meantime is re-rendered instead of failing mid-response.
+"""
+
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+# Block size for servers without zero-copy send
+AUDIO_FILE_CHUNK_SIZE = int(os.getenv("AUDIO_FILE_CHUNK_SIZE", 1024 * 1024))
+
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+MEDIA_TYPES = {
+    "mp3": "audio/mpeg",
+    "opus": "audio/ogg",
+    "aac": "audio/aac",
+    "flac": "audio/flac",
+    "wav": "audio/wav",
+}
+
+# Accept header media types, including common aliases, to formats
+ACCEPT_TYPES = {
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+    "audio/aac": "aac",
+    "audio/flac": "flac",
+    "audio/x-flac": "flac",
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/wave": "wav",
+}
+
+DEFAULT_FORMAT = "mp3"
+
+# Format preference when the client does not insist on one
+QUALITY_PREFERENCES = {
+    # Opus is the smallest at speech quality: mobile and poor connections
+    "low": ["opus", "aac", "mp3", "flac", "wav"],
+    "standard": ["mp3", "opus", "aac", "flac", "wav"],
+    # Lossless for desktops on good connections
+    "high": ["flac", "wav", "aac", "mp3", "opus"],
+}
+
+# Memoized file digests, keyed by file identity so a re-render is re-hashed
+_ETAG_CACHE_SIZE = 4096
+_etags: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+
+
+def _hash_file(fd: int, size: int) -> str:
+    digest = hashlib.sha256()
+    offset = 0
+    while offset < size:
+        block = os.pread(fd, min(1024 * 1024, size - offset), offset)
+        if not block:
+            break
+        digest.update(block)
+        offset += len(block)
+    return digest.hexdigest()
+
+
+async def file_etag(path: Path, fd: int, stat: os.stat_result) -> str:
+    """Strong ETag for the contents of a file open as fd"""
+    identity = (str(path), stat.st_ino, stat.st_size)
+    etag = _etags.get(identity)
+    if etag is None:
+        etag = f'"{(await asyncio.to_thread(_hash_file, fd, stat.st_size))[:32]}"'
+        _etags[identity] = etag
+        while len(_etags) > _ETAG_CACHE_SIZE:
+            _etags.popitem(last=False)
+    else:
+        _etags.move_to_end(identity)
+    return etag
+
+
+def parse_accept(header: str) -> Dict[str, float]:
+    """Media ranges of an Accept header with their quality values"""
+    ranges = {}
+    for part in header.split(","):
+        media_type, *params = (item.strip() for item in part.split(";"))
+        if not media_type:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        ranges[media_type.lower()] = max(q, ranges.get(media_type.lower(), 0.0))
+    return ranges
+
+
+def negotiate_format(
+    available: Sequence[str],
+    accept: Optional[str] = None,
+    requested: Optional[str] = None,
+    quality: Optional[str] = None,
+    save_data: bool = False,
+) -> Optional[str]:
+    """
+    Pick the audio format for a request, or None if nothing acceptable exists.
+
+    An explicit format always wins. Otherwise the Accept header's quality
+    values decide, and formats it ranks equally are ordered by the requested
+    quality level (low when the client sends Save-Data).
+    """
+    if requested:
+        return requested if requested in available else None
+
+    if quality not in QUALITY_PREFERENCES:
+        quality = "low" if save_data else "standard"
+    preference = [ext for ext in QUALITY_PREFERENCES[quality] if ext in available]
+
+    if not accept:
+        return preference[0] if preference else None
+
+    ranges = parse_accept(accept)
+    scores = {}
+    for ext in preference:
+        explicit = [q for media_type, q in ranges.items() if ACCEPT_TYPES.get(media_type) == ext]
+        if explicit:
+            scores[ext] = max(explicit)
+        else:
+            scores[ext] = ranges.get("audio/*", ranges.get("*/*", 0.0))
+
+    best = max(scores.values(), default=0.0)
+    if best <= 0:
+        return None
+    return next(ext for ext in preference if scores[ext] == best)
+
+
+def etag_matches(header: str, etag: str, weak: bool = True) -> bool:
+    """Compare an If-None-Match / If-Range header value against an ETag"""
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if weak and candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single byte range into a half-open (start, end) interval.
+
+    Returns None when the header is absent, malformed or asks for several
+    ranges, in which case the full file is served. Raises ValueError when
+    the range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec or "-" not in spec:
+        return None
+
+    first, last = (part.strip() for part in spec.split("-", 1))
+    if not first:
+        # Suffix range: the final N bytes
+        if not last.isdigit():
+            return None
+        if int(last) == 0 or size == 0:
+            raise ValueError("Range not satisfiable")
+        return max(0, size - int(last)), size
+
+    if not first.isdigit() or (last and not last.isdigit()):
+        return None
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError("Range not satisfiable")
+    end = int(last) + 1 if last else size
+    return start, min(end, size)
+
+
+class AudioFileResponse(Response):
+    """Streams a byte range of an open file without loading it into memory
+
+    The response owns fd and closes it once sent.
+    """
+
+    chunk_size = AUDIO_FILE_CHUNK_SIZE
+
+    def __init__(
+        self,
+        fd: int,
+        start: int,
+        end: int,
+        status_code: int = 200,
+        headers: Optional[Dict[str, str]] = None,
+        media_type: Optional[str] = None,
+    ):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.fd = fd
+        self.start = start
+        self.end = end
+        self.headers["content-length"] = str(end - start)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        with os.fdopen(self.fd, "rb") as f:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+                # The server copies straight from the page cache to the socket
+                await send({
+                    "type": ZEROCOPY_EXTENSION,
+                    "file": f,
+                    "offset": self.start,
+                    "count": self.end - self.start,
+                    "more_body": False,
+                })
+                return
+            await self._send_buffered(f, send)
+
+    async def _send_buffered(self, f, send: Send):
+        offset = self.start
+        while offset < self.end:
+            length = min(self.chunk_size, self.end - offset)
+            data = await asyncio.to_thread(os.pread, f.fileno(), length, offset)
+            if not data:
+                break
+            offset += len(data)
+            await send({"type": "http.response.body", "body": data, "more_body": offset < self.end})
+
+        if offset < self.end or self.start == self.end:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def cached_audio_response(
+    request: Request,
+    path: Path,
+    headers: Dict[str, str],
+    ext: str = "mp3",
+) -> Optional[Response]:
+    """
+    Serve a rendered file with ETag, conditional GET and Range support.
+
+    Returns None if the file is gone (evicted since it was looked up), so
+    the caller can render it instead.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return None
+    try:
+        response = await _file_response(request, path, fd, headers, ext)
+    except BaseException:
+        os.close(fd)
+        raise
+    if not isinstance(response, AudioFileResponse):
+        os.close(fd)
+    return response
+
+
+async def _file_response(request: Request, path: Path, fd: int, headers: Dict[str, str], ext: str) -> Response:
+    stat = os.fstat(fd)
+    size = stat.st_size
+    etag = await file_etag(path, fd, stat)
+    headers = {**headers, "ETag": etag, "Accept-Ranges": "bytes"}
+    media_type = MEDIA_TYPES.get(ext, "application/octet-stream")
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    # A Range is only honoured if the client's copy is still the current one
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range and not etag_matches(if_range, etag, weak=False):
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        return AudioFileResponse(fd, 0, size, headers=headers, media_type=media_type)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    return AudioFileResponse(fd, start, end, status_code=206, headers=headers, media_type=media_type)
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Load-test and latency benchmark for the FastAPI audio server.
+
+Simulated new hires walk through the conversation steps of the existing
+voice agents (coach, coach_blaze, villain) while the number of concurrent
+clients scales up. The TTS API is replaced by the offline fake backend
+(TTS_BACKEND=fake), so results measure the server itself: caching,
+coalescing and streaming.
+
+Each concurrency level runs twice: "cold" with an empty audio cache and
+"warm" with the renders from the cold pass. Reported per run:
+time-to-first-byte and total stream time percentiles, throughput and
+process memory. Results are written as JSON so they can be compared
+between commits with --compare.
+
+Usage:
+    python bench_audio_server.py                        # in-process ASGI
+    python bench_audio_server.py --uvicorn              # spawn a uvicorn server
+    python bench_audio_server.py --url http://host:8000 # an already running server
+    python bench_audio_server.py -c 1 10 100 1000 -o bench.json --compare old.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_AGENTS = ["coach", "coach_blaze", "villain"]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def rss_mb() -> Optional[float]:
+    """Current resident set size of this process, where /proc is available"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 1e6, 1)
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes on Linux and bytes on macOS
+    return round(peak / (1e6 if sys.platform == "darwin" else 1e3), 1)
+
+
+def client_paths(agents: Dict[str, List[Optional[str]]], client: int, requests: int) -> List[str]:
+    """The sequence of requests one simulated hire makes"""
+    names = sorted(agents)
+    name = names[client % len(names)]
+    steps = agents[name]
+    start = (client // len(names)) % len(steps)
+    paths = []
+    for i in range(requests):
+        step = steps[(start + i) % len(steps)]
+        paths.append(f"/{name}" + (f"?step={step}" if step else ""))
+    return paths
+
+
+class ASGIClient:
+    """Drives the app in-process, timing the first body byte of each response"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def get(self, url: str) -> Tuple[int, float, float, int]:
+        path, _, query = url.partition("?")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(b"host", b"bench")],
+            "client": ("127.0.0.1", 0),
+            "server": ("bench", 80),
+            "extensions": {},
+        }
+        finished = asyncio.Event()
+        request_sent = False
+        status = 0
+        first_byte: Optional[float] = None
+        size = 0
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal status, first_byte, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                body = message.get("body", b"")
+                if body and first_byte is None:
+                    first_byte = time.perf_counter()
+                size += len(body)
+                if not message.get("more_body", False):
+                    finished.set()
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            finished.set()
+        end = time.perf_counter()
+        return status, (first_byte or end) - start, end - start, size
+
+    async def close(self):
+        pass
+
+
+class HTTPClient:
+    """Drives a running server over HTTP"""
+
+    def __init__(self, base_url: str):
+        import httpx
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=None,
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=None),
+        )
+
+    async def get(self, url: str) -> Tuple[int, float, float, int]:
+        start = time.perf_counter()
+        first_byte: Optional[float] = None
+        size = 0
+        async with self.client.stream("GET", url) as response:
+            async for chunk in response.aiter_raw():
+                if chunk and first_byte is None:
+                    first_byte = time.perf_counter()
+                size += len(chunk)
+        end = time.perf_counter()
+        return response.status_code, (first_byte or end) - start, end - start, size
+
+    async def close(self):
+        await self.client.aclose()
+
+
+async def run_level(client, agents, concurrency: int, requests_per_client: int) -> Dict[str, Any]:
+    ttfb: List[float] = []
+    totals: List[float] = []
+    sizes = 0
+    errors = 0
+
+    async def hire(index: int):
+        nonlocal sizes, errors
+        for path in client_paths(agents, index, requests_per_client):
+            try:
+                status, first, total, size = await client.get(path)
+            except Exception:
+                errors += 1
+                continue
+            if status != 200:
+                errors += 1
+                continue
+            ttfb.append(first)
+            totals.append(total)
+            sizes += size
+
+    start = time.perf_counter()
+    await asyncio.gather(*(hire(i) for i in range(concurrency)))
+    wall = time.perf_counter() - start
+
+    def summary(values: List[float]) -> Dict[str, float]:
+        return {
+            "p50": round(percentile(values, 50) * 1000, 2),
+            "p95": round(percentile(values, 95) * 1000, 2),
+            "p99": round(percentile(values, 99) * 1000, 2),
+            "max": round(max(values, default=0) * 1000, 2),
+        }
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(totals) + errors,
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "ttfb_ms": summary(ttfb),
+        "total_ms": summary(totals),
+        "throughput_rps": round(len(totals) / wall, 1) if wall else 0,
+        "throughput_mb_s": round(sizes / wall / 1e6, 2) if wall else 0,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def spawn_uvicorn(env: Dict[str, str]) -> Tuple[subprocess.Popen, str]:
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=Path(__file__).parent,
+        env={**os.environ, **env},
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("uvicorn did not start within 30 seconds")
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str):
+    """Print p95 latency and throughput changes against an earlier run"""
+    with open(baseline_path) as f:
+        baseline = {
+            (r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]
+        }
+
+    print(f"\nCompared with {baseline_path}:")
+    print(f"{'scenario':<8}{'conc':>6}{'ttfb p95':>14}{'total p95':>14}{'req/s':>14}")
+    for result in results:
+        old = baseline.get((result["scenario"], result["concurrency"]))
+        if not old:
+            continue
+
+        def change(new: float, previous: float) -> str:
+            return f"{(new - previous) / previous * 100:+.1f}%" if previous else "n/a"
+
+        print(f"{result['scenario']:<8}{result['concurrency']:>6}"
+              f"{change(result['ttfb_ms']['p95'], old['ttfb_ms']['p95']):>14}"
+              f"{change(result['total_ms']['p95'], old['total_ms']['p95']):>14}"
+              f"{change(result['throughput_rps'], old['throughput_rps']):>14}")
+
+
+async def run(args) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="audio-bench-")
+    env = {
+        "TTS_BACKEND": "fake",
+        "FAKE_TTS_FIRST_BYTE_LATENCY": str(args.latency),
+        "FAKE_TTS_SPEED": str(args.speed),
+        "AUDIO_CACHE_DIR": str(Path(workdir) / "cache"),
+        "AUDIO_PRERENDER_DIR": str(Path(workdir) / "prerender"),
+        "AUDIO_PREFETCH": "1" if args.prefetch else "0",
+    }
+
+    process = None
+    server = None
+    if args.url:
+        client = HTTPClient(args.url)
+        mode = "http"
+    elif args.uvicorn:
+        process, url = spawn_uvicorn(env)
+        client = HTTPClient(url)
+        mode = "uvicorn"
+    else:
+        # The server reads its configuration at import time
+        os.environ.update(env)
+        sys.path.insert(0, str(Path(__file__).parent))
+        import main as server
+        client = ASGIClient(server.app)
+        mode = "in-process"
+
+    # Steps per agent come from the server's own configuration
+    if server is not None:
+        from prerender import step_ids
+        configs = server.AUDIO_CONFIGS
+        agents = {name: step_ids(configs[name]) for name in args.agents if name in configs}
+    else:
+        agents = {name: [None] + [str(n) for n in range(1, 7)] for name in args.agents}
+
+    results = []
+    try:
+        for concurrency in args.concurrency:
+            for scenario in ("cold", "warm"):
+                if scenario == "cold" and server is not None:
+                    server.audio_cache.clear()
+                elif scenario == "cold" and mode != "uvicorn":
+                    # A remote server's cache cannot be cleared from here
+                    continue
+                result = await run_level(client, agents, concurrency, args.requests_per_client)
+                result["scenario"] = scenario
+                result["rss_mb"] = rss_mb() if server is not None else None
+                result["peak_rss_mb"] = peak_rss_mb() if server is not None else None
+                results.append(result)
+                print(f"{scenario:<6}{concurrency:>6}{result['requests']:>7}{result['errors']:>6}"
+                      f"{result['ttfb_ms']['p50']:>10}{result['ttfb_ms']['p95']:>10}{result['ttfb_ms']['p99']:>10}"
+                      f"{result['total_ms']['p50']:>10}{result['total_ms']['p99']:>10}"
+                      f"{result['throughput_rps']:>9}{result['throughput_mb_s']:>8}"
+                      f"{result['rss_mb'] if result['rss_mb'] is not None else '-':>8}")
+            if mode == "uvicorn" and concurrency != args.concurrency[-1]:
+                # Restart with an empty cache so the next cold pass is cold
+                await client.close()
+                process.terminate()
+                process.wait()
+                env["AUDIO_CACHE_DIR"] = tempfile.mkdtemp(prefix="audio-bench-cache-")
+                process, url = spawn_uvicorn(env)
+                client = HTTPClient(url)
+    finally:
+        await client.close()
+        if process:
+            process.terminate()
+            process.wait()
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "mode": mode,
+            "agents": sorted(agents),
+            "requests_per_client": args.requests_per_client,
+            "fake_tts": {"first_byte_latency": args.latency, "speed": args.speed},
+            "prefetch": args.prefetch,
+        },
+        "results": results,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the audio server with a stubbed TTS backend")
+    parser.add_argument("--concurrency", "-c", type=int, nargs="+", default=[1, 10, 100, 1000],
+                        help="Concurrent clients per level (default: 1 10 100 1000)")
+    parser.add_argument("--requests-per-client", "-r", type=int, default=3,
+                        help="Sequential step requests per client (default: 3)")
+    parser.add_argument("--agents", "-a", nargs="+", default=DEFAULT_AGENTS,
+                        help=f"Agents to exercise (default: {' '.join(DEFAULT_AGENTS)})")
+    parser.add_argument("--latency", type=float, default=0.3,
+                        help="Fake TTS first-byte latency in seconds (default: 0.3)")
+    parser.add_argument("--speed", type=float, default=20.0,
+                        help="Fake TTS speed as a multiple of real time, 0 for unpaced (default: 20)")
+    parser.add_argument("--prefetch", action="store_true", help="Leave speculative prefetch enabled")
+    parser.add_argument("--uvicorn", action="store_true", help="Spawn uvicorn instead of driving ASGI in-process")
+    parser.add_argument("--url", help="Benchmark an already running server (warm runs only)")
+    parser.add_argument("--output", "-o", help="Write JSON results to this file")
+    parser.add_argument("--compare", help="Earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    print(f"{'run':<6}{'conc':>6}{'reqs':>7}{'errs':>6}{'ttfb50':>10}{'ttfb95':>10}{'ttfb99':>10}"
+          f"{'total50':>10}{'total99':>10}{'req/s':>9}{'MB/s':>8}{'RSS MB':>8}")
+    report = asyncio.run(run(args))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    else:
+        print("\n" + json.dumps(report, indent=2))
+
+    if args.compare:
+        compare(report["results"], args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Benchmark: serving rendered audio files under concurrent load.
+
+Drives each response type directly through the ASGI interface with a sink
+`send` that discards the body, and reports throughput and CPU time per
+request for:
+
+    upstream   StreamingResponse over an async generator of small chunks,
+               the shape of generate_audio_stream's output
+    generator  StreamingResponse over the cached file read in 64 KB chunks
+    buffered   AudioFileResponse with large pread blocks
+    zerocopy   AudioFileResponse via the ASGI zero-copy send extension,
+               completed with os.sendfile into /dev/null like a server would
+
+Usage:
+    python bench_audio_serving.py
+    python bench_audio_serving.py --size 2000000 --concurrency 1 50 200 --json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from starlette.responses import StreamingResponse
+
+from audio_cache import read_file
+from audio_http import ZEROCOPY_EXTENSION, AudioFileResponse
+
+UPSTREAM_CHUNK_SIZE = 4096
+
+
+async def upstream_chunks(data: bytes):
+    """Stand-in for generate_audio_stream: small chunks through a generator"""
+    for offset in range(0, len(data), UPSTREAM_CHUNK_SIZE):
+        yield data[offset:offset + UPSTREAM_CHUNK_SIZE]
+
+
+def make_response(mode: str, path: Path, data: bytes):
+    size = len(data)
+    if mode == "upstream":
+        return StreamingResponse(upstream_chunks(data), media_type="audio/mpeg")
+    if mode == "generator":
+        return StreamingResponse(read_file(path), media_type="audio/mpeg")
+    return AudioFileResponse(os.open(path, os.O_RDONLY), 0, size, media_type="audio/mpeg")
+
+
+async def serve_one(mode: str, path: Path, data: bytes, devnull: int) -> int:
+    """Run one response through ASGI, returning the number of body bytes sent"""
+    sent = 0
+    scope = {"type": "http", "method": "GET", "extensions": {}}
+    if mode == "zerocopy":
+        scope["extensions"][ZEROCOPY_EXTENSION] = {}
+
+    async def receive():
+        await asyncio.sleep(3600)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal sent
+        if message["type"] == "http.response.body":
+            sent += len(message.get("body", b""))
+        elif message["type"] == ZEROCOPY_EXTENSION:
+            offset, count = message["offset"], message["count"]
+            fd = message["file"].fileno()
+            while count:
+                written = await asyncio.to_thread(os.sendfile, devnull, fd, offset, count)
+                if not written:
+                    break
+                offset += written
+                count -= written
+                sent += written
+
+    await make_response(mode, path, data)(scope, receive, send)
+    return sent
+
+
+async def bench(mode: str, path: Path, data: bytes, concurrency: int, rounds: int) -> Dict[str, Any]:
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        total = 0
+        for _ in range(rounds):
+            results = await asyncio.gather(
+                *(serve_one(mode, path, data, devnull) for _ in range(concurrency))
+            )
+            total += sum(results)
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+    finally:
+        os.close(devnull)
+
+    requests = concurrency * rounds
+    assert total == len(data) * requests, f"{mode} sent {total} bytes"
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "requests": requests,
+        "wall_s": round(wall, 4),
+        "throughput_mb_s": round(total / wall / 1e6, 1),
+        "requests_per_s": round(requests / wall, 1),
+        "cpu_ms_per_request": round(cpu / requests * 1000, 3),
+    }
+
+
+async def run(args) -> List[Dict[str, Any]]:
+    data = os.urandom(args.size)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "step.mp3"
+        path.write_bytes(data)
+
+        results = []
+        for concurrency in args.concurrency:
+            for mode in args.modes:
+                # Keep total work per measurement roughly constant
+                rounds = max(1, args.requests // concurrency)
+                results.append(await bench(mode, path, data, concurrency, rounds))
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cached audio serving paths")
+    parser.add_argument("--size", type=int, default=960_000,
+                        help="File size in bytes (default: ~1 minute of 128 kbps MP3)")
+    parser.add_argument("--concurrency", "-c", type=int, nargs="+", default=[1, 10, 100],
+                        help="Concurrent requests per round (default: 1 10 100)")
+    parser.add_argument("--requests", "-n", type=int, default=200,
+                        help="Approximate requests per measurement (default: 200)")
+    parser.add_argument("--modes", nargs="+", default=["upstream", "generator", "buffered", "zerocopy"],
+                        choices=["upstream", "generator", "buffered", "zerocopy"])
+    parser.add_argument("--json", action="store_true", help="Emit results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'mode':<11}{'conc':>6}{'reqs':>7}{'MB/s':>10}{'req/s':>10}{'CPU ms/req':>12}")
+    for result in results:
+        print(f"{result['mode']:<11}{result['concurrency']:>6}{result['requests']:>7}"
+              f"{result['throughput_mb_s']:>10}{result['requests_per_s']:>10}{result['cpu_ms_per_request']:>12}")
+
+
+if __name__ == "__main__":
+    main()
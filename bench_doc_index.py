@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark: document retrieval vs. reading the whole document per tool call.
+
+Models a coach_blaze-style handoff build. The baseline is the previous
+read_document tool: the coordinator and each of the three writers read the
+whole handbook once (the minimum; agents often read it more than once, and
+handoffs carry earlier tool output along). With retrieval every agent reads
+the outline, the script and conversation states writers run one search per
+section of coach_blaze's script, and the instructor writer searches for the
+company's values and culture. Tokens are counted with tiktoken when it is
+installed, otherwise estimated at four characters per token.
+
+With --live both variants are built for real (LLM cache disabled) and the
+wall-clock time and the prompt tokens reported by the API are compared. The
+generated agents are removed afterwards.
+
+Usage:
+    python bench_doc_index.py
+    python bench_doc_index.py --live
+"""
+
+import argparse
+import asyncio
+import shutil
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from doc_index import DOC_SEARCH_TOP_K, build_index, format_passages, load_document_index
+from script_index import load_script_index
+
+DOCUMENT = Path(__file__).parent / "ACME_docs" / "ACME_Employee_Handbook.txt"
+TEMPLATE_SCRIPT = Path(__file__).parent / "voice_agent" / "coach_blaze" / "script.txt"
+COACH_BLAZE_PERSONALITY = (
+    "Coach Blaze, ACME's high-energy wellness and onboarding coach. Former collegiate track star "
+    "and certified personal trainer who motivates new hires to stretch into policies, lift their "
+    "knowledge and sprint toward success, with light fitness metaphors"
+)
+WRITERS = 3
+INSTRUCTOR_QUERY = "core values culture welcome"
+
+
+def token_counter() -> Callable[[str], int]:
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("o200k_base")
+        return lambda text: len(encoding.encode(text))
+    except ImportError:
+        return lambda text: (len(text) + 3) // 4
+
+
+def template_queries() -> List[str]:
+    """One query per coach_blaze script section, e.g. "PAY, PTO & BENEFITS" """
+    sections = load_script_index(TEMPLATE_SCRIPT)["sections"]
+    return [section["title"].split("–")[0].strip() for section in sections if section["title"]]
+
+
+def bench_tool_tokens(top_k: int) -> Dict[str, float]:
+    count = token_counter()
+    text = DOCUMENT.read_text(encoding='utf-8')
+
+    start = time.perf_counter()
+    build_index(DOCUMENT)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    index = load_document_index(DOCUMENT)
+    queries = template_queries()
+    start = time.perf_counter()
+    results = [index.search(query, top_k) for query in queries]
+    search_us = (time.perf_counter() - start) / len(queries) * 1e6
+
+    outline = "\n".join(index.outline())
+    baseline = (1 + WRITERS) * count(text)
+    section_tokens = sum(count(format_passages(found)) for found in results)
+    retrieval = ((1 + WRITERS) * count(outline) + (WRITERS - 1) * section_tokens
+                 + count(format_passages(index.search(INSTRUCTOR_QUERY, top_k))))
+
+    print(f"Document: {DOCUMENT.name}, {count(text)} tokens, {len(index.chunks)} passages")
+    print(f"Index build {build_ms:.2f} ms, search {search_us:.1f} µs per query\n")
+    print(f"{'query':<32}{'top passage':<48}{'tokens':>7}")
+    for query, found in zip(queries, results):
+        heading = found[0]["heading"].split(" > ")[-1] if found else "-"
+        print(f"{query[:31]:<32}{heading[:47]:<48}{count(format_passages(found)):>7}")
+
+    print(f"\nTool output per build: {baseline} tokens reading whole, {retrieval} with search "
+          f"({100 * (1 - retrieval / baseline):.0f}% less)")
+    return {"baseline_tokens": baseline, "retrieval_tokens": retrieval}
+
+
+async def bench_live(agent_name: str, keep: bool):
+    from content_agent import create_voice_agent_content
+    from llm_cache import llm_cache
+
+    # Every run must reach the API to be timed
+    llm_cache.disable()
+    rows = []
+    for retrieval in (False, True):
+        name = f"{agent_name}_{'search' if retrieval else 'read'}"
+        start = time.perf_counter()
+        result = await create_voice_agent_content(
+            source_document=str(DOCUMENT),
+            agent_name=name,
+            agent_personality=COACH_BLAZE_PERSONALITY,
+            mode="handoff",
+            retrieval=retrieval,
+        )
+        rows.append((name, time.perf_counter() - start, result["usage"]))
+        if not keep:
+            shutil.rmtree(Path("voice_agent") / name, ignore_errors=True)
+
+    print(f"\n{'build':<32}{'seconds':>9}{'requests':>10}{'prompt tok':>12}{'output tok':>12}")
+    for name, seconds, usage in rows:
+        print(f"{name:<32}{seconds:>9.1f}{usage['requests']:>10}"
+              f"{usage['input_tokens']:>12}{usage['output_tokens']:>12}")
+    (_, read_seconds, read_usage), (_, search_seconds, search_usage) = rows
+    if read_usage["input_tokens"]:
+        print(f"\nPrompt tokens {100 * (1 - search_usage['input_tokens'] / read_usage['input_tokens']):.0f}% less, "
+              f"time {100 * (1 - search_seconds / read_seconds):.0f}% less with search")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark document retrieval for the content agent")
+    parser.add_argument("--top-k", "-k", type=int, default=DOC_SEARCH_TOP_K,
+                        help=f"Passages per search (default: {DOC_SEARCH_TOP_K})")
+    parser.add_argument("--live", action="store_true", help="Also build both variants with the OpenAI API")
+    parser.add_argument("--agent-name", default="bench_coach_blaze", help="Prefix for the agents built with --live")
+    parser.add_argument("--keep", action="store_true", help="Keep the agents built with --live")
+    args = parser.parse_args()
+
+    bench_tool_tokens(args.top_k)
+    if args.live:
+        asyncio.run(bench_live(args.agent_name, args.keep))
+
+
+if __name__ == "__main__":
+    main()
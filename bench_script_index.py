@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: compiled script index vs. re-scanning the script per request.
+
+Compares the per-request cost of the previous get_step_content approach,
+which split the script into lines and scanned for section markers on every
+call, against a dict lookup in the compiled index.
+
+Usage:
+    python bench_script_index.py
+    python bench_script_index.py --iterations 50000
+"""
+
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from script_index import SIDECAR_NAME, compile_script, load_script_index
+
+VOICE_AGENT_DIR = Path(__file__).parent / "voice_agent"
+
+
+def legacy_step_lookup(script_content: str, character_name: str, step: str) -> str:
+    """The original per-request scan from main.get_step_content"""
+    script_lines = script_content.split('\n')
+    section_key = f"Section {int(step) - 1}:"
+
+    in_section = False
+    section_text = []
+    for line in script_lines:
+        if section_key in line:
+            in_section = True
+            continue
+        elif in_section and f"Section {int(step)}:" in line:
+            break
+        elif in_section and line.strip():
+            if line.strip().startswith(f"{character_name}:"):
+                dialogue = line.split(':', 1)[1].strip()
+                if dialogue.startswith('"') and dialogue.endswith('"'):
+                    dialogue = dialogue[1:-1]
+                section_text.append(dialogue)
+
+    return " ".join(section_text[:5])
+
+
+def time_per_call(func, args_list: List[tuple], iterations: int) -> float:
+    """Average seconds per call, cycling through args_list"""
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(*args_list[i % len(args_list)])
+    return (time.perf_counter() - start) / iterations
+
+
+def bench_agent(script_path: Path, iterations: int) -> Dict[str, float]:
+    script_content = script_path.read_text(encoding='utf-8')
+
+    start = time.perf_counter()
+    index = compile_script(script_content)
+    compile_time = time.perf_counter() - start
+
+    # Warm the sidecar, then time a cold start that reads it back
+    load_script_index(script_path)
+    start = time.perf_counter()
+    load_script_index(script_path)
+    sidecar_time = time.perf_counter() - start
+
+    steps = list(index["steps"]) or ["1"]
+    character = index["primary_speaker"] or ""
+    steps_table = index["steps"]
+
+    legacy = time_per_call(
+        legacy_step_lookup, [(script_content, character, step) for step in steps], iterations
+    )
+    indexed = time_per_call(steps_table.get, [(step,) for step in steps], iterations)
+
+    return {
+        "steps": len(steps),
+        "compile_ms": compile_time * 1000,
+        "sidecar_load_ms": sidecar_time * 1000,
+        "legacy_us": legacy * 1e6,
+        "indexed_us": indexed * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark script step lookup")
+    parser.add_argument(
+        "--iterations", "-n",
+        type=int,
+        default=20000,
+        help="Lookups per agent and approach (default: 20000)"
+    )
+    args = parser.parse_args()
+
+    print(f"{'agent':<16}{'steps':>6}{'compile ms':>12}{'sidecar ms':>12}"
+          f"{'scan µs':>10}{'index µs':>10}{'speedup':>10}")
+    for script_path in sorted(VOICE_AGENT_DIR.glob("*/script.txt")):
+        result = bench_agent(script_path, args.iterations)
+        speedup = result["legacy_us"] / result["indexed_us"] if result["indexed_us"] else float("inf")
+        print(f"{script_path.parent.name:<16}{result['steps']:>6}"
+              f"{result['compile_ms']:>12.3f}{result['sidecar_load_ms']:>12.3f}"
+              f"{result['legacy_us']:>10.2f}{result['indexed_us']:>10.3f}{speedup:>9.0f}x")
+
+    print(f"\nSidecar indexes are written as voice_agent/*/{SIDECAR_NAME}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Benchmark: server startup time and memory as the number of voice agents grows.
+
+Generates N copies of an existing voice agent in a temporary directory and
+starts the server against it in a fresh process per measurement:
+
+    lazy   the voice registry as the server uses it: nothing loaded at
+           import, one agent loaded by the first request
+    eager  every agent loaded and one route registered per agent at startup,
+           the way the server used to start
+
+Also reports the time of the first request and of the / listing (which
+builds the on-disk agent index on first use, then reads it).
+
+Usage:
+    python bench_voice_registry.py
+    python bench_voice_registry.py -n 10 100 1000 5000 --agent villain --json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT = Path(__file__).parent
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / 1e6, 1)
+
+
+def make_agents(template: Path, directory: Path, count: int):
+    for i in range(count):
+        target = directory / f"agent_{i:05d}"
+        target.mkdir(parents=True)
+        for name in ("script.txt", "instructor.txt", "conversation_states.json"):
+            if (template / name).exists():
+                shutil.copy(template / name, target / name)
+
+
+def child(mode: str):
+    """Runs in a fresh process with VOICE_AGENT_DIR set: print one JSON result"""
+    start = time.perf_counter()
+    sys.path.insert(0, str(ROOT))
+    import main
+
+    if mode == "eager":
+        from fastapi.responses import StreamingResponse
+
+        main.AUDIO_CONFIGS.max_loaded = sys.maxsize
+        configs = {name: main.AUDIO_CONFIGS[name] for name in main.AUDIO_CONFIGS}
+        for name in configs:
+            main.app.add_api_route(f"/eager/{name}", main.audio_endpoint, methods=["GET"],
+                                   response_class=StreamingResponse)
+    startup = time.perf_counter() - start
+    startup_rss = rss_mb()
+
+    start = time.perf_counter()
+    main.get_step_content(main.AUDIO_CONFIGS["agent_00000"], "1")
+    first_request = time.perf_counter() - start
+
+    start = time.perf_counter()
+    main.AUDIO_CONFIGS.index_ttl = 0
+    names = main.AUDIO_CONFIGS.names()
+    listing = time.perf_counter() - start
+
+    print(json.dumps({
+        "startup_s": round(startup, 3),
+        "rss_mb": startup_rss,
+        "first_request_ms": round(first_request * 1000, 2),
+        "listing_ms": round(listing * 1000, 1),
+        "agents_listed": len(names),
+        "agents_loaded": main.AUDIO_CONFIGS.loaded(),
+    }))
+
+
+def measure(mode: str, directory: Path, workdir: Path) -> Dict[str, Any]:
+    env = {
+        **os.environ,
+        "VOICE_AGENT_DIR": str(directory),
+        "TTS_BACKEND": "fake",
+        "AUDIO_PREFETCH": "0",
+        "AUDIO_CACHE_DIR": str(workdir / "cache"),
+        "AUDIO_PRERENDER_DIR": str(workdir / "prerender"),
+    }
+    result = subprocess.run(
+        [sys.executable, __file__, "--child", mode],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run(args) -> List[Dict[str, Any]]:
+    template = ROOT / "voice_agent" / args.agent
+    results = []
+    for count in args.agents:
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = Path(tmp) / "voice_agent"
+            make_agents(template, directory, count)
+            # Compile every script index once so both modes start from warm sidecars
+            measure("eager", directory, Path(tmp))
+            (directory / ".voice_index.json").unlink(missing_ok=True)
+            for mode in args.modes:
+                result = {"agents": count, "mode": mode, **measure(mode, directory, Path(tmp))}
+                results.append(result)
+                if not args.json:
+                    print(f"{count:>7}{mode:>7}{result['startup_s']:>11}{result['rss_mb']:>9}"
+                          f"{result['first_request_ms']:>12}{result['listing_ms']:>12}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark startup time and RSS against agent count")
+    parser.add_argument("--agents", "-n", type=int, nargs="+", default=[10, 100, 1000, 3000],
+                        help="Agent counts to generate (default: 10 100 1000 3000)")
+    parser.add_argument("--agent", default="coach_blaze", help="Agent copied as the template (default: coach_blaze)")
+    parser.add_argument("--modes", nargs="+", default=["lazy", "eager"], choices=["lazy", "eager"])
+    parser.add_argument("--json", action="store_true", help="Emit results as JSON")
+    parser.add_argument("--child", choices=["lazy", "eager"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    if not args.json:
+        print(f"{'agents':>7}{'mode':>7}{'startup s':>11}{'RSS MB':>9}{'1st req ms':>12}{'listing ms':>12}")
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
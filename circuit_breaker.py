@@ -0,0 +1,217 @@
+"""
+Circuit breaker around the upstream TTS backend.
+
+Upstream calls are recorded in a rolling window. When enough of them fail
+(rate-limit, server, connection errors or a first byte that never arrives)
+or are slow to start, the breaker opens: new renders are refused at once
+instead of hanging, and the server falls back to audio already on disk.
+While open, a background probe periodically synthesizes a short phrase and
+closes the breaker again once the provider answers promptly.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Callable, Deque, List, Optional, Tuple
+
+import metrics
+from retry import retry_reason
+
+# Breaker configuration
+TTS_BREAKER_ENABLED = os.getenv("TTS_BREAKER", "1").lower() in ("1", "true", "yes")
+TTS_BREAKER_WINDOW = float(os.getenv("TTS_BREAKER_WINDOW", 30))
+TTS_BREAKER_MIN_CALLS = int(os.getenv("TTS_BREAKER_MIN_CALLS", 5))
+TTS_BREAKER_ERROR_RATE = float(os.getenv("TTS_BREAKER_ERROR_RATE", 0.5))
+TTS_BREAKER_SLOW_RATE = float(os.getenv("TTS_BREAKER_SLOW_RATE", 0.5))
+# A call is slow when its first byte takes longer than this
+TTS_BREAKER_SLOW_SECONDS = float(os.getenv("TTS_BREAKER_SLOW_SECONDS", 5))
+# A call fails when its first byte takes longer than this
+TTS_BREAKER_TIMEOUT = float(os.getenv("TTS_BREAKER_TIMEOUT", 15))
+# Seconds between recovery probes while open
+TTS_BREAKER_OPEN_SECONDS = float(os.getenv("TTS_BREAKER_OPEN_SECONDS", 30))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+# Agent/step renderings remembered for fallback
+TRACKED_RENDERS = 4096
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the TTS backend while the breaker is open"""
+
+
+class CircuitBreaker:
+    """Trips on upstream error rate or latency and probes in the background to recover"""
+
+    def __init__(
+        self,
+        probe: Optional[Callable[[], AsyncIterator[bytes]]] = None,
+        enabled: bool = TTS_BREAKER_ENABLED,
+        window: float = TTS_BREAKER_WINDOW,
+        min_calls: int = TTS_BREAKER_MIN_CALLS,
+        error_rate: float = TTS_BREAKER_ERROR_RATE,
+        slow_rate: float = TTS_BREAKER_SLOW_RATE,
+        slow_seconds: float = TTS_BREAKER_SLOW_SECONDS,
+        timeout: float = TTS_BREAKER_TIMEOUT,
+        open_seconds: float = TTS_BREAKER_OPEN_SECONDS,
+    ):
+        self.probe = probe
+        self.enabled = enabled
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self.timeout = timeout
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at: Optional[float] = None
+        self._calls: Deque[Tuple[float, bool, bool]] = deque()
+        self._probe_task: Optional[asyncio.Task] = None
+        metrics.TTS_BREAKER_STATE.labels().set(STATE_VALUES[CLOSED])
+
+    @property
+    def available(self) -> bool:
+        """Whether new upstream renders may be started"""
+        return not self.enabled or self.state == CLOSED
+
+    def _set_state(self, state: str):
+        self.state = state
+        metrics.TTS_BREAKER_STATE.labels().set(STATE_VALUES[state])
+
+    def record(self, ok: bool, slow: bool = False):
+        if not self.enabled or self.state != CLOSED:
+            return
+        now = time.monotonic()
+        self._calls.append((now, ok, slow))
+        while self._calls and self._calls[0][0] < now - self.window:
+            self._calls.popleft()
+
+        total = len(self._calls)
+        if total < self.min_calls:
+            return
+        failures = sum(1 for _, ok, _ in self._calls if not ok)
+        slows = sum(1 for _, _, slow in self._calls if slow)
+        if failures / total >= self.error_rate:
+            self.trip(f"{failures}/{total} upstream calls failed")
+        elif slows / total >= self.slow_rate:
+            self.trip(f"{slows}/{total} upstream calls took over {self.slow_seconds}s to start")
+
+    def trip(self, reason: str):
+        print(f"TTS circuit breaker open: {reason}")
+        self._set_state(OPEN)
+        self.opened_at = time.monotonic()
+        self._calls.clear()
+        metrics.TTS_BREAKER_TRIPS.labels().inc()
+        if self._probe_task is None or self._probe_task.done():
+            self._probe_task = asyncio.get_running_loop().create_task(self._probe_until_recovered())
+
+    def reset(self):
+        if self.state != CLOSED:
+            print("TTS circuit breaker closed: upstream recovered")
+        self._set_state(CLOSED)
+        self.opened_at = None
+        self._calls.clear()
+
+    async def _probe_until_recovered(self):
+        while self.state != CLOSED:
+            await asyncio.sleep(self.open_seconds)
+            if self.probe is None:
+                self.reset()
+                return
+            self._set_state(HALF_OPEN)
+            if await self._probe_once():
+                self.reset()
+                return
+            self._set_state(OPEN)
+
+    async def _probe_once(self) -> bool:
+        source = self.probe()
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(anext(source), self.timeout)
+        except StopAsyncIteration:
+            pass
+        except Exception as e:
+            print(f"TTS circuit breaker probe failed: {e!r}")
+            return False
+        finally:
+            await source.aclose()
+        return time.perf_counter() - start <= self.slow_seconds
+
+    async def guard(self, source: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """Pass an upstream stream through, refusing it while open and recording its outcome"""
+        if not self.available:
+            await source.aclose()
+            raise CircuitOpenError("TTS backend unavailable (circuit breaker open)")
+        if not self.enabled:
+            async for chunk in source:
+                yield chunk
+            return
+
+        start = time.perf_counter()
+        ttfb: Optional[float] = None
+        try:
+            try:
+                chunk = await asyncio.wait_for(anext(source), self.timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"No audio from the TTS backend within {self.timeout}s") from None
+            ttfb = time.perf_counter() - start
+            yield chunk
+            async for chunk in source:
+                yield chunk
+        except StopAsyncIteration:
+            ttfb = time.perf_counter() - start
+        except (asyncio.CancelledError, GeneratorExit):
+            raise
+        except Exception as exc:
+            # Only provider trouble counts; a rejected input says nothing about health
+            if isinstance(exc, TimeoutError) or retry_reason(exc):
+                self.record(False)
+            raise
+        else:
+            self.record(True, slow=ttfb > self.slow_seconds)
+        finally:
+            await source.aclose()
+
+    async def stop(self):
+        if self._probe_task and not self._probe_task.done():
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+
+    def snapshot(self):
+        return {
+            "state": self.state,
+            "enabled": self.enabled,
+            "open_for": round(time.monotonic() - self.opened_at, 1) if self.opened_at else None,
+            "recent_calls": len(self._calls),
+        }
+
+
+class RenderHistory:
+    """Recent content keys rendered for each agent/step, newest first"""
+
+    def __init__(self, limit: int = TRACKED_RENDERS, per_step: int = 4):
+        self.limit = limit
+        self.per_step = per_step
+        self._keys: "OrderedDict[Tuple[str, str], List[str]]" = OrderedDict()
+
+    def remember(self, agent: str, step: str, key: str):
+        keys = self._keys.setdefault((agent, step), [])
+        if key in keys:
+            keys.remove(key)
+        keys.insert(0, key)
+        del keys[self.per_step:]
+        self._keys.move_to_end((agent, step))
+        while len(self._keys) > self.limit:
+            self._keys.popitem(last=False)
+
+    def keys(self, agent: str, step: str) -> List[str]:
+        return list(self._keys.get((agent, step), []))
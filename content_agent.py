@@ -2,16 +2,34 @@
 """
 Content Agent for ACME Onboarding
 Uses OpenAI Agents SDK to process company documents and generate voice agent content.
+
+Two modes (CONTENT_AGENT_MODE in agent_config.py):
+- handoff: the content coordinator hands off to the instructor, script and
+  conversation states agents one after another
+- pipeline: one shared document analysis, then the three artifacts generated
+  concurrently, then a consistency pass that reconciles them before they are
+  written; wall-clock time is close to the longest single stage
+
+With CONTENT_DOC_RETRIEVAL (the default) the handoff agents search an index of
+the source document (doc_index.py) instead of reading all of it on every call.
+Otherwise documents too large for one prompt are read through their knowledge
+digest (doc_digest.py), which is built before the agents run.
 """
 
 import os
 import json
+import time
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
 from agents import Agent, Runner, function_tool
+from pydantic import BaseModel
 import asyncio
 from dotenv import load_dotenv
-from agent_config import MODEL_NAME
+from agent_config import CONTENT_AGENT_MODE, CONTENT_DOC_RETRIEVAL, MODEL_NAME
+from doc_digest import ensure_digest, needs_digest, source_text
+from doc_index import DOC_SEARCH_TOP_K, format_passages, load_document_index
+from llm_cache import run_config
+from script_index import compile_script
 
 # Load environment variables from .env file
 load_dotenv()
@@ -19,29 +37,52 @@ load_dotenv()
 
 @function_tool
 def read_document(file_path: str) -> str:
-    """Read and return the contents of a document."""
+    """Read and return the contents of a document (a digest of very large ones)."""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
+        return source_text(Path(file_path))
     except Exception as e:
         return f"Error reading file: {str(e)}"
 
 
 @function_tool
-def save_agent_content(agent_name: str, content_type: str, content: str) -> str:
-    """Save generated content for a voice agent."""
+def document_outline(file_path: str) -> str:
+    """List the numbered sections of a document, to plan searches."""
+    try:
+        return "\n".join(load_document_index(Path(file_path)).outline())
+    except Exception as e:
+        return f"Error indexing file: {str(e)}"
+
+
+@function_tool
+def search_document(file_path: str, query: str, top_k: int = DOC_SEARCH_TOP_K) -> str:
+    """Return the passages of a document most relevant to a query, with their section headings."""
+    try:
+        results = load_document_index(Path(file_path)).search(query, top_k)
+    except Exception as e:
+        return f"Error searching file: {str(e)}"
+    return format_passages(results) if results else f"No passages match '{query}'. Try other keywords."
+
+
+def write_agent_file(agent_name: str, file_name: str, content: str) -> Path:
+    """Write one voice agent file atomically, so the audio server never reloads half of it"""
     output_dir = Path(f"voice_agent/{agent_name}")
     output_dir.mkdir(parents=True, exist_ok=True)
-    
+    file_path = output_dir / file_name
+    tmp_path = file_path.with_suffix(file_path.suffix + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, file_path)
+    return file_path
+
+
+@function_tool
+def save_agent_content(agent_name: str, content_type: str, content: str) -> str:
+    """Save generated content for a voice agent."""
     # Remove .txt if already in content_type
-    if content_type.endswith('.txt'):
-        file_path = output_dir / content_type
-    else:
-        file_path = output_dir / f"{content_type}.txt"
+    file_name = content_type if content_type.endswith('.txt') else f"{content_type}.txt"
     
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        file_path = write_agent_file(agent_name, file_name, content)
         return f"Successfully saved {content_type} for {agent_name} at {file_path}"
     except Exception as e:
         return f"Error saving file: {str(e)}"
@@ -50,15 +91,10 @@ def save_agent_content(agent_name: str, content_type: str, content: str) -> str:
 @function_tool
 def save_conversation_states(agent_name: str, states: str) -> str:
     """Save conversation states for a voice agent (expects JSON string)."""
-    output_dir = Path(f"voice_agent/{agent_name}")
-    output_dir.mkdir(parents=True, exist_ok=True)
-    
-    file_path = output_dir / "conversation_states.json"
     try:
         # Parse the JSON string to validate it
         parsed_states = json.loads(states)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(parsed_states, f, indent=2)
+        file_path = write_agent_file(agent_name, "conversation_states.json", json.dumps(parsed_states, indent=2))
         return f"Successfully saved conversation states for {agent_name} at {file_path}"
     except json.JSONDecodeError as e:
         return f"Error parsing JSON: {str(e)}"
@@ -140,11 +176,112 @@ content_coordinator = Agent(
 )
 
 
+# Retrieval variants of the handoff agents: same roles, but they search the
+# document's index instead of reading the whole document
+RETRIEVAL_INSTRUCTIONS = """
+    
+    Do not read the whole source document. Call document_outline once to see its sections,
+    then search_document for the passages you need, e.g. "retirement 401k match" or
+    "PTO accrual". Search again with other keywords if a passage is missing a fact."""
+
+retrieval_instructor_agent = instructor_agent.clone(
+    instructions=instructor_agent.instructions + RETRIEVAL_INSTRUCTIONS,
+    tools=[document_outline, search_document, save_agent_content],
+)
+
+retrieval_script_agent = script_agent.clone(
+    instructions=script_agent.instructions + RETRIEVAL_INSTRUCTIONS,
+    tools=[document_outline, search_document, save_agent_content],
+)
+
+retrieval_states_agent = conversation_states_agent.clone(
+    instructions=conversation_states_agent.instructions + RETRIEVAL_INSTRUCTIONS,
+    tools=[document_outline, search_document, save_conversation_states],
+)
+
+retrieval_coordinator = content_coordinator.clone(
+    instructions=content_coordinator.instructions + RETRIEVAL_INSTRUCTIONS,
+    handoffs=[retrieval_instructor_agent, retrieval_script_agent, retrieval_states_agent],
+    tools=[document_outline, search_document],
+)
+
+
+# Pipeline mode: the document and a shared analysis are passed in the prompt,
+# and each agent returns its artifact instead of saving it
+analysis_agent = Agent(
+    name="Document Analyst",
+    model=MODEL_NAME,
+    instructions="""You analyze company documents for voice agent content generation.
+    
+    Produce a brief that every content writer will share:
+    1. Audience and goal of the onboarding session
+    2. How the requested personality should come across for this material
+    3. A numbered outline of 8-12 onboarding sections. For each: a short title and the
+       key facts (numbers, dates, contacts, policies) it must cover, quoted exactly
+    
+    The script sections and conversation states will follow your outline one to one,
+    so make it complete and in a sensible order.""",
+)
+
+PIPELINE_OUTPUT_INSTRUCTIONS = """
+    
+    The source document and a shared analysis with a numbered outline are provided in the
+    prompt; do not read or save files. Return only the complete file content as your final
+    answer, without commentary or code fences."""
+
+pipeline_instructor_agent = instructor_agent.clone(
+    instructions=instructor_agent.instructions + PIPELINE_OUTPUT_INSTRUCTIONS,
+    tools=[],
+)
+
+pipeline_script_agent = script_agent.clone(
+    instructions=script_agent.instructions + PIPELINE_OUTPUT_INSTRUCTIONS
+    + "\n    Use exactly one numbered section per outline entry, numbered like the outline.",
+    tools=[],
+)
+
+pipeline_states_agent = conversation_states_agent.clone(
+    instructions=conversation_states_agent.instructions.split("IMPORTANT:")[0].rstrip()
+    + PIPELINE_OUTPUT_INSTRUCTIONS
+    + "\n    Return a JSON array with one state per outline entry, ids numbered like the outline.",
+    tools=[],
+)
+
+
+class ReconciledContent(BaseModel):
+    """Corrected artifacts from the consistency pass; None means unchanged"""
+    instructor: Optional[str] = None
+    script: Optional[str] = None
+    conversation_states: Optional[str] = None
+    notes: str = ""
+
+
+consistency_agent = Agent(
+    name="Consistency Reviewer",
+    model=MODEL_NAME,
+    instructions="""You reconcile voice agent files that were written in parallel.
+    
+    Check that:
+    - script sections and conversation states match one to one, in the same order
+    - state examples use the script's wording and facts
+    - the script's voice matches the personality in the instructor file
+    - facts agree with the source analysis and with each other
+    - every problem listed under "Detected issues" is resolved
+    
+    Return a corrected version only of the files that need changes, complete and in the
+    original format (conversation_states as a JSON array string). Leave the others empty.
+    Summarize what you changed in notes.""",
+    output_type=ReconciledContent,
+)
+
+
 async def create_voice_agent_content(
     source_document: str,
     agent_name: str,
-    agent_personality: str
-) -> Dict[str, str]:
+    agent_personality: str,
+    mode: str = CONTENT_AGENT_MODE,
+    retrieval: bool = CONTENT_DOC_RETRIEVAL
+) -> Dict[str, Any]:
     """
     Create complete voice agent content from a source document.
     
@@ -152,17 +289,28 @@ async def create_voice_agent_content(
         source_document: Path to the source document
         agent_name: Name for the voice agent (used for folder name)
         agent_personality: Description of the agent's personality
+        mode: "handoff" (coordinator with handoffs) or "pipeline" (concurrent stages)
+        retrieval: In handoff mode, search the document instead of reading it whole
     
     Returns:
         Dictionary with paths to created files
     """
+    # Retrieval agents search the full text, so only the others read a digest
+    if (mode == "pipeline" or not retrieval) and needs_digest(Path(source_document)):
+        await ensure_digest(Path(source_document))
+    
+    if mode == "pipeline":
+        return await create_voice_agent_content_pipeline(source_document, agent_name, agent_personality)
+    if mode != "handoff":
+        raise ValueError(f"Unknown content agent mode '{mode}', expected 'handoff' or 'pipeline'")
+    
     prompt = f"""
     Create voice agent content for "{agent_name}" based on the document at {source_document}.
     
     Agent personality: {agent_personality}
     
     Please:
-    1. Read and analyze the source document
+    1. {"Search the source document for the information each file needs" if retrieval else "Read and analyze the source document"}
     2. Create instructor.txt with personality and tone instructions
     3. Create script.txt with a complete dialogue script
     4. Create conversation_states.json with structured conversation flow
@@ -170,8 +318,175 @@ async def create_voice_agent_content(
     Ensure all content is consistent with the personality and covers key information from the source.
     """
     
-    result = await Runner.run(content_coordinator, input=prompt)
-    return {"status": "completed", "agent": agent_name, "output": result.final_output}
+    coordinator = retrieval_coordinator if retrieval else content_coordinator
+    result = await Runner.run(coordinator, input=prompt, run_config=run_config())
+    usage = result.context_wrapper.usage
+    return {
+        "status": "completed",
+        "agent": agent_name,
+        "output": result.final_output,
+        "usage": {"requests": usage.requests, "input_tokens": usage.input_tokens, "output_tokens": usage.output_tokens},
+    }
+
+
+def _strip_code_fence(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return text.strip()
+
+
+def parse_states(states_json: str) -> Tuple[Optional[List[Any]], List[str]]:
+    """
+    Parse generated conversation states and find the problems that keep the
+    audio server from following them: entries that are not objects, missing
+    fields, and transitions that are malformed or lead to unknown states.
+
+    Returns the parsed states (None if they are not a JSON array) and the issues.
+    """
+    try:
+        states = json.loads(states_json)
+    except json.JSONDecodeError as e:
+        return None, [f"conversation_states is not valid JSON: {e}"]
+    if not isinstance(states, list):
+        return None, ["conversation_states must be a JSON array of states"]
+    
+    issues = []
+    ids = [str(state.get("id", "")) for state in states if isinstance(state, dict)]
+    for number, state in enumerate(states, 1):
+        if not isinstance(state, dict):
+            issues.append(f"State #{number} is not an object")
+            continue
+        name = state.get("id", f"#{number}")
+        missing = [field for field in ("id", "description", "examples", "transitions") if field not in state]
+        if missing:
+            issues.append(f"State {name} is missing {', '.join(missing)}")
+        transitions = state.get("transitions") or []
+        if not isinstance(transitions, list):
+            issues.append(f"State {name} transitions must be an array")
+            continue
+        for transition in transitions:
+            if not isinstance(transition, dict):
+                issues.append(f"State {name} has a transition that is not an object")
+            elif transition.get("next_step") not in ids:
+                issues.append(f"State {name} transitions to unknown state {transition.get('next_step')}")
+    return states, issues
+
+
+def check_consistency(script: str, states_json: str) -> List[str]:
+    """Structural problems between a script and its conversation states"""
+    states, issues = parse_states(states_json)
+    if states is None:
+        return issues
+    
+    ids = [str(state.get("id", "")) for state in states if isinstance(state, dict)]
+    numbers = [state_id.split("_")[0] for state_id in ids]
+    if numbers != [str(n) for n in range(1, len(numbers) + 1)]:
+        issues.append(f"State ids should be numbered 1..{len(numbers)} in order, got {', '.join(ids)}")
+    
+    # The audio server serves step N from the Nth script section
+    sections = compile_script(script)["steps"]
+    if len(sections) != len(states):
+        issues.append(f"Script has {len(sections)} sections with dialogue but there are {len(states)} states")
+    return issues
+
+
+async def _run_stage(agent: Agent, prompt: str, timings: Dict[str, float], stage: str) -> str:
+    start = time.perf_counter()
+    result = await Runner.run(agent, input=prompt, run_config=run_config())
+    timings[stage] = round(time.perf_counter() - start, 2)
+    return _strip_code_fence(str(result.final_output))
+
+
+async def create_voice_agent_content_pipeline(
+    source_document: str,
+    agent_name: str,
+    agent_personality: str
+) -> Dict[str, Any]:
+    """
+    Create voice agent content with one shared analysis and concurrent generation.
+    
+    The instructor, script and conversation states are generated at the same
+    time from the same analysis, then reconciled by a consistency pass before
+    any file is written.
+    """
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+    document = source_text(Path(source_document))
+    
+    analysis = await _run_stage(
+        analysis_agent,
+        f"Agent personality: {agent_personality}\n\nSource document ({source_document}):\n{document}",
+        timings, "analysis",
+    )
+    
+    context = f"""Voice agent: {agent_name}
+Agent personality: {agent_personality}
+
+Shared analysis:
+{analysis}
+
+Source document ({source_document}):
+{document}"""
+    instructor, script, states = await asyncio.gather(
+        _run_stage(pipeline_instructor_agent, f"Write instructor.txt.\n\n{context}", timings, "instructor"),
+        _run_stage(pipeline_script_agent, f"Write script.txt.\n\n{context}", timings, "script"),
+        _run_stage(pipeline_states_agent, f"Write conversation_states.json.\n\n{context}", timings, "conversation_states"),
+    )
+    
+    issues = check_consistency(script, states)
+    review_start = time.perf_counter()
+    review = await Runner.run(consistency_agent, run_config=run_config(), input=f"""Shared analysis:
+{analysis}
+
+Detected issues:
+{chr(10).join(f"- {issue}" for issue in issues) or "- none"}
+
+instructor.txt:
+{instructor}
+
+script.txt:
+{script}
+
+conversation_states.json:
+{states}""")
+    timings["consistency"] = round(time.perf_counter() - review_start, 2)
+    reconciled = review.final_output_as(ReconciledContent)
+    instructor = _strip_code_fence(reconciled.instructor) if reconciled.instructor else instructor
+    script = _strip_code_fence(reconciled.script) if reconciled.script else script
+    states = _strip_code_fence(reconciled.conversation_states) if reconciled.conversation_states else states
+    
+    remaining = check_consistency(script, states)
+    parsed_states, structural = parse_states(states)
+    if parsed_states is None or structural:
+        # Never publish states the server cannot follow
+        timings["total"] = round(time.perf_counter() - start, 2)
+        print(f"❌ {agent_name}: conversation states still malformed after reconciliation, nothing written")
+        return {
+            "status": "failed",
+            "agent": agent_name,
+            "mode": "pipeline",
+            "timings": timings,
+            "issues": remaining,
+            "output": reconciled.notes,
+        }
+    
+    write_agent_file(agent_name, "instructor.txt", instructor)
+    write_agent_file(agent_name, "conversation_states.json", json.dumps(parsed_states, indent=2))
+    write_agent_file(agent_name, "script.txt", script)
+    timings["total"] = round(time.perf_counter() - start, 2)
+    
+    return {
+        # Published, but the script and states may not line up step for step
+        "status": "completed_with_issues" if remaining else "completed",
+        "agent": agent_name,
+        "mode": "pipeline",
+        "timings": timings,
+        "issues": remaining,
+        "output": reconciled.notes,
+    }
 
 
 async def main():
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Map-reduce ingestion of large source documents into a knowledge digest.
+
+Handbooks and policy binders that run to hundreds of pages do not fit in one
+prompt. Documents above DIGEST_THRESHOLD_TOKENS are condensed instead:
+
+- map: the file is read line by line into token-bounded chunks, ending at
+  section headings or paragraph breaks where possible, and each chunk is
+  summarized into topics with their key facts (numbers, dates, contacts,
+  policies quoted exactly); DIGEST_CONCURRENCY chunks at a time
+- reduce: notes are merged in document order as they arrive, whenever
+  enough have accumulated, and merged notes are merged again, so the
+  result is a compact digest of at most DIGEST_MAX_TOPICS topics
+
+Only the chunks being summarized and the pending notes are held in memory,
+so memory use stays flat however large the file is. Model calls go through
+the LLM cache, so an interrupted ingestion resumes where it stopped.
+
+The digest is stored next to the document as a sidecar file and rebuilt
+whenever the document's modification time or size changes. The content and
+game agents use it in place of the full text of large documents.
+
+Usage:
+    python doc_digest.py ACME_docs/Policy_Binder.txt
+    python doc_digest.py ACME_docs/Policy_Binder.txt --force -c 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from agents import Agent, Runner
+from pydantic import BaseModel
+
+from agent_config import MODEL_NAME
+from doc_index import HEADING_PATTERN, RULE_PATTERN
+from llm_cache import run_config
+
+# Digest configuration
+DIGEST_MODEL = os.getenv("DIGEST_MODEL", MODEL_NAME)
+# Documents estimated above this size are read through their digest
+DIGEST_THRESHOLD_TOKENS = int(os.getenv("DIGEST_THRESHOLD_TOKENS", 24000))
+DIGEST_CHUNK_TOKENS = int(os.getenv("DIGEST_CHUNK_TOKENS", 3000))
+# Pending notes are merged once they add up to this many tokens
+DIGEST_REDUCE_TOKENS = int(os.getenv("DIGEST_REDUCE_TOKENS", 6000))
+DIGEST_CONCURRENCY = int(os.getenv("DIGEST_CONCURRENCY", 4))
+DIGEST_MAX_TOPICS = int(os.getenv("DIGEST_MAX_TOPICS", 12))
+
+# Bump when the digest layout or prompts change so stale sidecars are rebuilt
+DIGEST_VERSION = 1
+
+# Rough size of a token in English prose
+CHARS_PER_TOKEN = 4
+
+
+def approx_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class DigestTopic(BaseModel):
+    title: str
+    summary: str
+    facts: List[str]
+
+
+class DigestNotes(BaseModel):
+    """Topics of one chunk, or of several merged chunks, in document order"""
+    topics: List[DigestTopic]
+
+
+chunk_notes_agent = Agent(
+    name="Chunk Summarizer",
+    model=DIGEST_MODEL,
+    instructions="""You condense one part of a long company document for onboarding content writers.
+
+    Return the topics this part covers, in order. For each topic:
+    - title: short, e.g. "401(k) Retirement Plan"
+    - summary: two or three sentences on what a new employee needs to know
+    - facts: the specific details, quoted exactly: numbers, amounts, dates, deadlines,
+      eligibility rules, contacts, and the section number they come from
+
+    Skip boilerplate such as tables of contents, signature blocks and legal notices.
+    A part may start or end mid-section; summarize only what it contains.""",
+    output_type=DigestNotes,
+)
+
+notes_reducer_agent = Agent(
+    name="Digest Reducer",
+    model=DIGEST_MODEL,
+    instructions=f"""You merge notes taken from consecutive parts of a long company document.
+
+    Combine topics that cover the same subject, keep them in document order, and return at
+    most {DIGEST_MAX_TOPICS} topics; fold minor topics into related ones rather than dropping
+    their facts. Keep facts exactly as written and remove only exact duplicates. Summaries
+    stay two or three sentences.""",
+    output_type=DigestNotes,
+)
+
+
+def _is_rule(line: str) -> bool:
+    return bool(RULE_PATTERN.match(line))
+
+
+def iter_chunks(document_path: Path, max_tokens: int = DIGEST_CHUNK_TOKENS) -> Iterator[Dict[str, Any]]:
+    """
+    Stream a document as chunks of at most max_tokens (estimated).
+
+    A chunk that is at least half full ends before a top-level section
+    heading, and a full one at its last paragraph break. Each chunk carries
+    the heading of the section it starts in.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    lines: List[str] = []
+    size = 0
+    last_break = 0
+    heading: Optional[str] = None
+    chunk_heading: Optional[str] = None
+    previous = ""
+    index = 0
+
+    def take(count: int) -> Optional[Dict[str, Any]]:
+        """Cut the first count lines off as the next chunk (None if blank)"""
+        nonlocal lines, size, last_break, chunk_heading, index
+        text = "\n".join(lines[:count]).strip()
+        chunk = {"index": index, "heading": chunk_heading, "text": text} if text else None
+        lines = lines[count:]
+        size = sum(len(line) + 1 for line in lines)
+        last_break = 0
+        chunk_heading = heading
+        if chunk:
+            index += 1
+        return chunk
+
+    with open(document_path, 'r', encoding='utf-8', errors='replace') as f:
+        for raw_line in f:
+            line = raw_line.rstrip()
+            stripped = line.strip()
+
+            # Headings are recognized as in doc_index: numbered, next to a rule or in capitals
+            match = HEADING_PATTERN.match(stripped)
+            top_level = bool(match and (_is_rule(previous) or match.group(2).isupper()))
+            if _is_rule(stripped) and HEADING_PATTERN.match(previous):
+                heading = previous
+            elif top_level:
+                heading = stripped
+                if size > max_chars // 2:
+                    chunk = take(len(lines))
+                    if chunk:
+                        yield chunk
+            if not stripped and lines:
+                last_break = len(lines)
+            previous = stripped
+
+            # A single line longer than a chunk is cut into chunks of its own
+            while len(line) > max_chars:
+                chunk = take(len(lines))
+                if chunk:
+                    yield chunk
+                lines.append(line[:max_chars])
+                chunk = take(1)
+                if chunk:
+                    yield chunk
+                line = line[max_chars:]
+            lines.append(line)
+            size += len(line) + 1
+            while size > max_chars:
+                # End at the last paragraph break unless that leaves a tiny chunk;
+                # what is left is a single line, which fits
+                cut = last_break if last_break * 2 > len(lines) else len(lines) - 1
+                chunk = take(max(1, cut))
+                if chunk:
+                    yield chunk
+
+    chunk = take(len(lines))
+    if chunk:
+        yield chunk
+
+
+def render_notes(notes: DigestNotes) -> str:
+    """Notes as numbered plain text, the format of the digest and of reduce prompts"""
+    parts = []
+    for number, topic in enumerate(notes.topics, 1):
+        facts = "".join(f"\n• {fact}" for fact in topic.facts)
+        parts.append(f"{number}. {topic.title}\n{topic.summary}{facts}")
+    return "\n\n".join(parts)
+
+
+async def _run_notes(agent: Agent, prompt: str, semaphore: asyncio.Semaphore) -> DigestNotes:
+    async with semaphore:
+        result = await Runner.run(agent, input=prompt, run_config=run_config())
+    return result.final_output_as(DigestNotes)
+
+
+class _Reducer:
+    """Merges notes in document order as they arrive, keeping only a few pending"""
+
+    def __init__(self, semaphore: asyncio.Semaphore, budget: int):
+        self.semaphore = semaphore
+        self.budget = budget
+        # levels[n] holds notes merged n times; higher levels cover earlier text
+        self.levels: List[List[DigestNotes]] = []
+        self.reductions = 0
+
+    async def _merge(self, group: List[DigestNotes]) -> DigestNotes:
+        self.reductions += 1
+        prompt = "\n\n".join(f"Notes {i}:\n{render_notes(notes)}" for i, notes in enumerate(group, 1))
+        return await _run_notes(notes_reducer_agent, prompt, self.semaphore)
+
+    async def add(self, notes: DigestNotes, level: int = 0):
+        if level == len(self.levels):
+            self.levels.append([])
+        pending = self.levels[level]
+        pending.append(notes)
+        if len(pending) > 1 and sum(approx_tokens(render_notes(n)) for n in pending) > self.budget:
+            self.levels[level] = []
+            await self.add(await self._merge(pending), level + 1)
+
+    async def finish(self) -> DigestNotes:
+        remaining = [notes for level in reversed(self.levels) for notes in level]
+        if not remaining:
+            return DigestNotes(topics=[])
+        # Every group has at least two notes (a lone last one is carried over),
+        # so each pass shrinks the list
+        while len(remaining) > 1:
+            merged: List[DigestNotes] = []
+            group: List[DigestNotes] = []
+            group_tokens = 0
+            for notes in remaining:
+                tokens = approx_tokens(render_notes(notes))
+                if len(group) > 1 and group_tokens + tokens > self.budget:
+                    merged.append(await self._merge(group))
+                    group, group_tokens = [], 0
+                group.append(notes)
+                group_tokens += tokens
+            merged.append(await self._merge(group) if len(group) > 1 else group[0])
+            remaining = merged
+
+        # One more merge to compact the topics; a reply that still has too many
+        # is cut, since asking again returns the same (cached) reply
+        notes = remaining[0]
+        if len(notes.topics) > DIGEST_MAX_TOPICS:
+            notes = await self._merge([notes])
+        return DigestNotes(topics=notes.topics[:DIGEST_MAX_TOPICS])
+
+
+async def build_digest(
+    document_path: Path,
+    chunk_tokens: int = DIGEST_CHUNK_TOKENS,
+    concurrency: int = DIGEST_CONCURRENCY,
+    reduce_tokens: int = DIGEST_REDUCE_TOKENS,
+) -> Dict[str, Any]:
+    """Map-reduce a document into a digest of topics with their key facts"""
+    start = time.perf_counter()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    # Chunks read ahead of the oldest one not yet reduced
+    window = asyncio.Semaphore(max(1, concurrency) * 2)
+    reducer = _Reducer(semaphore, reduce_tokens)
+    finished: Dict[int, DigestNotes] = {}
+    drain_lock = asyncio.Lock()
+    next_index = 0
+    chunks = 0
+
+    async def drain():
+        nonlocal next_index
+        async with drain_lock:
+            while next_index in finished:
+                await reducer.add(finished.pop(next_index))
+                next_index += 1
+                window.release()
+
+    async def map_chunk(chunk: Dict[str, Any]):
+        context = f"continuing section {chunk['heading']}" if chunk["heading"] else "from the start"
+        finished[chunk["index"]] = await _run_notes(
+            chunk_notes_agent,
+            f"Part {chunk['index'] + 1} of {document_path.name}, {context}:\n\n{chunk['text']}",
+            semaphore,
+        )
+        await drain()
+
+    source_tokens = 0
+    async with asyncio.TaskGroup() as group:
+        for chunk in iter_chunks(document_path, chunk_tokens):
+            await window.acquire()
+            chunks += 1
+            source_tokens += approx_tokens(chunk["text"])
+            group.create_task(map_chunk(chunk))
+    map_seconds = round(time.perf_counter() - start, 2)
+
+    notes = await reducer.finish()
+    stat = document_path.stat()
+    return {
+        "version": DIGEST_VERSION,
+        "source": {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size},
+        "model": DIGEST_MODEL,
+        "chunks": chunks,
+        "source_tokens": source_tokens,
+        "digest_tokens": approx_tokens(render_notes(notes)),
+        "reductions": reducer.reductions,
+        "timings": {"map": map_seconds, "total": round(time.perf_counter() - start, 2)},
+        "topics": [topic.model_dump() for topic in notes.topics],
+    }
+
+
+def needs_digest(document_path: Path) -> bool:
+    """Whether a document is too large to pass whole, judged by its size on disk"""
+    return Path(document_path).stat().st_size > DIGEST_THRESHOLD_TOKENS * CHARS_PER_TOKEN
+
+
+def sidecar_path(document_path: Path) -> Path:
+    return document_path.parent / f".{document_path.name}.digest.json"
+
+
+def load_digest(document_path: Path) -> Optional[Dict[str, Any]]:
+    """The stored digest of a document, or None if missing or stale"""
+    document_path = Path(document_path)
+    stat = document_path.stat()
+    try:
+        with open(sidecar_path(document_path), 'r', encoding='utf-8') as f:
+            digest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    source = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    if digest.get("version") != DIGEST_VERSION or digest.get("source") != source or digest.get("model") != DIGEST_MODEL:
+        return None
+    return digest
+
+
+# Digests being built, by resolved document path, so concurrent builds of
+# agents that share a document run one ingestion
+_builds: Dict[str, "asyncio.Task[Dict[str, Any]]"] = {}
+
+
+async def ensure_digest(document_path: Path, force: bool = False, **options: Any) -> Dict[str, Any]:
+    """Load a document's digest, building and storing it if needed"""
+    document_path = Path(document_path)
+    digest = None if force else load_digest(document_path)
+    if digest is not None:
+        return digest
+
+    key = str(document_path.resolve())
+    build = _builds.get(key)
+    if build is None:
+        build = asyncio.create_task(_build_and_store(document_path, **options))
+        _builds[key] = build
+        build.add_done_callback(lambda _: _builds.pop(key, None) if _builds.get(key) is build else None)
+    # One caller giving up does not cancel the build for the others
+    return await asyncio.shield(build)
+
+
+async def _build_and_store(document_path: Path, **options: Any) -> Dict[str, Any]:
+    print(f"📚 Digesting {document_path} ({document_path.stat().st_size // 1024} KB)...")
+    digest = await build_digest(document_path, **options)
+    sidecar = sidecar_path(document_path)
+    try:
+        tmp_path = sidecar.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(digest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, sidecar)
+    except OSError as e:
+        # Usable for this run; the next one rebuilds it from the LLM cache
+        print(f"Could not write digest for {document_path}: {e}")
+    print(f"📚 {digest['chunks']} chunks, ~{digest['source_tokens']} tokens condensed to "
+          f"~{digest['digest_tokens']} in {digest['timings']['total']}s")
+    return digest
+
+
+def digest_notes(digest: Dict[str, Any]) -> DigestNotes:
+    return DigestNotes.model_validate({"topics": digest["topics"]})
+
+
+def render_digest(document_path: Path, digest: Dict[str, Any]) -> str:
+    """A digest as prompt text"""
+    return (f"KNOWLEDGE DIGEST of {Path(document_path).name}: {digest['chunks']} parts, "
+            f"~{digest['source_tokens']} tokens condensed. Facts are quoted from the original.\n\n"
+            + render_notes(digest_notes(digest)))
+
+
+def digest_sections(digest: Dict[str, Any]) -> Dict[str, str]:
+    """Digest topics as {title: content}, one per game scene or script section"""
+    return {
+        topic.title: render_notes(DigestNotes(topics=[topic])).split("\n", 1)[1]
+        for topic in digest_notes(digest).topics
+    }
+
+
+def source_text(document_path: Path) -> str:
+    """What agents read for a document: the full text, or the digest of a large one"""
+    document_path = Path(document_path)
+    if not needs_digest(document_path):
+        with open(document_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    digest = load_digest(document_path)
+    if digest is None:
+        raise ValueError(f"{document_path} is too large to read whole; run: python doc_digest.py {document_path}")
+    return render_digest(document_path, digest)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Condense a large document into a knowledge digest")
+    parser.add_argument("document", help="Path to the source document")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if a current digest exists")
+    parser.add_argument("--concurrency", "-c", type=int, default=DIGEST_CONCURRENCY,
+                        help=f"Chunks summarized at once (default: {DIGEST_CONCURRENCY})")
+    parser.add_argument("--chunk-tokens", type=int, default=DIGEST_CHUNK_TOKENS,
+                        help=f"Tokens per chunk (default: {DIGEST_CHUNK_TOKENS})")
+    parser.add_argument("--print", action="store_true", dest="show", help="Print the digest")
+    args = parser.parse_args()
+
+    document_path = Path(args.document)
+    digest = asyncio.run(ensure_digest(
+        document_path, force=args.force, concurrency=args.concurrency, chunk_tokens=args.chunk_tokens
+    ))
+    try:
+        import resource
+        # ru_maxrss is in bytes on macOS and kilobytes on Linux
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 if sys.platform == "darwin" else 1)
+        peak = f", peak memory {peak_kb / 1024:.0f} MB"
+    except ImportError:
+        # Not available on Windows
+        peak = ""
+    print(f"✅ {len(digest['topics'])} topics, {digest['reductions']} merges{peak}: {sidecar_path(document_path)}")
+    if args.show:
+        print("\n" + render_digest(document_path, digest))
+
+
+if __name__ == "__main__":
+    main()
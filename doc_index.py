@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Offline retrieval index over source documents (ACME_docs).
+
+Documents are split into passages at their numbered section headings (one
+passage per subsection such as "3.2 Health and Wellness Benefits", long
+sections split further at paragraph breaks) and indexed for BM25 ranking.
+Agents search the index for the passages they need instead of reading the
+whole document on every tool call.
+
+The file is read line by line and the index stores each passage's byte
+range rather than its text, so neither building nor searching holds the
+whole document in memory. The index is stored next to the document as a
+sidecar file and rebuilt whenever the document's modification time or size
+changes.
+
+Recognized section headings (a numbered line directly below a rule, directly
+above one, after Markdown #s, or in capitals):
+    ==========================
+    3. COMPENSATION AND BENEFITS
+    ==========================
+    3.2 Health and Wellness Benefits
+    ---------------------------
+
+Usage:
+    python doc_index.py ACME_docs                       # Build indexes
+    python doc_index.py ACME_docs/ACME_Employee_Handbook.txt -q "401k match"
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Retrieval configuration
+DOC_SEARCH_TOP_K = int(os.getenv("DOC_SEARCH_TOP_K", 2))
+# Sections longer than this are split at paragraph breaks
+DOC_CHUNK_MAX_CHARS = int(os.getenv("DOC_CHUNK_MAX_CHARS", 1500))
+
+# Bump when the index layout changes so stale sidecars are rebuilt
+INDEX_VERSION = 2
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Heading words count this many times, so a section's title outranks a passing mention
+HEADING_WEIGHT = 3
+
+HEADING_PATTERN = re.compile(r"^(?:#+\s*)?(\d+(?:\.\d+)*)\.?\s+(\S.*?)\s*$")
+RULE_PATTERN = re.compile(r"^[─━=\-_*]{3,}$")
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+STOPWORDS = frozenset("""
+a an and are as at be by can do for from has have how i in is it its may of on or our
+that the their this to we what when where which who will with you your
+""".split())
+PLURAL_ES = ("sses", "shes", "ches", "xes", "zes")
+
+
+def _singular(token: str) -> str:
+    if len(token) <= 4 or not token.endswith("s") or token.endswith(("ss", "us", "is")):
+        return token
+    if token.endswith("ies"):
+        return token[:-3] + "y"
+    if token.endswith(PLURAL_ES):
+        return token[:-2]
+    return token[:-1]
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased terms with stopwords dropped and plurals folded"""
+    return [_singular(token) for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def _is_heading(line: str, before: str, after: str, match: re.Match) -> bool:
+    if line.startswith("#"):
+        return True
+    title = match.group(2)
+    return bool(RULE_PATTERN.match(before) or RULE_PATTERN.match(after)) or (
+        title.isupper() and len(title) < 80
+    )
+
+
+def _read_lines(document_path: Path) -> Iterator[Tuple[int, int, int, str]]:
+    """(start offset, end offset, line number, stripped text) of each line"""
+    with open(document_path, 'rb') as f:
+        offset = 0
+        for number, raw in enumerate(f, 1):
+            yield offset, offset + len(raw), number, raw.decode('utf-8', errors='replace').strip()
+            offset += len(raw)
+
+
+def iter_passages(document_path: Path, max_chars: int = DOC_CHUNK_MAX_CHARS) -> Iterator[Dict[str, Any]]:
+    """
+    Stream a document's passages, split at its numbered section headings.
+
+    Sections longer than max_chars are split at paragraph breaks (or between
+    lines when a paragraph is too long). Each passage records the byte range
+    of its text in the file and its text, for indexing.
+    """
+    titles: Dict[str, str] = {}
+    section: Optional[str] = None
+    heading = "Front matter"
+    heading_line = 1
+    part = 1
+    # (start, end, text) of the lines of the passage being read
+    body: List[Tuple[int, int, str]] = []
+    size = 0
+    last_break = 0
+
+    def emit(count: int) -> Optional[Dict[str, Any]]:
+        """Cut the first count lines off as a passage (None if blank)"""
+        nonlocal body, size, last_break, part
+        lines, body = body[:count], body[count:]
+        size = sum(len(text) + 1 for _, _, text in body)
+        last_break = 0
+        text = "\n".join(text for _, _, text in lines).strip()
+        if not text:
+            return None
+        passage = {
+            "section": section,
+            "heading": heading if part == 1 else f"{heading} (part {part})",
+            "line": heading_line,
+            "start": lines[0][0],
+            "end": lines[-1][1],
+            "text": text,
+        }
+        part += 1
+        return passage
+
+    def process(line: Tuple[int, int, int, str], before: str, after: str) -> Iterator[Dict[str, Any]]:
+        nonlocal section, heading, heading_line, part, size, last_break
+        start, end, number, text = line
+        match = HEADING_PATTERN.match(text)
+        if match and _is_heading(text, before, after, match):
+            passage = emit(len(body))
+            if passage:
+                yield passage
+            section = match.group(1)
+            titles[section] = f"{section} {match.group(2)}"
+            # "3.2 Health..." is found under "3 COMPENSATION AND BENEFITS"
+            parents = [titles[prefix] for prefix in _prefixes(section) if prefix in titles]
+            heading = " > ".join(parents + [titles[section]])
+            heading_line = number
+            part = 1
+            return
+        if RULE_PATTERN.match(text):
+            return
+        if not text:
+            if body:
+                last_break = len(body)
+            return
+        if body and size + len(text) > max_chars:
+            passage = emit(last_break if last_break else len(body))
+            if passage:
+                yield passage
+        body.append((start, end, text))
+        size += len(text) + 1
+
+    previous = ""
+    pending: Optional[Tuple[int, int, int, str]] = None
+    for line in _read_lines(document_path):
+        if pending is not None:
+            yield from process(pending, previous, line[3])
+            previous = pending[3]
+        pending = line
+    if pending is not None:
+        yield from process(pending, previous, "")
+    passage = emit(len(body))
+    if passage:
+        yield passage
+
+
+def _prefixes(number: str) -> List[str]:
+    parts = number.split(".")
+    return [".".join(parts[:n]) for n in range(1, len(parts))]
+
+
+def build_index(document_path: Path, max_chars: int = DOC_CHUNK_MAX_CHARS) -> Dict[str, Any]:
+    """Stream a document's passages and record each one's term frequencies"""
+    chunks = []
+    for passage in iter_passages(document_path, max_chars):
+        terms = Counter(tokenize(passage.pop("text")))
+        for term in tokenize(passage["heading"]):
+            terms[term] += HEADING_WEIGHT
+        passage["id"] = len(chunks)
+        passage["terms"] = dict(terms)
+        passage["length"] = sum(terms.values())
+        chunks.append(passage)
+    return {"version": INDEX_VERSION, "chunks": chunks}
+
+
+class DocumentIndex:
+    """BM25 search over one document's passages"""
+
+    def __init__(self, index: Dict[str, Any], document_path: Path):
+        self.document_path = document_path
+        self.chunks: List[Dict[str, Any]] = index["chunks"]
+        self.average_length = (
+            sum(chunk["length"] for chunk in self.chunks) / len(self.chunks) if self.chunks else 0.0
+        )
+        document_frequency: Counter = Counter()
+        for chunk in self.chunks:
+            document_frequency.update(chunk["terms"].keys())
+        count = len(self.chunks)
+        self.idf = {
+            term: math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def search(self, query: str, top_k: int = DOC_SEARCH_TOP_K) -> List[Dict[str, Any]]:
+        """The top_k passages for a query, best first, each with its score"""
+        terms = [term for term in set(tokenize(query)) if term in self.idf]
+        scored = []
+        for chunk in self.chunks:
+            score = 0.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * chunk["length"] / self.average_length)
+            for term in terms:
+                frequency = chunk["terms"].get(term)
+                if frequency:
+                    score += self.idf[term] * frequency * (BM25_K1 + 1) / (frequency + norm)
+            if score > 0:
+                scored.append((score, chunk["id"]))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [
+            {**self.chunks[chunk_id], "text": self.passage_text(self.chunks[chunk_id]), "score": round(score, 3)}
+            for score, chunk_id in scored[:max(1, top_k)]
+        ]
+
+    def passage_text(self, chunk: Dict[str, Any]) -> str:
+        """A passage's text, read from the document"""
+        with open(self.document_path, 'rb') as f:
+            f.seek(chunk["start"])
+            data = f.read(chunk["end"] - chunk["start"])
+        lines = data.decode('utf-8', errors='replace').split("\n")
+        return "\n".join(line.rstrip() for line in lines if not RULE_PATTERN.match(line.strip())).strip()
+
+    def outline(self) -> List[str]:
+        """Passage headings in document order"""
+        return [chunk["heading"] for chunk in self.chunks]
+
+
+def sidecar_path(document_path: Path) -> Path:
+    return document_path.parent / f".{document_path.name}.index.json"
+
+
+# Loaded indexes by document path, with the source they were built from
+_loaded: Dict[str, Any] = {}
+
+
+def load_document_index(document_path: Path) -> DocumentIndex:
+    """Load the index for a document, rebuilding the sidecar if stale"""
+    document_path = Path(document_path)
+    stat = document_path.stat()
+    source = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+    cached = _loaded.get(str(document_path))
+    if cached is not None and cached[0] == source:
+        return cached[1]
+
+    sidecar = sidecar_path(document_path)
+    index: Optional[Dict[str, Any]] = None
+    try:
+        with open(sidecar, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get("version") != INDEX_VERSION or index.get("source") != source:
+            index = None
+    except (OSError, ValueError):
+        pass
+
+    if index is None:
+        index = build_index(document_path)
+        index["source"] = source
+        try:
+            tmp_path = sidecar.with_suffix(".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False)
+            os.replace(tmp_path, sidecar)
+        except OSError as e:
+            # Still searchable, the index is just rebuilt by the next process
+            print(f"Could not write document index for {document_path}: {e}")
+
+    document_index = DocumentIndex(index, document_path)
+    _loaded[str(document_path)] = (source, document_index)
+    return document_index
+
+
+def format_passages(results: List[Dict[str, Any]]) -> str:
+    """Passages as tool output, each headed by its section"""
+    return "\n\n".join(f"[{result['heading']}]\n{result['text']}" for result in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query document retrieval indexes")
+    parser.add_argument("paths", nargs="+", help="Documents, or directories of .txt/.md documents")
+    parser.add_argument("--query", "-q", help="Print the best passages for a query")
+    parser.add_argument("--top-k", "-k", type=int, default=DOC_SEARCH_TOP_K,
+                        help=f"Passages returned per query (default: {DOC_SEARCH_TOP_K})")
+    args = parser.parse_args()
+
+    documents: List[Path] = []
+    for path in map(Path, args.paths):
+        if path.is_dir():
+            documents.extend(sorted(p for p in path.iterdir() if p.suffix in (".txt", ".md")))
+        else:
+            documents.append(path)
+
+    for document in documents:
+        index = load_document_index(document)
+        print(f"📚 {document}: {len(index.chunks)} passages, {len(index.idf)} terms")
+        if args.query:
+            for result in index.search(args.query, args.top_k):
+                print(f"\n  {result['score']:>7.3f}  {result['heading']} (line {result['line']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -23,6 +23,9 @@ export default class WelcomeScene extends Phaser.Scene {
     // Play Coach Blaze's greeting audio (step 1)
     this.playCoachAudio(1);
 
+    // Preload the rest of Coach Blaze's flow over one connection while the greeting plays
+    audioManager.preloadBundle('http://localhost:8000', 'coach_blaze');
+
     // Coach Blaze sprite
     this.coachBlaze = this.add.sprite(width - 200, height - 180, 'coach');
     
@@ -1,19 +1,68 @@
+interface BundleStep {
+  step: string;
+  url: string;
+  file: string;
+  available: boolean;
+}
+
+interface BundleManifest {
+  media_type: string;
+  steps: BundleStep[];
+}
+
 // Global audio manager to ensure only one audio plays at a time
 class AudioManager {
   private currentAudio: HTMLAudioElement | null = null;
   private currentUrl: string | null = null;
+  // Step audio preloaded from agent bundles, keyed by step URL
+  private preloaded = new Map<string, Blob>();
+
+  // Download every rendered step of an agent in one request (a tar archive)
+  async preloadBundle(baseUrl: string, agentName: string): Promise<number> {
+    try {
+      const response = await fetch(`${baseUrl}/bundle/${agentName}`);
+      if (!response.ok) {
+        throw new Error(`Failed to fetch audio bundle: ${response.status}`);
+      }
+
+      const files = parseTar(new Uint8Array(await response.arrayBuffer()));
+      const manifestFile = files.get('manifest.json');
+      if (!manifestFile) {
+        throw new Error('Audio bundle has no manifest');
+      }
+      const manifest: BundleManifest = JSON.parse(new TextDecoder().decode(manifestFile));
+
+      let count = 0;
+      for (const step of manifest.steps) {
+        const data = files.get(step.file);
+        if (step.available && data) {
+          this.preloaded.set(`${baseUrl}${step.url}`, new Blob([data], { type: manifest.media_type }));
+          count++;
+        }
+      }
+      return count;
+
+    } catch (error) {
+      // Steps that were not preloaded are still fetched on demand
+      console.error('Error preloading audio bundle:', error);
+      return 0;
+    }
+  }
 
   async playAudio(url: string): Promise<HTMLAudioElement> {
     // Stop any currently playing audio
     this.stopCurrent();
 
     try {
-      const response = await fetch(url);
-      if (!response.ok) {
-        throw new Error(`Failed to fetch audio: ${response.status}`);
+      let audioBlob = this.preloaded.get(url);
+      if (!audioBlob) {
+        const response = await fetch(url);
+        if (!response.ok) {
+          throw new Error(`Failed to fetch audio: ${response.status}`);
+        }
+        audioBlob = await response.blob();
       }
 
-      const audioBlob = await response.blob();
       const audioUrl = URL.createObjectURL(audioBlob);
       const audio = new Audio(audioUrl);
 
@@ -68,5 +117,31 @@ class AudioManager {
   }
 }
 
+// Minimal ustar reader: 512-byte headers, each followed by padded file data
+function parseTar(data: Uint8Array): Map<string, Uint8Array> {
+  const files = new Map<string, Uint8Array>();
+  const decoder = new TextDecoder();
+  // Header fields are NUL-terminated
+  const field = (bytes: Uint8Array) => {
+    const text = decoder.decode(bytes);
+    const end = text.indexOf('\0');
+    return end === -1 ? text : text.slice(0, end);
+  };
+  let offset = 0;
+
+  while (offset + 512 <= data.length) {
+    const header = data.subarray(offset, offset + 512);
+    const name = field(header.subarray(0, 100));
+    if (!name) {
+      break;
+    }
+    const size = parseInt(field(header.subarray(124, 136)).trim(), 8) || 0;
+    files.set(name, data.subarray(offset + 512, offset + 512 + size));
+    offset += 512 + Math.ceil(size / 512) * 512;
+  }
+
+  return files;
+}
+
 // Export singleton instance
 export const audioManager = new AudioManager();
\ No newline at end of file
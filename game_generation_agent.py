@@ -12,21 +12,13 @@ from openai import AsyncOpenAI
 from datetime import datetime
 import logging
 
+from llm_cache import llm_cache
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class GameGenerationAgent:
-    """Agent that generates Phaser.js game scenes based on onboarding content"""
-    
-    def __init__(self, model: str = "o3"):
-        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.model = model
-        self.agent = None
-        
-    async def create_agent(self):
-        """Create the game generation assistant"""
-        instructions = """You are a game development expert specializing in creating educational games for employee onboarding.
+ASSISTANT_INSTRUCTIONS = """You are a game development expert specializing in creating educational games for employee onboarding.
         
 Your role is to:
 1. Analyze onboarding content and transform it into engaging game mechanics
@@ -50,19 +42,50 @@ Game Design Principles:
 - Add challenges that test understanding
 - Reward progress with points and achievements
 """
+
+ASSISTANT_TOOLS = [
+    {"type": "code_interpreter"},
+    {"type": "file_retrieval"}
+]
+
+
+class GameGenerationAgent:
+    """Agent that generates Phaser.js game scenes based on onboarding content"""
+    
+    def __init__(self, model: str = "o3", fallback_model: Optional[str] = None):
+        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.model = model
+        self.fallback_model = fallback_model
+        self.agent = None
+        self.instructions = ASSISTANT_INSTRUCTIONS
+        self.tools = ASSISTANT_TOOLS
         
-        self.agent = await self.client.beta.assistants.create(
+    async def create_agent(self):
+        """Create the game generation assistant
+        
+        Called on the first prompt that is not in the LLM cache, so fully
+        cached runs never create one. An unavailable o3 model switches to
+        fallback_model when one is set.
+        """
+        try:
+            self.agent = await self._create_assistant()
+        except Exception as e:
+            if not ("o3" in str(e) and self.model == "o3" and self.fallback_model):
+                raise
+            print(f"⚠️  Model {self.model} not available. Trying fallback...")
+            self.model = self.fallback_model
+            self.agent = await self._create_assistant()
+        logger.info(f"Created game generation assistant with ID: {self.agent.id}")
+        return self.agent
+    
+    async def _create_assistant(self):
+        return await self.client.beta.assistants.create(
             model=self.model,
-            instructions=instructions,
+            instructions=self.instructions,
             name="Game Generation Agent",
             description="Generates Phaser.js game scenes for employee onboarding",
-            tools=[
-                {"type": "code_interpreter"},
-                {"type": "file_retrieval"}
-            ]
+            tools=self.tools
         )
-        logger.info(f"Created game generation assistant with ID: {self.agent.id}")
-        return self.agent
     
     async def generate_game_scene(
         self,
@@ -73,8 +96,6 @@ Game Design Principles:
     ) -> Dict[str, Any]:
         """Generate a complete game scene based on onboarding content"""
         
-        thread = await self.client.beta.threads.create()
-        
         prompt = f"""Generate a Phaser.js game scene for employee onboarding.
 
 Scene Name: {scene_name}
@@ -100,34 +121,7 @@ Generate:
 4. Learning objectives mapping
 """
         
-        message = await self.client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=prompt
-        )
-        
-        # Run the assistant
-        run = await self.client.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=self.agent.id
-        )
-        
-        # Wait for completion
-        while run.status in ["queued", "in_progress", "requires_action"]:
-            await asyncio.sleep(1)
-            run = await self.client.beta.threads.runs.retrieve(
-                thread_id=thread.id,
-                run_id=run.id
-            )
-        
-        # Get the response
-        messages = await self.client.beta.threads.messages.list(
-            thread_id=thread.id,
-            order="desc",
-            limit=1
-        )
-        
-        response = messages.data[0].content[0].text.value
+        response = await self._ask_assistant(prompt)
         
         # Parse the response to extract code and metadata
         result = self._parse_scene_response(response)
@@ -144,8 +138,6 @@ Generate:
     ) -> Dict[str, Any]:
         """Generate game configuration and setup files"""
         
-        thread = await self.client.threads.create()
-        
         prompt = f"""Generate Phaser.js game configuration for an onboarding game.
 
 Game Title: {game_title}
@@ -167,32 +159,7 @@ Ensure the configuration:
 - Includes error handling
 """
         
-        message = await self.client.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=prompt
-        )
-        
-        run = await self.client.threads.runs.create(
-            thread_id=thread.id,
-            agent_id=self.agent.id
-        )
-        
-        # Wait for completion
-        while run.status in ["queued", "in_progress", "requires_action"]:
-            await asyncio.sleep(1)
-            run = await self.client.threads.runs.retrieve(
-                thread_id=thread.id,
-                run_id=run.id
-            )
-        
-        messages = await self.client.threads.messages.list(
-            thread_id=thread.id,
-            order="desc",
-            limit=1
-        )
-        
-        response = messages.data[0].content[0].text.value
+        response = await self._ask_assistant(prompt)
         return self._parse_config_response(response)
     
     async def generate_mini_game(
@@ -203,8 +170,6 @@ Ensure the configuration:
     ) -> Dict[str, Any]:
         """Generate a mini-game for specific concepts"""
         
-        thread = await self.client.threads.create()
-        
         prompt = f"""Create a mini-game to teach an onboarding concept.
 
 Concept: {concept}
@@ -225,31 +190,7 @@ Generate:
 5. Accessibility considerations
 """
         
-        message = await self.client.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=prompt
-        )
-        
-        run = await self.client.threads.runs.create(
-            thread_id=thread.id,
-            agent_id=self.agent.id
-        )
-        
-        while run.status in ["queued", "in_progress", "requires_action"]:
-            await asyncio.sleep(1)
-            run = await self.client.threads.runs.retrieve(
-                thread_id=thread.id,
-                run_id=run.id
-            )
-        
-        messages = await self.client.threads.messages.list(
-            thread_id=thread.id,
-            order="desc",
-            limit=1
-        )
-        
-        response = messages.data[0].content[0].text.value
+        response = await self._ask_assistant(prompt)
         return self._parse_mini_game_response(response)
     
     async def enhance_existing_scene(
@@ -260,8 +201,6 @@ Generate:
     ) -> Dict[str, Any]:
         """Enhance an existing game scene with new features"""
         
-        thread = await self.client.threads.create()
-        
         prompt = f"""Enhance an existing Phaser.js game scene.
 
 Current Scene Code:
@@ -286,32 +225,61 @@ Generate:
 4. Performance impact assessment
 """
         
-        message = await self.client.threads.messages.create(
+        response = await self._ask_assistant(prompt)
+        return self._parse_enhancement_response(response)
+    
+    async def _ask_assistant(self, prompt: str) -> str:
+        """Run one prompt on the assistant in a new thread and return its reply
+        
+        Replies are cached by model, instructions, tools and prompt, so
+        re-running a generation with unchanged inputs skips the API.
+        """
+        cache_parts = {"model": self.model, "instructions": self.instructions, "tools": self.tools, "prompt": prompt}
+        cached = llm_cache.get_text("assistants", **cache_parts)
+        if cached is not None:
+            return cached
+        
+        if self.agent is None:
+            await self.create_agent()
+            if self.model != cache_parts["model"]:
+                # Switched to the fallback model, whose replies may be cached
+                cache_parts["model"] = self.model
+                cached = llm_cache.get_text("assistants", **cache_parts)
+                if cached is not None:
+                    return cached
+        
+        thread = await self.client.beta.threads.create()
+        await self.client.beta.threads.messages.create(
             thread_id=thread.id,
             role="user",
             content=prompt
         )
         
-        run = await self.client.threads.runs.create(
+        # Run the assistant
+        run = await self.client.beta.threads.runs.create(
             thread_id=thread.id,
-            agent_id=self.agent.id
+            assistant_id=self.agent.id
         )
         
+        # Wait for completion
         while run.status in ["queued", "in_progress", "requires_action"]:
             await asyncio.sleep(1)
-            run = await self.client.threads.runs.retrieve(
+            run = await self.client.beta.threads.runs.retrieve(
                 thread_id=thread.id,
                 run_id=run.id
             )
         
-        messages = await self.client.threads.messages.list(
+        # Get the response
+        messages = await self.client.beta.threads.messages.list(
             thread_id=thread.id,
             order="desc",
             limit=1
         )
         
         response = messages.data[0].content[0].text.value
-        return self._parse_enhancement_response(response)
+        if run.status == "completed":
+            llm_cache.put_text(response, "assistants", **cache_parts)
+        return response
     
     def _parse_scene_response(self, response: str) -> Dict[str, Any]:
         """Parse the agent's response to extract scene code and metadata"""
@@ -461,7 +429,6 @@ Generate:
 async def generate_benefits_level():
     """Example: Generate a benefits-themed level"""
     agent = GameGenerationAgent(model="gpt-4o")  # Use gpt-4o until o3 is available
-    await agent.create_agent()
     
     onboarding_content = """
     Benefits Information:
@@ -485,7 +452,6 @@ async def generate_benefits_level():
 async def generate_security_mini_game():
     """Example: Generate a security training mini-game"""
     agent = GameGenerationAgent(model="gpt-4o")
-    await agent.create_agent()
     
     result = await agent.generate_mini_game(
         concept="Password Security - Create strong passwords and enable 2FA",
@@ -12,6 +12,7 @@ from openai import AsyncOpenAI
 from datetime import datetime
 import logging
 from dotenv import load_dotenv
+from llm_cache import cached_chat_completion
 
 # Load environment variables
 load_dotenv()
@@ -92,7 +93,8 @@ Explain how the game works
 """
         
         try:
-            response = await self.client.chat.completions.create(
+            response = await cached_chat_completion(
+                self.client,
                 model=self.model,
                 messages=[
                     {"role": "system", "content": self.system_prompt},
@@ -150,7 +152,8 @@ How to integrate with the main game
 """
         
         try:
-            response = await self.client.chat.completions.create(
+            response = await cached_chat_completion(
+                self.client,
                 model=self.model,
                 messages=[
                     {"role": "system", "content": self.system_prompt},
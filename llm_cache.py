@@ -0,0 +1,265 @@
+"""
+Disk-backed cache of LLM responses for the content and game agents.
+
+Responses are keyed by a hash of everything that determines them: model,
+system instructions, prompt (the full input, including earlier turns and
+tool results), tool schemas, output schema and sampling settings. Re-running
+a generation with unchanged inputs then costs nothing and returns in
+seconds, which makes iterating on parsers and file writers cheap. Entries
+expire after LLM_CACHE_TTL seconds and the directory is bounded by size,
+least recently used first.
+
+Three entry points:
+- cached_chat_completion(client, **kwargs) for chat.completions.create
+- run_config() for Runner.run (wraps the Agents SDK model provider)
+- get_text() / put_text() for anything else that produces text
+
+LLM_CACHE=0 bypasses the cache; LLM_CACHE=refresh skips reads but stores
+fresh responses, to regenerate without clearing the cache.
+"""
+
+import dataclasses
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# Cache configuration
+LLM_CACHE_MODE = os.getenv("LLM_CACHE", "1").lower()
+LLM_CACHE_DIR = Path(os.getenv("LLM_CACHE_DIR", Path(__file__).parent / ".llm_cache"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Bump when the stored layout changes so old entries are ignored
+CACHE_VERSION = 1
+
+
+def _jsonable(value: Any) -> Any:
+    """A stable JSON form of request parts (no object addresses in reprs)"""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return {field.name: _jsonable(getattr(value, field.name)) for field in dataclasses.fields(value)}
+    if isinstance(value, dict):
+        return {str(key): _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return type(value).__name__
+
+
+def cache_key(namespace: str, **parts: Any) -> str:
+    payload = json.dumps({"namespace": namespace, "version": CACHE_VERSION, **_jsonable(parts)},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """Size- and age-bounded directory of JSON responses, one file per key"""
+
+    def __init__(
+        self,
+        directory: Path = LLM_CACHE_DIR,
+        ttl: float = LLM_CACHE_TTL,
+        max_bytes: int = LLM_CACHE_MAX_BYTES,
+        mode: str = LLM_CACHE_MODE,
+    ):
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.read = mode in ("1", "true", "yes")
+        self.write = self.read or mode == "refresh"
+        self.hits = 0
+        self.misses = 0
+        self._total_bytes: Optional[int] = None
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.read:
+            return None
+        path = self.directory / f"{key}.json"
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if time.time() - entry.get("created", 0) > self.ttl:
+            path.unlink(missing_ok=True)
+            self.misses += 1
+            return None
+        # Reads refresh the modification time that eviction orders by
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry["value"]
+
+    def put(self, key: str, value: Any):
+        if not self.write:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        data = json.dumps({"created": time.time(), "value": value}, ensure_ascii=False)
+        path = self.directory / f"{key}.json"
+        tmp_path = self.directory / f"{key}.{uuid.uuid4().hex}.part"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        if self._total_bytes is None:
+            self._total_bytes = self._scan_bytes()
+        else:
+            self._total_bytes += len(data.encode("utf-8"))
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def _scan_bytes(self) -> int:
+        return sum(path.stat().st_size for path in self.directory.glob("*.json"))
+
+    def _evict(self):
+        """Drop expired entries, then least recently used ones, until under the limit"""
+        now = time.time()
+        files = []
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files:
+            if total <= self.max_bytes and now - mtime <= self.ttl:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
+        self._total_bytes = total
+
+    def get_text(self, namespace: str, **parts: Any) -> Optional[str]:
+        return self.get(cache_key(namespace, **parts))
+
+    def put_text(self, text: str, namespace: str, **parts: Any):
+        self.put(cache_key(namespace, **parts), text)
+
+    def disable(self):
+        """Bypass the cache for the rest of the process (e.g. --no-llm-cache)"""
+        self.read = self.write = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"hits": self.hits, "misses": self.misses, "read": self.read, "write": self.write}
+
+
+# Shared by every agent in the process
+llm_cache = LLMCache()
+
+
+async def cached_chat_completion(client, **kwargs):
+    """chat.completions.create, answered from the cache when the request repeats"""
+    from openai.types.chat import ChatCompletion
+
+    key = cache_key("chat.completions", **kwargs)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return ChatCompletion.model_validate(cached)
+    response = await client.chat.completions.create(**kwargs)
+    llm_cache.put(key, response.model_dump(mode="json"))
+    return response
+
+
+def _tool_schema(tool: Any) -> Dict[str, Any]:
+    # Function tools and handoffs expose their schema under different names
+    return {
+        "name": getattr(tool, "name", None) or getattr(tool, "tool_name", None) or type(tool).__name__,
+        "description": getattr(tool, "description", None) or getattr(tool, "tool_description", None),
+        "parameters": getattr(tool, "params_json_schema", None) or getattr(tool, "input_json_schema", None),
+    }
+
+
+def _output_schema(output_schema: Any) -> Any:
+    if output_schema is None:
+        return None
+    try:
+        return output_schema.json_schema()
+    except Exception:
+        # Plain-text output has no schema
+        return output_schema.name() if hasattr(output_schema, "name") else None
+
+
+def run_config():
+    """RunConfig for Runner.run that caches every model turn, or None when bypassed"""
+    if not llm_cache.read and not llm_cache.write:
+        return None
+    from agents import RunConfig
+    return RunConfig(model_provider=CachingModelProvider())
+
+
+try:
+    from agents.models.interface import Model, ModelProvider
+except ImportError:
+    # The Agents SDK is only needed by the content agent
+    Model = ModelProvider = object
+
+
+class CachingModel(Model):
+    """Agents SDK model that answers repeated turns from the LLM cache
+
+    Only complete responses are cached; streamed runs pass straight through.
+    A cached turn reports zero usage, since nothing was spent on it.
+    """
+
+    def __init__(self, model: Any, model_name: str):
+        self.model = model
+        self.model_name = model_name
+
+    async def get_response(self, system_instructions, input, model_settings, tools, output_schema,
+                           handoffs, *args, **kwargs):
+        from agents.items import ModelResponse
+        from agents.usage import Usage
+        from openai.types.responses import ResponseOutputItem
+        from pydantic import TypeAdapter
+
+        key = cache_key(
+            "agents.model",
+            model=self.model_name,
+            system_instructions=system_instructions,
+            input=input,
+            model_settings=model_settings,
+            tools=[_tool_schema(tool) for tool in tools],
+            output_schema=_output_schema(output_schema),
+            handoffs=[_tool_schema(handoff) for handoff in handoffs],
+            previous_response_id=kwargs.get("previous_response_id"),
+        )
+        cached = llm_cache.get(key)
+        adapter = TypeAdapter(ResponseOutputItem)
+        if cached is not None:
+            return ModelResponse(
+                output=[adapter.validate_python(item) for item in cached["output"]],
+                usage=Usage(),
+                response_id=None,
+            )
+
+        response = await self.model.get_response(
+            system_instructions, input, model_settings, tools, output_schema, handoffs, *args, **kwargs
+        )
+        llm_cache.put(key, {"output": [adapter.dump_python(item, mode="json") for item in response.output]})
+        return response
+
+    def stream_response(self, *args, **kwargs):
+        return self.model.stream_response(*args, **kwargs)
+
+
+class CachingModelProvider(ModelProvider):
+    """Wraps the default OpenAI provider's models in CachingModel"""
+
+    def __init__(self, provider: Any = None):
+        if provider is None:
+            from agents.models.openai_provider import OpenAIProvider
+            provider = OpenAIProvider()
+        self.provider = provider
+
+    def get_model(self, model_name):
+        return CachingModel(self.provider.get_model(model_name), model_name or "default")
@@ -1,35 +1,98 @@
 import asyncio
-from typing import Dict, Any, Optional
-from fastapi import FastAPI, Response, HTTPException, Query
-from fastapi.responses import StreamingResponse
-from openai import AsyncOpenAI
+from typing import Dict, Any, List, Optional, Tuple
+from fastapi import FastAPI, Response, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 import os
 import subprocess
 from pathlib import Path
 import json
 
 from io import BytesIO
+import hmac
+
+from audio_cache import AudioCache, content_key
+from audio_bundle import (ArchiveResponse, archive_size, bundle_etag, close_members, file_duration, open_members,
+                          opened_manifest)
+from audio_http import MEDIA_TYPES, cached_audio_response, etag_matches, negotiate_format
+from circuit_breaker import CircuitBreaker, RenderHistory
+import metrics
+from metrics import instrument_upstream, track_stream
+from prefetch import PREFETCH_DEPTH, PREFETCH_ENABLED, Prefetcher, next_steps
+from prerender import PrerenderStore, prerender_all, step_ids
+import profiling
+from profiling import LoopLagMonitor, Profiler, ProfilingMiddleware
+from script_index import SLOT_PATTERN, strip_slots
+from singleflight import SingleFlight
+from tts_backends import create_backend
+from tts_limiter import BACKGROUND, FOREGROUND, TTSLimiter
+from tts_pipeline import pipelined_stream
+from tts_segments import AUDIO_SEGMENTS, segmented_stream
+from tts_slots import (AUDIO_SLOT_CACHE_DIR, AUDIO_SLOT_CACHE_MAX_BYTES, fill_slots, slot_values,
+                       spliced_stream, template_lines)
+from voice_registry import VOICE_AGENT_WATCH, VoiceRegistry
 
 app = FastAPI()
-openai = AsyncOpenAI()
 
-# Base directory for voice agents
-VOICE_AGENT_DIR = Path(__file__).parent / "voice_agent"
+# TTS model used for every rendering (part of the audio cache key)
+TTS_MODEL = "gpt-4o-mini-tts"
 
-def load_voice_configs() -> Dict[str, Dict[str, Any]]:
-    """Load voice configurations from voice_agent directories"""
-    configs = {}
-    
-    # Keep the original coach config as default
-    configs["coach"] = {
-        "default_input": """Alright, team, let's bring the energy—time to move, sweat, and feel amazing!
+# Selected with TTS_BACKEND: "openai", or "fake" for offline testing
+tts_backend = create_backend(TTS_MODEL)
+
+# Bounds concurrent upstream renders and retries rate-limited ones
+tts_limiter = TTSLimiter()
+
+# Stops calling the TTS backend while it is failing; probes with a short phrase
+tts_breaker = CircuitBreaker(
+    probe=lambda: tts_backend.stream(
+        {"voice": "coral", "input": "Hello!", "instructions": "Friendly."}, response_format="mp3"
+    ),
+)
+
+# Recent renders per agent/step, served while the breaker is open
+render_history = RenderHistory()
+
+# Persistent cache of rendered audio, shared by all new hires
+audio_cache = AudioCache()
+
+# Identical concurrent requests share one upstream render
+inflight = SingleFlight(audio_cache)
+
+# Names and other per-hire slot values, spliced into cached template audio
+slot_cache = AudioCache(AUDIO_SLOT_CACHE_DIR, AUDIO_SLOT_CACHE_MAX_BYTES)
+slot_inflight = SingleFlight(slot_cache)
+
+# Audio rendered ahead of time by prerender.py (or the startup warmup)
+prerendered = PrerenderStore()
+
+# Background synthesis of the steps a client is likely to request next
+prefetcher = Prefetcher(
+    inflight,
+    is_available=lambda key, ext: bool((ext == "mp3" and prerendered.get(key)) or audio_cache.get(key, ext)),
+)
+
+# On-demand sampling profiler, toggled through /admin/profile
+profiler = Profiler()
+
+# Event-loop lag, always measured (exported as a metric)
+loop_lag = LoopLagMonitor(profiler)
+
+# Bearer token for the /admin endpoints; they are disabled when unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Set to render every agent/step in the background when the server starts
+PRERENDER_ON_STARTUP = os.getenv("AUDIO_PRERENDER_ON_STARTUP", "").lower() in ("1", "true", "yes")
+
+# Keep the original coach config as default
+COACH_CONFIG = {
+    "default_input": """Alright, team, let's bring the energy—time to move, sweat, and feel amazing!
 
 We're starting with a dynamic warm-up, so roll those shoulders, stretch it out, and get that body ready! Now, into our first round—squats, lunges, and high knees—keep that core tight, push through, you got this!
 
 Halfway there, stay strong—breathe, focus, and keep that momentum going! Last ten seconds, give me everything you've got!
 
 And… done! Take a deep breath, shake it out—you crushed it! Stay hydrated, stay moving, and I'll see you next time!""",
-        "instructions": """Voice: High-energy, upbeat, and encouraging, projecting enthusiasm and motivation.
+    "instructions": """Voice: High-energy, upbeat, and encouraging, projecting enthusiasm and motivation.
 
 Punctuation: Short, punchy sentences with strategic pauses to maintain excitement and clarity.
 
@@ -38,106 +101,54 @@ Delivery: Fast-paced and dynamic, with rising intonation to build momentum and k
 Phrasing: Action-oriented and direct, using motivational cues to push participants forward.
 
 Tone: Positive, energetic, and empowering, creating an atmosphere of encouragement and achievement.""",
-        "voice": "coral",
-        "states": None
-    }
-    
-    # Load configurations from voice_agent directories
-    if VOICE_AGENT_DIR.exists():
-        for dir_path in VOICE_AGENT_DIR.iterdir():
-            if dir_path.is_dir():
-                script_path = dir_path / "script.txt"
-                instructor_path = dir_path / "instructor.txt"
-                
-                conversation_states_path = dir_path / "conversation_states.json"
-                
-                if script_path.exists() and instructor_path.exists():
-                    try:
-                        # Read conversation states if available
-                        states = None
-                        if conversation_states_path.exists():
-                            with open(conversation_states_path, 'r') as f:
-                                states = json.load(f)
-                        
-                        # Read the full script content for parsing
-                        with open(script_path, 'r') as f:
-                            script_content = f.read()
-                            
-                        # Extract intro dialogue for default
-                        lines = script_content.split('\n')
-                        input_text = []
-                        for i, line in enumerate(lines):
-                            if line.strip().startswith(('Coach Blaze:', 'Dr. Red Tape:')):
-                                dialogue = line.split(':', 1)[1].strip()
-                                if dialogue.startswith('"') and dialogue.endswith('"'):
-                                    dialogue = dialogue[1:-1]
-                                input_text.append(dialogue)
-                                # Just get first few lines for default
-                                if len(input_text) >= 3:
-                                    break
-                            
-                        # Read instructor file for voice instructions
-                        with open(instructor_path, 'r') as f:
-                            instructions = f.read()
-                        
-                        # Determine voice based on character
-                        voice = "coral" if "coach" in dir_path.name.lower() else "onyx"
-                        
-                        configs[dir_path.name] = {
-                            "default_input": ' '.join(input_text[:3]) if input_text else "Welcome to ACME Corporation!",
-                            "instructions": instructions,
-                            "voice": voice,
-                            "states": states,
-                            "script_content": script_content
-                        }
-                    except Exception as e:
-                        print(f"Error loading config for {dir_path.name}: {e}")
-    
-    return configs
+    "voice": "coral",
+    "states": None
+}
 
-# Load audio configurations
-AUDIO_CONFIGS = load_voice_configs()
+# Voice agents from voice_agent/ are loaded on first request (see voice_registry.py)
+AUDIO_CONFIGS = VoiceRegistry(builtins={"coach": COACH_CONFIG})
 
 
 def get_step_content(config: Dict[str, Any], step: Optional[str] = None) -> Dict[str, str]:
+    """Get content for a specific step, without placeholders (see without_slots)"""
+    return without_slots(find_step_content(config, step))
+
+
+def without_slots(content: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Step content as every hire hears it: placeholders such as <Name> are
+    removed from the rendered text, and the original lines are kept as
+    template_lines for personalized renders.
+    """
+    lines = content.get("lines") or [content["input"]]
+    if not any(SLOT_PATTERN.search(line) for line in [content["input"], *lines]):
+        return content
+    stripped = {**content, "input": strip_slots(content["input"]), "template_lines": lines}
+    if content.get("lines"):
+        stripped["lines"] = [strip_slots(line) for line in lines]
+    return stripped
+
+
+def find_step_content(config: Dict[str, Any], step: Optional[str] = None) -> Dict[str, str]:
     """Get content for a specific step from conversation states"""
     if not step:
-        return {
-            "input": config["default_input"],
-            "instructions": config["instructions"],
-            "voice": config["voice"]
-        }
+        return default_content(config)
     
-    # Try to extract from script content based on section number
-    if config.get("script_content"):
-        script_lines = config["script_content"].split('\n')
-        section_key = f"Section {int(step) - 1}:"  # Convert step to 0-based section
-        
-        # Find the section
-        in_section = False
-        section_text = []
-        character_name = "Coach Blaze" if "coach" in config.get("voice", "") else "Dr. Red Tape"
-        
-        for i, line in enumerate(script_lines):
-            if section_key in line:
-                in_section = True
-                continue
-            elif in_section and f"Section {int(step)}:" in line:
-                break
-            elif in_section and line.strip():
-                # Extract dialogue from this character
-                if line.strip().startswith(f"{character_name}:"):
-                    dialogue = line.split(':', 1)[1].strip()
-                    if dialogue.startswith('"') and dialogue.endswith('"'):
-                        dialogue = dialogue[1:-1]
-                    section_text.append(dialogue)
-        
-        if section_text:
-            return {
-                "input": " ".join(section_text[:5]),  # Use first 5 dialogue lines
+    # Step N is the Nth section of the compiled script
+    if config.get("script_index"):
+        script_input = config["script_index"]["steps"].get(step)
+        if script_input:
+            content = {
+                "input": script_input,
                 "instructions": config["instructions"],
-                "voice": config["voice"]
+                "voice": config["voice"],
+                "lines": config["script_index"]["step_lines"][step],
             }
+            # The lines after the hire's answer, with their placeholders
+            template = config["script_index"].get("step_templates", {}).get(step)
+            if template:
+                content["template_lines"] = template
+            return content
     
     # Fallback to conversation states
     if config.get("states"):
@@ -152,103 +163,504 @@ def get_step_content(config: Dict[str, Any], step: Optional[str] = None) -> Dict
                 return {
                     "input": input_text,
                     "instructions": config["instructions"],
-                    "voice": config["voice"]
+                    "voice": config["voice"],
+                    "lines": [state["description"], *(state.get("examples") or [])],
                 }
     
     # If step not found, return default
-    return {
+    return default_content(config)
+
+
+def default_content(config: Dict[str, Any]) -> Dict[str, str]:
+    """The agent's default clip, with its script lines when it has a script"""
+    content = {
         "input": config["default_input"],
         "instructions": config["instructions"],
         "voice": config["voice"]
     }
+    script_index = config.get("script_index")
+    if script_index and script_index["default_lines"]:
+        content["lines"] = script_index["default_lines"]
+    return content
+
+
+async def generate_audio_stream(config: Dict[str, str], priority: int = FOREGROUND, response_format: str = "mp3"):
+    """Generate audio stream from the configured TTS backend"""
+    source = lambda: tts_breaker.guard(tts_backend.stream(config, response_format=response_format))
+    async for chunk in tts_limiter.stream(source, config["voice"], priority):
+        profiling.mark("upstream_first_byte")
+        yield chunk
 
 
-async def generate_audio_stream(config: Dict[str, str]):
-    """Generate audio stream from OpenAI TTS API"""
-    async with openai.audio.speech.with_streaming_response.create(
-        model="gpt-4o-mini-tts",
-        voice=config["voice"],
-        input=config["input"],
-        instructions=config["instructions"],
-        response_format="mp3",  # Using mp3 for web compatibility
-    ) as response:
-        async for chunk in response.iter_bytes():
-            yield chunk
+def render_stream(step_config: Dict[str, Any], ext: str = "mp3", priority: int = FOREGROUND, pipeline: bool = False):
+    """Upstream audio for a step: from cached line segments, sentence-pipelined, or in one call"""
+    synthesize = lambda chunk_config: generate_audio_stream(chunk_config, priority=priority)
+    # Both join MP3 frames, so they only apply to mp3
+    if AUDIO_SEGMENTS and ext == "mp3":
+        return segmented_stream(step_config, synthesize, inflight, tts_backend.model_id)
+    if pipeline and ext == "mp3":
+        return pipelined_stream(step_config, synthesize)
+    return generate_audio_stream(step_config, priority=priority, response_format=ext)
 
 
 @app.get("/")
 async def root():
     """Root endpoint"""
     endpoints = {}
-    for name, config in AUDIO_CONFIGS.items():
+    # Listed from the agent index so no scripts are loaded
+    for name in AUDIO_CONFIGS.names():
         endpoint_info = {"url": f"/{name}"}
-        if config.get("states"):
-            # Extract just the numbers from step IDs
-            step_numbers = []
-            for state in config["states"]:
-                step_num = state["id"].split("_")[0]
-                step_numbers.append(step_num)
-            endpoint_info["available_steps"] = step_numbers
+        summary = AUDIO_CONFIGS.summary(name)
+        if summary and summary["steps"]:
+            endpoint_info["available_steps"] = summary["steps"]
         endpoints[name] = endpoint_info
     
     return {
         "message": "Audio API Server", 
         "endpoints": endpoints,
-        "usage": "Add ?step=<number> to select a specific conversation state (e.g., ?step=1, ?step=2)"
+        "usage": "Add ?step=<number> to select a specific conversation state (e.g., ?step=1, ?step=2). "
+                 "Add &pipeline=true to stream long steps sentence by sentence for faster first audio. "
+                 "Add &name=<name> to personalize steps whose script mentions <Name>"
     }
 
 
 @app.get("/debug/{agent_name}")
 async def debug_agent(agent_name: str, step: Optional[str] = Query(None)):
     """Debug endpoint to see what content would be generated"""
-    if agent_name not in AUDIO_CONFIGS:
+    config = AUDIO_CONFIGS.get(agent_name)
+    if config is None:
         raise HTTPException(status_code=404, detail=f"Voice agent '{agent_name}' not found")
     
-    config = AUDIO_CONFIGS[agent_name]
     step_config = get_step_content(config, step)
     
     return {
         "agent": agent_name,
         "step": step,
-        "has_script": bool(config.get("script_content")),
+        "has_script": bool(config.get("script_index")),
         "has_states": bool(config.get("states")),
         "content_preview": step_config["input"][:200] + "..." if len(step_config["input"]) > 200 else step_config["input"],
         "voice": step_config["voice"]
     }
 
 
-# Create dynamic endpoints for each voice agent
-def create_audio_endpoint(agent_name: str):
-    async def audio_endpoint(step: Optional[str] = Query(None, description="Conversation state step ID")):
-        if agent_name not in AUDIO_CONFIGS:
-            raise HTTPException(status_code=404, detail=f"Voice agent '{agent_name}' not found")
-        
-        config = AUDIO_CONFIGS[agent_name]
+@app.get("/prefetch/stats")
+async def prefetch_stats():
+    """Show whether speculative prefetching is paying off"""
+    return prefetcher.snapshot()
+
+
+@app.get("/tts/status")
+async def tts_status():
+    """Upstream TTS circuit breaker and limiter state"""
+    return {
+        "backend": tts_backend.name,
+        "breaker": tts_breaker.snapshot(),
+        "active_renders": tts_limiter.active,
+        "queued_renders": tts_limiter.queued(),
+    }
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics for the audio hot path"""
+    metrics.CACHE_BYTES.labels().set(audio_cache.total_bytes)
+    metrics.CACHE_ENTRIES.labels().set(len(audio_cache))
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
+def step_label(config: Dict[str, Any], step: Optional[str]) -> str:
+    """Metric label for a step; unknown steps are served the default audio"""
+    if step:
+        if config.get("script_index") and step in config["script_index"]["steps"]:
+            return step
+        for state in config.get("states") or []:
+            if state["id"].startswith(f"{step}_"):
+                return step
+    return "default"
+
+
+def fallback_audio(agent_name: str, label: str, ext: str = "mp3") -> Optional[Path]:
+    """The closest audio on disk for an agent/step while the TTS backend is down"""
+    # Older renderings of this step (e.g. before a script edit), then the agent's default clip
+    for candidate in dict.fromkeys((label, "default")):
+        keys = render_history.keys(agent_name, candidate)
+        entry = prerendered.entry(agent_name, None if candidate == "default" else candidate)
+        if entry:
+            keys.append(entry["key"])
+        for key in keys:
+            # Any format beats no audio
+            path = audio_cache.get(key, ext) or prerendered.get(key) or audio_cache.get(key)
+            if path:
+                return path
+    return None
+
+
+def agent_keys(config: Dict[str, Any]) -> Dict[str, str]:
+    """Content key of every step an agent can serve, by step label"""
+    steps = step_ids(config) + list((config.get("script_index") or {}).get("steps", {}))
+    return {
+        step_label(config, step): content_key(get_step_content(config, step), tts_backend.model_id)
+        for step in dict.fromkeys(steps)
+    }
+
+
+async def on_agent_changed(agent_name: str, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]):
+    """Drop audio for content an agent no longer has and warm its new content"""
+    old_keys = set(agent_keys(old).values()) if old else set()
+    new_keys = agent_keys(new) if new else {}
+
+    removed = sum(audio_cache.discard(key) for key in old_keys - set(new_keys.values()))
+    if removed:
+        print(f"🧹 Removed {removed} cached renderings of {agent_name}'s old content")
+
+    # Render the new content before the next new hire asks for it
+    if PREFETCH_ENABLED and tts_breaker.available:
+        for label, key in new_keys.items():
+            if key not in old_keys:
+                prefetch_step(agent_name, new, None if label == "default" else label)
+
+
+def prefetch_step(agent_name: str, config: Dict[str, Any], step: Optional[str], ext: str = "mp3",
+                  group: Optional[str] = None) -> str:
+    """Queue a background render of one step, returning its cache key"""
+    step_config = get_step_content(config, step)
+    label = step_label(config, step)
+    key = content_key(step_config, tts_backend.model_id)
+    prefetcher.schedule(
+        key,
+        lambda: instrument_upstream(render_stream(step_config, ext, priority=BACKGROUND), agent_name, label),
+        ext,
+        group=group,
+    )
+    return key
+
+
+def schedule_prefetch(agent_name: str, config: Dict[str, Any], step: Optional[str], ext: str = "mp3"):
+    """Queue background renders of the conversation states that follow a step
+
+    Prefetches queued for the agent's earlier steps are cancelled: the
+    client has moved on from them.
+    """
+    keys = [content_key(get_step_content(config, step), tts_backend.model_id)]
+    for next_step in next_steps(config.get("states"), step, PREFETCH_DEPTH):
+        keys.append(prefetch_step(agent_name, config, next_step, ext, group=agent_name))
+    prefetcher.retarget(agent_name, keys, ext)
+
+
+def step_order(label: str) -> Tuple[int, int, str]:
+    # The default clip introduces the agent, then steps in numeric order
+    if label == "default":
+        return (0, 0, label)
+    return (1, int(label), label) if label.isdigit() else (2, 0, label)
+
+
+async def build_bundle_manifest(
+    agent_name: str, config: Dict[str, Any], ext: str
+) -> Tuple[Dict[str, Any], List[Tuple[str, Path]]]:
+    """Describe every step of an agent and find the ones already rendered"""
+    steps = []
+    files = []
+    for label, key in sorted(agent_keys(config).items(), key=lambda item: step_order(item[0])):
+        path = (prerendered.get(key) if ext == "mp3" else None) or audio_cache.get(key, ext)
+        entry = {
+            "step": label,
+            "key": key,
+            "url": f"/{agent_name}" if label == "default" else f"/{agent_name}?step={label}",
+            "file": f"{label}.{ext}",
+            "available": False,
+            "bytes": None,
+            "duration": None,
+        }
+        try:
+            stat = path.stat() if path is not None else None
+        except FileNotFoundError:
+            # Evicted since the lookup
+            stat = None
+        entry["available"] = stat is not None
+        if stat is not None:
+            entry["bytes"] = stat.st_size
+            if ext == "mp3":
+                entry["duration"] = await file_duration(path, stat)
+            files.append((entry["file"], path))
+        steps.append(entry)
+
+    manifest = {
+        "agent": agent_name,
+        "format": ext,
+        "media_type": MEDIA_TYPES[ext],
+        "bundle_url": f"/bundle/{agent_name}?format={ext}",
+        "complete": all(step["available"] for step in steps),
+        "total_bytes": sum(step["bytes"] or 0 for step in steps),
+        "total_duration": round(sum(step["duration"] or 0 for step in steps), 3),
+        "steps": steps,
+    }
+    return manifest, files
+
+
+def bundle_request(agent_name: str, audio_format: str) -> Dict[str, Any]:
+    config = AUDIO_CONFIGS.get(agent_name)
+    if config is None:
+        raise HTTPException(status_code=404, detail=f"Voice agent '{agent_name}' not found")
+    if audio_format not in tts_backend.formats:
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{audio_format}', expected one of {', '.join(tts_backend.formats)}")
+    return config
+
+
+@app.get("/bundle/{agent_name}/manifest")
+async def bundle_manifest(agent_name: str, audio_format: str = Query("mp3", alias="format")):
+    """Every step of an agent's flow with its content hash, size and duration"""
+    config = bundle_request(agent_name, audio_format)
+    manifest, _ = await build_bundle_manifest(agent_name, config, audio_format)
+
+    # Render what is missing so the bundle is complete next time
+    if PREFETCH_ENABLED and tts_breaker.available:
+        for step in manifest["steps"]:
+            if not step["available"]:
+                prefetch_step(agent_name, config, None if step["step"] == "default" else step["step"], audio_format)
+
+    return JSONResponse(manifest, headers={"ETag": bundle_etag(manifest), "Cache-Control": "no-cache"})
+
+
+@app.get("/bundle/{agent_name}")
+async def bundle_archive(agent_name: str, request: Request, audio_format: str = Query("mp3", alias="format")):
+    """All rendered step audio of an agent as one streamed tar archive"""
+    config = bundle_request(agent_name, audio_format)
+    manifest, files = await build_bundle_manifest(agent_name, config, audio_format)
+    # Describe what the archive will hold: a file evicted before it could be
+    # opened is left out of both the manifest and the ETag
+    members = open_members(files)
+    try:
+        manifest = opened_manifest(manifest, members)
+        etag = bundle_etag(manifest)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, etag):
+            close_members(members)
+            return Response(status_code=304, headers=headers)
+
+        manifest_bytes = json.dumps(manifest, indent=2).encode("utf-8")
+        headers["Content-Length"] = str(archive_size(manifest_bytes, members))
+        headers["Content-Disposition"] = f"attachment; filename={agent_name}_{audio_format}.tar"
+        return ArchiveResponse(manifest_bytes, members, headers)
+    except BaseException:
+        close_members(members)
+        raise
+
+
+def require_admin(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    authorization = request.headers.get("authorization", "")
+    token = authorization[7:] if authorization.lower().startswith("bearer ") else ""
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
+
+
+@app.get("/admin/profile")
+async def profile_status(request: Request):
+    """Current and last profiling session, and event-loop lag"""
+    require_admin(request)
+    return {**profiler.status(), "loop_lag": loop_lag.snapshot()}
+
+
+@app.post("/admin/profile")
+async def start_profile(
+    request: Request,
+    requests: int = Query(profiling.PROFILE_DEFAULT_REQUESTS, ge=1, description="Stop after this many requests"),
+    seconds: float = Query(profiling.PROFILE_DEFAULT_SECONDS, gt=0, description="Stop after this many seconds"),
+):
+    """Profile the next N requests or T seconds, whichever comes first"""
+    require_admin(request)
+    try:
+        return profiler.start(requests, seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.delete("/admin/profile")
+async def stop_profile(request: Request):
+    """Stop the running session now and write its files"""
+    require_admin(request)
+    summary = profiler.stop()
+    if summary is None:
+        raise HTTPException(status_code=404, detail="No profiling session is running")
+    return summary
+
+
+# One route serves every voice agent. Registered after the fixed routes,
+# which it would otherwise shadow: add new routes above this one.
+@app.get("/{agent_name}", summary="Generate voice agent audio", response_class=StreamingResponse)
+async def audio_endpoint(
+    agent_name: str,
+    request: Request,
+    step: Optional[str] = Query(None, description="Conversation state step ID"),
+    pipeline: bool = Query(False, description="Synthesize sentence chunks in parallel for faster first audio"),
+    audio_format: Optional[str] = Query(None, alias="format", description="Audio format (mp3, opus, aac, flac, wav)"),
+    quality: Optional[str] = Query(None, description="Preferred quality when format is not given: low, standard or high"),
+):
+    with profiling.phase("config_lookup"):
+        config = AUDIO_CONFIGS.get(agent_name)
+    if config is None:
+        raise HTTPException(status_code=404, detail=f"Voice agent '{agent_name}' not found")
+    
+    ext = negotiate_format(
+        tts_backend.formats,
+        accept=request.headers.get("accept"),
+        requested=audio_format,
+        quality=quality,
+        save_data=request.headers.get("save-data", "").lower() == "on",
+    )
+    if ext is None:
+        if audio_format:
+            raise HTTPException(status_code=400, detail=f"Unsupported format '{audio_format}', expected one of {', '.join(tts_backend.formats)}")
+        raise HTTPException(status_code=406, detail=f"No acceptable audio format, available: {', '.join(MEDIA_TYPES[f] for f in tts_backend.formats)}")
+    metrics.FORMAT_REQUESTS.labels(ext).inc()
+    
+    with profiling.phase("step_content"):
         step_config = get_step_content(config, step)
+        key = content_key(step_config, tts_backend.model_id)
+    label = step_label(config, step)
+    metrics.REQUESTS.labels(agent_name, label).inc()
+    render_history.remember(agent_name, label, key)
+    
+    try:
+        values = slot_values(step_config, request.query_params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if values and tts_breaker.available:
+        return personalized_response(agent_name, config, step, step_config, values, label, ext)
+    
+    # Pre-rendering covers the default mp3 format only
+    with profiling.phase("cache_lookup"):
+        cached_path = prerendered.get(key) if ext == "mp3" else None
+        cache_status = "PRERENDERED"
+        if cached_path is None:
+            cached_path = audio_cache.get(key, ext)
+            cache_status = "HIT"
+    
+    headers = {
+        "Content-Disposition": f"inline; filename={agent_name}_{step or 'default'}.{ext}",
+        # Clients may keep the audio but must revalidate it with the ETag
+        "Cache-Control": "no-cache",
+        "X-Audio-Cache": cache_status,
+    }
+    if not audio_format:
+        headers["Vary"] = "Accept, Save-Data"
+    
+    if cached_path is None and not inflight.get(key, ext) and not tts_breaker.available:
+        # The TTS backend is down: serve the closest audio we have instead of hanging
+        cached_path = fallback_audio(agent_name, label, ext)
+        cache_status = "FALLBACK"
+        headers["X-Audio-Cache"] = cache_status
+        # Do not let clients keep a stand-in for the real rendering
+        headers["Cache-Control"] = "no-store"
+        if cached_path is None:
+            metrics.CACHE_RESULTS.labels(agent_name, label, "unavailable").inc()
+            raise HTTPException(
+                status_code=503,
+                detail="Audio is temporarily unavailable",
+                headers={"Retry-After": str(max(1, round(tts_breaker.open_seconds)))},
+            )
+    
+    response = None
+    if cached_path:
+        served_ext = cached_path.suffix[1:]
+        served_headers = dict(headers)
+        if served_ext != ext:
+            served_headers["Content-Disposition"] = f"inline; filename={agent_name}_{step or 'default'}.{served_ext}"
+        response = await cached_audio_response(request, cached_path, served_headers, ext=served_ext)
+        if response is not None and "content-length" in response.headers:
+            metrics.BYTES_SENT.labels(agent_name, label).inc(int(response.headers["content-length"]))
+    
+    if response is None:
+        # Not cached, or evicted since the lookup: attach to an identical
+        # in-flight render or start a new one
+        stream = inflight.get(key, ext)
+        cache_status = "COALESCED" if stream else "MISS"
+        if stream is None:
+            source = render_stream(step_config, ext, pipeline=pipeline)
+            stream = inflight.start(key, instrument_upstream(source, agent_name, label), ext)
         
-        return StreamingResponse(
-            generate_audio_stream(step_config),
-            media_type="audio/mpeg",
-            headers={
-                "Content-Disposition": f"inline; filename={agent_name}_{step or 'default'}.mp3",
-                "Cache-Control": "no-cache",
-            }
-        )
+        # Still rendering: byte ranges are only available once it is on disk
+        headers["X-Audio-Cache"] = cache_status
+        headers["Accept-Ranges"] = "none"
+        body = track_stream(stream.subscribe(), agent_name, label)
+        response = StreamingResponse(body, media_type=MEDIA_TYPES[ext], headers=headers)
     
-    return audio_endpoint
-
-
-# Register all voice agent endpoints
-for agent_name in AUDIO_CONFIGS.keys():
-    endpoint_func = create_audio_endpoint(agent_name)
-    endpoint_func.__name__ = f"{agent_name}_audio"
-    app.add_api_route(
-        f"/{agent_name}",
-        endpoint_func,
-        methods=["GET"],
-        summary=f"Generate {agent_name} audio",
-        response_class=StreamingResponse
-    )
+    metrics.CACHE_RESULTS.labels(agent_name, label, cache_status.lower()).inc()
+    
+    if PREFETCH_ENABLED and tts_breaker.available:
+        prefetcher.record_request(key, cache_status, ext)
+        schedule_prefetch(agent_name, config, step, ext)
+    
+    return response
+
+
+def personalized_response(agent_name: str, config: Dict[str, Any], step: Optional[str],
+                          step_config: Dict[str, Any], values: Dict[str, str], label: str, ext: str):
+    """Stream a step with the hire's slot values filled in, without caching the result"""
+    if ext == "mp3":
+        source = spliced_stream(step_config, values, generate_audio_stream, inflight, slot_inflight, tts_backend.model_id)
+    else:
+        # Splicing joins MP3 frames: other formats are rendered whole
+        filled = {**step_config, "input": fill_slots(" ".join(template_lines(step_config)), values)}
+        source = generate_audio_stream(filled, response_format=ext)
+    
+    headers = {
+        "Content-Disposition": f"inline; filename={agent_name}_{step or 'default'}.{ext}",
+        # Personal audio: neither shared caches nor the browser should keep it
+        "Cache-Control": "private, no-store",
+        "Accept-Ranges": "none",
+        "X-Audio-Cache": "SPLICED",
+    }
+    metrics.CACHE_RESULTS.labels(agent_name, label, "spliced").inc()
+    body = track_stream(instrument_upstream(source, agent_name, label), agent_name, label)
+    
+    if PREFETCH_ENABLED:
+        schedule_prefetch(agent_name, config, step, ext)
+    
+    return StreamingResponse(body, media_type=MEDIA_TYPES[ext], headers=headers)
+
+
+@app.on_event("startup")
+async def start_prerender():
+    """Warm up pre-rendered audio in the background without delaying startup"""
+    if PRERENDER_ON_STARTUP:
+        app.state.prerender_task = asyncio.create_task(prerender_all(
+            AUDIO_CONFIGS,
+            resolve=get_step_content,
+            synthesize=lambda step_config: render_stream(step_config, priority=BACKGROUND),
+            model=tts_backend.model_id,
+            store=prerendered,
+            cache=audio_cache,
+            # Live requests for a step being warmed attach to its render
+            inflight=inflight,
+        ))
+
+
+@app.on_event("startup")
+async def start_agent_watcher():
+    """Hot-reload voice agents when content_agent.py rewrites their files"""
+    if VOICE_AGENT_WATCH:
+        app.state.watch_task = asyncio.create_task(AUDIO_CONFIGS.watch(on_agent_changed))
+
+
+@app.on_event("startup")
+async def start_loop_lag_monitor():
+    if loop_lag.interval > 0:
+        app.state.loop_lag_task = asyncio.create_task(loop_lag.run())
+
+
+@app.on_event("shutdown")
+async def stop_background_renders():
+    profiler.stop("shutdown")
+    for name in ("prerender_task", "watch_task", "loop_lag_task"):
+        task = getattr(app.state, name, None)
+        if task and not task.done():
+            task.cancel()
+    await prefetcher.stop()
+    await tts_breaker.stop()
 
 
 # Add CORS middleware for frontend access
@@ -260,8 +672,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Content-Range", "Accept-Ranges", "X-Audio-Cache", "Vary"],
 )
 
+# Per-request timing breakdowns, only while a profiling session runs
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,270 @@
+"""
+Prometheus-style metrics for the audio server.
+
+A small, dependency-free implementation of counters, gauges and histograms
+rendered in the Prometheus text exposition format. Everything runs on the
+server's event loop, so updates are plain attribute arithmetic on a child
+object looked up once per request: no locks are taken on the per-chunk path.
+"""
+
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upstream latencies span cached-warm connections to slow long renders
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Most renders get a slot immediately; the tail is what matters under bursts
+QUEUE_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Event-loop lag: anything over a few milliseconds delays every client
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+class _Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        """The child series for a set of label values (cache it on hot paths)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """A new series for one set of label values"""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        labels = _format_labels(self.labelnames, values)
+        return [f"{self.name}{labels} {_format_value(child.value)}"]
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _Histogram(self.buckets)
+
+    def _render_child(self, values, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values, 'le="+Inf"')
+        lines.append(f"{self.name}_bucket{labels} {child.count}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Registry:
+    """A set of metrics rendered together for /metrics"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+LABELS = ("agent", "step")
+
+REQUESTS = registry.counter(
+    "audio_requests_total", "Audio requests received", LABELS)
+CACHE_RESULTS = registry.counter(
+    "audio_cache_results_total", "How audio requests were served (prerendered, hit, coalesced, miss, spliced, fallback, unavailable)",
+    LABELS + ("result",))
+FORMAT_REQUESTS = registry.counter(
+    "audio_format_requests_total", "Audio requests by negotiated format", ("format",))
+BYTES_SENT = registry.counter(
+    "audio_bytes_sent_total", "Audio body bytes sent to clients", LABELS)
+STREAMS_IN_FLIGHT = registry.gauge(
+    "audio_streams_in_flight", "Responses currently streaming audio that is still rendering", LABELS)
+
+UPSTREAM_REQUESTS = registry.counter(
+    "tts_upstream_requests_total", "Renders started against the TTS backend", LABELS)
+UPSTREAM_ERRORS = registry.counter(
+    "tts_upstream_errors_total", "Renders that failed before completing", LABELS)
+UPSTREAM_BYTES = registry.counter(
+    "tts_upstream_bytes_total", "Audio bytes received from the TTS backend", LABELS)
+UPSTREAM_IN_FLIGHT = registry.gauge(
+    "tts_upstream_in_flight", "Renders currently streaming from the TTS backend", LABELS)
+UPSTREAM_TTFB = registry.histogram(
+    "tts_upstream_ttfb_seconds", "Time from starting a render to its first audio byte", LABELS)
+UPSTREAM_DURATION = registry.histogram(
+    "tts_upstream_duration_seconds", "Time from starting a render to its last audio byte", LABELS)
+
+TTS_ACTIVE = registry.gauge(
+    "tts_limiter_active", "Renders holding an upstream concurrency slot", ("voice",))
+TTS_QUEUE_DEPTH = registry.gauge(
+    "tts_limiter_queue_depth", "Renders waiting for an upstream concurrency slot", ("priority",))
+TTS_QUEUE_WAIT = registry.histogram(
+    "tts_limiter_wait_seconds", "Time renders waited for an upstream concurrency slot",
+    ("voice", "priority"), buckets=QUEUE_BUCKETS)
+TTS_RETRIES = registry.counter(
+    "tts_upstream_retries_total", "Upstream calls retried after a rate-limit, server or connection error",
+    ("voice", "reason"))
+
+TTS_BREAKER_STATE = registry.gauge(
+    "tts_breaker_state", "Upstream circuit breaker state (0 closed, 1 open, 2 half-open)")
+TTS_BREAKER_TRIPS = registry.counter(
+    "tts_breaker_trips_total", "Times the upstream circuit breaker opened")
+
+CACHE_BYTES = registry.gauge(
+    "audio_cache_bytes", "Bytes of rendered audio in the disk cache")
+CACHE_ENTRIES = registry.gauge(
+    "audio_cache_entries", "Rendered files in the disk cache")
+
+EVENT_LOOP_LAG = registry.histogram(
+    "audio_event_loop_lag_seconds", "How late the event loop ran a timer it was due to run",
+    buckets=LAG_BUCKETS)
+
+
+async def instrument_upstream(source: AsyncIterator[bytes], agent: str, step: str) -> AsyncIterator[bytes]:
+    """Pass a TTS stream through while recording latency, bytes and errors"""
+    labels = (agent, step)
+    UPSTREAM_REQUESTS.labels(*labels).inc()
+    in_flight = UPSTREAM_IN_FLIGHT.labels(*labels)
+    received = UPSTREAM_BYTES.labels(*labels)
+
+    start = time.perf_counter()
+    first_byte: Optional[float] = None
+    in_flight.inc()
+    try:
+        async for chunk in source:
+            if first_byte is None:
+                first_byte = time.perf_counter()
+                UPSTREAM_TTFB.labels(*labels).observe(first_byte - start)
+            received.inc(len(chunk))
+            yield chunk
+    except (asyncio.CancelledError, GeneratorExit):
+        # Abandoned renders are not upstream failures
+        raise
+    except Exception:
+        UPSTREAM_ERRORS.labels(*labels).inc()
+        raise
+    else:
+        UPSTREAM_DURATION.labels(*labels).observe(time.perf_counter() - start)
+    finally:
+        in_flight.dec()
+
+
+async def track_stream(stream: AsyncIterator[bytes], agent: str, step: str) -> AsyncIterator[bytes]:
+    """Count bytes sent to one client and keep it in the in-flight gauge"""
+    in_flight = STREAMS_IN_FLIGHT.labels(agent, step)
+    sent = BYTES_SENT.labels(agent, step)
+    in_flight.inc()
+    try:
+        async for chunk in stream:
+            sent.inc(len(chunk))
+            yield chunk
+    finally:
+        in_flight.dec()
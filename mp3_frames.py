@@ -0,0 +1,178 @@
+"""
+Minimal MPEG audio frame parsing.
+
+Enough of the MP3 container to join separately synthesized clips into one
+contiguous stream: ID3 tags and Xing/Info/VBRI header frames are dropped so
+only audio frames are emitted, and frames are never split or re-encoded.
+"""
+
+from typing import NamedTuple, Optional
+
+# Bitrates in kbps indexed by [version_is_mpeg1][layer][bitrate_index]
+_BITRATES = {
+    True: {
+        1: [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+        2: [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+        3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    },
+    False: {
+        1: [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+        2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+        3: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    },
+}
+
+# Sample rates indexed by version bits (0: MPEG 2.5, 2: MPEG 2, 3: MPEG 1)
+_SAMPLE_RATES = {
+    0: [11025, 12000, 8000],
+    2: [22050, 24000, 16000],
+    3: [44100, 48000, 32000],
+}
+
+ID3V1_SIZE = 128
+
+
+class FrameHeader(NamedTuple):
+    mpeg1: bool
+    layer: int
+    bitrate: int
+    sample_rate: int
+    channels: int
+    length: int
+    samples: int
+
+
+def parse_header(data, offset: int = 0) -> Optional[FrameHeader]:
+    """Parse the 4-byte frame header at offset, or None if it is not one"""
+    if len(data) - offset < 4:
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    if data[offset] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+
+    version_bits = (b1 >> 3) & 0x03
+    layer = 4 - ((b1 >> 1) & 0x03)
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0x03
+    if version_bits == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    mpeg1 = version_bits == 3
+    bitrate = _BITRATES[mpeg1][layer][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version_bits][sample_rate_index]
+    padding = (b2 >> 1) & 0x01
+    channels = 1 if (b3 >> 6) == 3 else 2
+
+    if layer == 1:
+        length = (12 * bitrate // sample_rate + padding) * 4
+        samples = 384
+    elif layer == 2 or mpeg1:
+        length = 144 * bitrate // sample_rate + padding
+        samples = 1152
+    else:
+        length = 72 * bitrate // sample_rate + padding
+        samples = 576
+
+    return FrameHeader(mpeg1, layer, bitrate, sample_rate, channels, length, samples)
+
+
+def silent_frame(bitrate_kbps: int = 64) -> bytes:
+    """A valid MPEG-1 Layer III mono 48 kHz frame that decodes to silence"""
+    bitrate_index = _BITRATES[True][3].index(bitrate_kbps)
+    header = bytes([0xFF, 0xFB, (bitrate_index << 4) | (1 << 2), 0xC4])
+    # Zeroed side info and main data: no granule carries any audio
+    return header + bytes(144 * bitrate_kbps * 1000 // 48000 - len(header))
+
+
+def id3v2_size(data) -> int:
+    """Total size of an ID3v2 tag starting at data[0]"""
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def is_info_frame(frame) -> bool:
+    """Whether a frame is a Xing/Info/VBRI header rather than audio"""
+    return b"Xing" in frame[4:64] or b"Info" in frame[4:64] or frame[36:40] == b"VBRI"
+
+
+class FrameReader:
+    """Incrementally splits an MP3 byte stream into bare audio frames"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._skip = 0
+        self.frames = 0
+        self.samples = 0
+        self.sample_rate: Optional[int] = None
+
+    @property
+    def duration(self) -> float:
+        """Seconds of audio in the frames emitted so far"""
+        return self.samples / self.sample_rate if self.sample_rate else 0.0
+
+    def feed(self, data: bytes) -> bytes:
+        """Add stream bytes, returning the complete audio frames now available"""
+        self._buffer += data
+        return self._drain(final=False)
+
+    def flush(self) -> bytes:
+        """Return whatever complete frames remain at the end of the stream"""
+        return self._drain(final=True)
+
+    def _drain(self, final: bool) -> bytes:
+        buffer = self._buffer
+        out = bytearray()
+        pos = 0
+
+        while True:
+            if self._skip:
+                skipped = min(self._skip, len(buffer) - pos)
+                pos += skipped
+                self._skip -= skipped
+                if self._skip:
+                    break
+
+            remaining = len(buffer) - pos
+            if remaining < (4 if final else 10):
+                break
+
+            if buffer[pos:pos + 3] == b"ID3":
+                if remaining < 10:
+                    break
+                self._skip = id3v2_size(buffer[pos:pos + 10])
+                continue
+            if buffer[pos:pos + 3] == b"TAG":
+                self._skip = ID3V1_SIZE
+                continue
+
+            header = parse_header(buffer, pos)
+            if header is None:
+                # Not aligned on a frame: resynchronize on the next byte
+                pos += 1
+                continue
+            if remaining < header.length:
+                break
+
+            frame = buffer[pos:pos + header.length]
+            pos += header.length
+            if self.frames == 0 and is_info_frame(frame):
+                continue
+
+            out += frame
+            self.frames += 1
+            self.samples += header.samples
+            self.sample_rate = header.sample_rate
+
+        del buffer[:pos]
+        if final:
+            buffer.clear()
+        return bytes(out)
+
+
+def audio_frames(data: bytes) -> bytes:
+    """Strip tags and header frames from a complete MP3 file"""
+    reader = FrameReader()
+    return reader.feed(data) + reader.flush()
@@ -0,0 +1,235 @@
+"""
+Speculative prefetch of the next conversation state's audio.
+
+conversation_states.json already records which states can follow each one
+(`transitions[].next_step`). When a client requests step N, the likely next
+steps are queued for background synthesis into the audio cache, so the next
+click is served from disk. Prefetching runs at low priority and within a
+budget: a small worker pool that yields to foreground renders, a bounded
+queue, and a cap on renders per minute. When an agent is asked for a newer
+step, its queued and running prefetches for other steps are cancelled so
+the budget goes to what the client will hear next. Hit/miss counters show
+whether the speculation is paying off.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Collection, Dict, List, Optional
+
+from singleflight import SharedStream, SingleFlight
+
+# Prefetch configuration
+PREFETCH_ENABLED = os.getenv("AUDIO_PREFETCH", "1").lower() in ("1", "true", "yes")
+PREFETCH_DEPTH = int(os.getenv("AUDIO_PREFETCH_DEPTH", 1))
+PREFETCH_CONCURRENCY = int(os.getenv("AUDIO_PREFETCH_CONCURRENCY", 1))
+PREFETCH_QUEUE_SIZE = int(os.getenv("AUDIO_PREFETCH_QUEUE_SIZE", 32))
+PREFETCH_BUDGET_PER_MINUTE = int(os.getenv("AUDIO_PREFETCH_BUDGET_PER_MINUTE", 60))
+# Prefetch waits while this many foreground renders are in flight
+PREFETCH_MAX_FOREGROUND = int(os.getenv("AUDIO_PREFETCH_MAX_FOREGROUND", 4))
+# Queued prefetches older than this are dropped as no longer relevant
+PREFETCH_MAX_AGE = float(os.getenv("AUDIO_PREFETCH_MAX_AGE", 120))
+
+# How many completed prefetches to remember for hit accounting
+TRACKED_PREFETCHES = 1024
+
+
+def next_steps(states: Optional[List[Dict[str, Any]]], step: Optional[str], depth: int = PREFETCH_DEPTH) -> List[str]:
+    """Step numbers reachable from a step within `depth` transitions"""
+    if not states:
+        return []
+
+    by_step = {state["id"].split("_")[0]: state for state in states}
+    if step is None:
+        # The default clip introduces the agent; the flow starts at the first state
+        first = states[0]["id"].split("_")[0]
+        return [first] + [s for s in next_steps(states, first, depth - 1) if s != first]
+
+    result: List[str] = []
+    frontier = [step]
+    for _ in range(depth):
+        reached = []
+        for current in frontier:
+            for transition in (by_step.get(current) or {}).get("transitions") or []:
+                candidate = transition.get("next_step", "").split("_")[0]
+                if candidate and candidate != step and candidate not in result:
+                    result.append(candidate)
+                    reached.append(candidate)
+        frontier = reached
+    return result
+
+
+class Prefetcher:
+    """Low-priority background renderer feeding the audio cache"""
+
+    def __init__(
+        self,
+        inflight: SingleFlight,
+        is_available: Callable[[str, str], bool],
+        concurrency: int = PREFETCH_CONCURRENCY,
+        queue_size: int = PREFETCH_QUEUE_SIZE,
+        budget_per_minute: int = PREFETCH_BUDGET_PER_MINUTE,
+        max_foreground: int = PREFETCH_MAX_FOREGROUND,
+    ):
+        self.inflight = inflight
+        self.is_available = is_available
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.budget_per_minute = budget_per_minute
+        self.max_foreground = max_foreground
+
+        self.stats = {
+            "scheduled": 0,
+            "dropped": 0,
+            "completed": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "hits": 0,
+            "inflight_hits": 0,
+            "misses": 0,
+            "wasted": 0,
+        }
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._queued: Dict[str, float] = {}
+        self._active: Dict[str, SharedStream] = {}
+        # Queued or running prefetches by the agent whose flow they follow
+        self._groups: Dict[str, str] = {}
+        self._prefetched: "OrderedDict[str, None]" = OrderedDict()
+        self._render_times: List[float] = []
+        self._workers: List[asyncio.Task] = []
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    def schedule(self, key: str, source: Callable[[], AsyncIterator[bytes]], ext: str = "mp3",
+                 group: Optional[str] = None):
+        """Queue a speculative render unless it is already available or pending
+
+        Renders scheduled with a group can be cancelled together by retarget.
+        """
+        name = f"{key}.{ext}"
+        if name in self._queued or name in self._active:
+            if group is not None:
+                self._groups[name] = group
+            return
+        if self.inflight.get(key, ext) or self.is_available(key, ext):
+            return
+
+        self._ensure_workers()
+        try:
+            self._queue.put_nowait((key, ext, source, time.monotonic()))
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return
+        self._queued[name] = time.monotonic()
+        if group is not None:
+            self._groups[name] = group
+        self.stats["scheduled"] += 1
+
+    def record_request(self, key: str, cache_status: str, ext: str = "mp3"):
+        """Count whether a foreground request benefited from speculation"""
+        name = f"{key}.{ext}"
+        if name in self._prefetched:
+            del self._prefetched[name]
+            self.stats["hits"] += 1
+        elif name in self._active:
+            self.stats["inflight_hits"] += 1
+        elif cache_status == "MISS":
+            self.stats["misses"] += 1
+
+    def _within_budget(self) -> bool:
+        now = time.monotonic()
+        self._render_times = [t for t in self._render_times if now - t < 60]
+        return len(self._render_times) < self.budget_per_minute
+
+    def _foreground_busy(self) -> bool:
+        return len(self.inflight) - len(self._active) >= self.max_foreground
+
+    async def _worker(self):
+        while True:
+            key, ext, source, queued_at = await self._queue.get()
+            name = f"{key}.{ext}"
+            try:
+                # Yield to foreground renders, giving up once the guess is stale
+                while self._foreground_busy() or not self._within_budget():
+                    if time.monotonic() - queued_at > PREFETCH_MAX_AGE:
+                        break
+                    await asyncio.sleep(0.25)
+
+                if time.monotonic() - queued_at > PREFETCH_MAX_AGE:
+                    self.stats["dropped"] += 1
+                    continue
+                if name not in self._queued:
+                    # Cancelled while waiting
+                    continue
+                if self.inflight.get(key, ext) or self.is_available(key, ext):
+                    continue
+
+                self._render_times.append(time.monotonic())
+                stream = self.inflight.start(key, source(), ext)
+                self._queued.pop(name, None)
+                self._active[name] = stream
+                await stream.wait()
+
+                if stream.error is None:
+                    self.stats["completed"] += 1
+                    self._remember(name)
+                elif isinstance(stream.error, asyncio.CancelledError):
+                    self.stats["cancelled"] += 1
+                else:
+                    self.stats["failed"] += 1
+            finally:
+                self._queued.pop(name, None)
+                self._active.pop(name, None)
+                self._groups.pop(name, None)
+
+    def _remember(self, name: str):
+        self._prefetched[name] = None
+        while len(self._prefetched) > TRACKED_PREFETCHES:
+            self._prefetched.popitem(last=False)
+            self.stats["wasted"] += 1
+
+    def cancel(self, key: str, ext: str = "mp3"):
+        """Cancel a queued or running prefetch; renders a client is reading are kept"""
+        self._cancel(f"{key}.{ext}")
+
+    def _cancel(self, name: str):
+        if self._queued.pop(name, None) is not None:
+            self.stats["cancelled"] += 1
+        stream = self._active.get(name)
+        if stream is not None:
+            stream.cancel()
+
+    def retarget(self, group: str, keys: Collection[str], ext: str = "mp3"):
+        """Cancel a group's prefetches other than the given keys"""
+        keep = {f"{key}.{ext}" for key in keys}
+        for name, owner in list(self._groups.items()):
+            if owner == group and name not in keep:
+                del self._groups[name]
+                self._cancel(name)
+
+    def cancel_all(self):
+        for name in list(self._queued):
+            self._cancel(name)
+        for name in list(self._active):
+            self._cancel(name)
+
+    async def stop(self):
+        self.cancel_all()
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+
+    def snapshot(self) -> Dict[str, Any]:
+        answered = self.stats["hits"] + self.stats["inflight_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "queued": len(self._queued),
+            "active": len(self._active),
+            "hit_rate": round((self.stats["hits"] + self.stats["inflight_hits"]) / answered, 3) if answered else None,
+        }
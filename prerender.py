@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Pre-render voice agent audio for every agent and conversation step.
+
+Walks the voice agent configurations, resolves the content of each step and
+synthesizes it ahead of time so the first new hire after a deploy never waits
+on the upstream TTS. Runs are incremental: a step is only re-rendered when the
+content hash of its resolved (model, voice, input, instructions) changes.
+
+Usage:
+    python prerender.py                      # Render everything that changed
+    python prerender.py -a coach_blaze       # Only selected agents
+    python prerender.py --force -c 8         # Re-render all, 8 at a time
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from audio_cache import AudioCache, content_key
+from singleflight import SingleFlight
+
+# Prerender configuration
+PRERENDER_DIR = Path(os.getenv("AUDIO_PRERENDER_DIR", Path(__file__).parent / "audio_prerender"))
+PRERENDER_CONCURRENCY = int(os.getenv("AUDIO_PRERENDER_CONCURRENCY", 4))
+
+MANIFEST_NAME = "manifest.json"
+
+
+def step_ids(config: Dict[str, Any]) -> List[Optional[str]]:
+    """Steps servable for an agent: the default clip plus one per conversation state"""
+    steps: List[Optional[str]] = [None]
+    for state in config.get("states") or []:
+        step = state["id"].split("_")[0]
+        if step not in steps:
+            steps.append(step)
+    return steps
+
+
+def step_name(step: Optional[str]) -> str:
+    return step or "default"
+
+
+class PrerenderStore:
+    """Pre-rendered audio files plus a manifest mapping agent/step to content hash"""
+
+    def __init__(self, directory: Path = PRERENDER_DIR):
+        self.directory = Path(directory)
+        self.manifest_path = self.directory / MANIFEST_NAME
+        self.agents: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._by_key: Dict[str, Path] = {}
+        self.load()
+
+    def load(self):
+        if self.manifest_path.exists():
+            try:
+                with open(self.manifest_path, 'r') as f:
+                    self.agents = json.load(f).get("agents", {})
+            except Exception as e:
+                print(f"Error reading prerender manifest: {e}")
+                self.agents = {}
+
+        self._by_key = {}
+        for steps in self.agents.values():
+            for entry in steps.values():
+                self._by_key[entry["key"]] = self.directory / entry["file"]
+
+    def save(self):
+        """Write the manifest atomically so readers never see a partial file"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({"agents": self.agents}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def get(self, key: str) -> Optional[Path]:
+        """Return the pre-rendered file for a content key, if present"""
+        path = self._by_key.get(key)
+        if path is not None and path.exists():
+            return path
+        return None
+
+    def entry(self, agent_name: str, step: Optional[str]) -> Optional[Dict[str, Any]]:
+        return self.agents.get(agent_name, {}).get(step_name(step))
+
+    def is_current(self, agent_name: str, step: Optional[str], key: str) -> bool:
+        entry = self.entry(agent_name, step)
+        return bool(entry) and entry["key"] == key and (self.directory / entry["file"]).exists()
+
+    def record(self, agent_name: str, step: Optional[str], key: str, path: Path):
+        old = self.entry(agent_name, step)
+        if old:
+            self._by_key.pop(old["key"], None)
+
+        self.agents.setdefault(agent_name, {})[step_name(step)] = {
+            "key": key,
+            "file": str(path.relative_to(self.directory)),
+            "bytes": path.stat().st_size,
+            "rendered_at": datetime.now().isoformat(),
+        }
+        self._by_key[key] = path
+
+    def prune(self, agent_name: str, keep: List[str]):
+        """Drop manifest entries and files for steps an agent no longer has"""
+        steps = self.agents.get(agent_name, {})
+        for name in [name for name in steps if name not in keep]:
+            entry = steps.pop(name)
+            self._by_key.pop(entry["key"], None)
+            (self.directory / entry["file"]).unlink(missing_ok=True)
+
+
+async def render_step(
+    store: PrerenderStore,
+    agent_name: str,
+    step: Optional[str],
+    key: str,
+    step_config: Dict[str, str],
+    synthesize: Callable[[Dict[str, str]], AsyncIterator[bytes]],
+    cache: Optional[AudioCache] = None,
+    inflight: Optional[SingleFlight] = None,
+) -> str:
+    """Render a single step into the store, reusing cached audio when possible
+
+    With inflight (the server's warmup), the render is shared with any live
+    request for the same content instead of synthesizing it twice.
+    """
+    path = store.directory / agent_name / f"{step_name(step)}.mp3"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".part")
+
+    cached_path = cache.get(key) if cache else None
+    try:
+        if cached_path:
+            await asyncio.to_thread(shutil.copyfile, cached_path, tmp_path)
+            result = "copied"
+        else:
+            if inflight is not None:
+                stream = inflight.get(key) or inflight.start(key, synthesize(step_config))
+                chunks = stream.subscribe()
+            else:
+                chunks = synthesize(step_config)
+            with open(tmp_path, 'wb') as f:
+                async for chunk in chunks:
+                    f.write(chunk)
+            result = "rendered"
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    store.record(agent_name, step, key, path)
+    return result
+
+
+async def prerender_all(
+    configs: Dict[str, Dict[str, Any]],
+    resolve: Callable[[Dict[str, Any], Optional[str]], Dict[str, str]],
+    synthesize: Callable[[Dict[str, str]], AsyncIterator[bytes]],
+    model: str,
+    store: PrerenderStore,
+    cache: Optional[AudioCache] = None,
+    concurrency: int = PRERENDER_CONCURRENCY,
+    force: bool = False,
+    inflight: Optional[SingleFlight] = None,
+) -> Dict[str, int]:
+    """
+    Pre-render every step of every agent with bounded parallelism.
+
+    Args:
+        configs: Voice agent configurations keyed by agent name
+        resolve: Resolves an agent config and step to a TTS step config
+        synthesize: Streams audio for a step config from the TTS backend
+        model: Model identifier of the TTS backend, part of the content hash
+        store: Destination for rendered files and the manifest
+        cache: Optional audio cache to copy already rendered steps from
+        concurrency: Maximum number of simultaneous renders
+        force: Re-render steps even if their content hash is unchanged
+        inflight: Optional in-flight render table to share renders with
+
+    Returns:
+        Counts of rendered, copied, skipped and failed steps
+    """
+    counts = {"rendered": 0, "copied": 0, "skipped": 0, "failed": 0}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(agent_name: str, step: Optional[str], key: str, step_config: Dict[str, str]):
+        async with semaphore:
+            try:
+                result = await render_step(store, agent_name, step, key, step_config, synthesize, cache, inflight)
+                counts[result] += 1
+                # Persist progress so an interrupted run resumes where it stopped
+                store.save()
+                print(f"✅ {agent_name}/{step_name(step)} {result}")
+            except Exception as e:
+                counts["failed"] += 1
+                print(f"❌ {agent_name}/{step_name(step)} failed: {e}")
+
+    jobs = []
+    for agent_name, config in configs.items():
+        steps = step_ids(config)
+        for step in steps:
+            step_config = resolve(config, step)
+            key = content_key(step_config, model)
+            if not force and store.is_current(agent_name, step, key):
+                counts["skipped"] += 1
+                continue
+            jobs.append(run(agent_name, step, key, step_config))
+        store.prune(agent_name, [step_name(step) for step in steps])
+
+    await asyncio.gather(*jobs)
+    store.save()
+    return counts
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Pre-render voice agent audio for every conversation step"
+    )
+    parser.add_argument(
+        "--agents", "-a",
+        nargs="+",
+        help="Only render these agents (default: all)"
+    )
+    parser.add_argument(
+        "--concurrency", "-c",
+        type=int,
+        default=PRERENDER_CONCURRENCY,
+        help=f"Maximum simultaneous renders (default: {PRERENDER_CONCURRENCY})"
+    )
+    parser.add_argument(
+        "--output", "-o",
+        default=str(PRERENDER_DIR),
+        help=f"Output directory (default: {PRERENDER_DIR})"
+    )
+    parser.add_argument(
+        "--force", "-f",
+        action="store_true",
+        help="Re-render steps even if their content has not changed"
+    )
+
+    args = parser.parse_args()
+
+    # Imported here so the server module can use this one for its startup hook
+    import main as server
+
+    configs = server.AUDIO_CONFIGS
+    if args.agents:
+        missing = [name for name in args.agents if name not in configs]
+        if missing:
+            print(f"❌ Unknown voice agents: {', '.join(missing)}")
+            return
+        configs = {name: configs[name] for name in args.agents}
+
+    print(f"\n🎙️  Pre-rendering {len(configs)} voice agents into {args.output}")
+    counts = await prerender_all(
+        configs,
+        resolve=server.get_step_content,
+        synthesize=server.render_stream,
+        model=server.tts_backend.model_id,
+        store=PrerenderStore(Path(args.output)),
+        cache=server.audio_cache,
+        concurrency=args.concurrency,
+        force=args.force,
+    )
+    print(
+        f"\n✨ Done: {counts['rendered']} rendered, {counts['copied']} copied from cache, "
+        f"{counts['skipped']} unchanged, {counts['failed']} failed"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
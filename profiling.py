@@ -0,0 +1,337 @@
+"""
+On-demand profiling of the running audio server.
+
+An admin toggle (POST /admin/profile in main.py) starts a profiling session
+for the next N requests or T seconds, whichever comes first, without a
+restart. While a session runs:
+
+- a sampler thread records the event loop thread's Python stack every
+  PROFILE_SAMPLE_INTERVAL seconds; the samples are written as collapsed
+  stacks ("frame;frame;frame count" lines, the input of flamegraph.pl and
+  speedscope)
+- every request records a timing breakdown: the handler's named phases
+  (config lookup, step resolution, cache lookup), the first upstream byte,
+  response start, first body byte and total; written as JSON lines
+
+Both files land in PROFILE_DIR. Outside a session the per-request hooks are
+a context variable lookup.
+
+Event-loop lag is monitored all the time: a task sleeps for a fixed
+interval and records how late it wakes up, as a metric and in the session.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import metrics
+
+# Profiling configuration
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", Path(__file__).parent / "profiles"))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.005))
+# Upper bound on a session, whatever the admin asks for
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 600))
+PROFILE_DEFAULT_REQUESTS = 100
+PROFILE_DEFAULT_SECONDS = 60.0
+
+# Event-loop lag monitor (0 disables it)
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("EVENT_LOOP_LAG_INTERVAL", 0.25))
+
+# Deepest stack kept per sample; deeper frames are cut at the root
+MAX_STACK_DEPTH = 128
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{Path(code.co_filename).stem}:{code.co_qualname}"
+
+
+def collapse_stack(frame) -> str:
+    """A stack as one collapsed line, outermost frame first"""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """Samples one thread's stack from a background thread"""
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+                self.samples += 1
+            del frame
+
+
+class RequestTimer:
+    """Timing breakdown of one request, relative to its start"""
+
+    def __init__(self, method: str, path: str, step: Optional[str]):
+        self.method = method
+        self.path = path
+        self.step = step
+        self.start = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.marks: Dict[str, float] = {}
+        self.status: Optional[int] = None
+        self.cache: Optional[str] = None
+        self.bytes = 0
+
+    def mark(self, name: str):
+        """Record when something first happened, e.g. the first upstream byte"""
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter() - self.start
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "step": self.step,
+            "status": self.status,
+            "cache": self.cache,
+            "bytes": self.bytes,
+            "phases_ms": {name: round(seconds * 1000, 3) for name, seconds in self.phases.items()},
+            "marks_ms": {name: round(seconds * 1000, 3) for name, seconds in self.marks.items()},
+        }
+
+
+_current_timer: ContextVar[Optional[RequestTimer]] = ContextVar("profiling_timer", default=None)
+
+
+@contextmanager
+def phase(name: str):
+    """Time a block of the current request when it is being profiled"""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.phases[name] = timer.phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def mark(name: str):
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.mark(name)
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ProfileSession:
+    """One profiling run: stack samples, request timings and loop lag"""
+
+    def __init__(self, requests: int, seconds: float, directory: Path, interval: float):
+        self.id = time.strftime("%Y%m%d-%H%M%S") + f"-{time.time_ns() // 1_000_000 % 1000:03d}"
+        self.requests = requests
+        self.seconds = seconds
+        self.directory = directory
+        self.started = time.time()
+        self.timings: List[Dict[str, Any]] = []
+        self.lag: List[float] = []
+        self.sampler = StackSampler(threading.get_ident(), interval)
+        self.expiry: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.requests - len(self.timings))
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "requests_profiled": len(self.timings),
+            "requests_remaining": self.remaining,
+            "seconds_elapsed": round(time.time() - self.started, 1),
+            "seconds_limit": self.seconds,
+            "samples": self.sampler.samples,
+        }
+
+    def write(self, reason: str) -> Dict[str, Any]:
+        """Write the collapsed stacks and request timings; return a summary"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stacks_path = self.directory / f"{self.id}.folded"
+        timings_path = self.directory / f"{self.id}.requests.jsonl"
+        with open(stacks_path, "w", encoding="utf-8") as f:
+            for stack, count in self.sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(timings_path, "w", encoding="utf-8") as f:
+            for timing in self.timings:
+                f.write(json.dumps(timing) + "\n")
+
+        totals = [timing["marks_ms"]["total"] for timing in self.timings if "total" in timing["marks_ms"]]
+        return {
+            **self.status(),
+            "stopped": reason,
+            "stacks_file": str(stacks_path),
+            "requests_file": str(timings_path),
+            "total_ms_p50": _percentile(totals, 0.5),
+            "total_ms_p99": _percentile(totals, 0.99),
+            "loop_lag_ms_max": round(max(self.lag) * 1000, 3) if self.lag else None,
+            "loop_lag_ms_p99": round(_percentile(self.lag, 0.99) * 1000, 3) if self.lag else None,
+        }
+
+
+class Profiler:
+    """Starts and stops profiling sessions; at most one runs at a time"""
+
+    def __init__(self, directory: Path = PROFILE_DIR, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.directory = Path(directory)
+        self.interval = interval
+        self.session: Optional[ProfileSession] = None
+        self.last: Optional[Dict[str, Any]] = None
+
+    def start(self, requests: int = PROFILE_DEFAULT_REQUESTS,
+              seconds: float = PROFILE_DEFAULT_SECONDS) -> Dict[str, Any]:
+        """Begin a session on the calling (event loop) thread"""
+        if self.session is not None:
+            raise RuntimeError(f"Profiling session {self.session.id} is already running")
+        seconds = min(seconds, PROFILE_MAX_SECONDS)
+        session = ProfileSession(max(1, requests), seconds, self.directory, self.interval)
+        session.expiry = asyncio.get_running_loop().call_later(seconds, self._expire, session)
+        session.sampler.start()
+        self.session = session
+        print(f"🔬 Profiling the next {session.requests} requests or {seconds:g}s (session {session.id})")
+        return session.status()
+
+    def stop(self, reason: str = "admin") -> Optional[Dict[str, Any]]:
+        session = self.session
+        if session is None:
+            return None
+        self.session = None
+        session.expiry.cancel()
+        session.sampler.stop()
+        try:
+            self.last = session.write(reason)
+        except OSError as e:
+            print(f"Could not write profile {session.id}: {e}")
+            self.last = {**session.status(), "stopped": reason, "error": str(e)}
+            return self.last
+        print(f"🔬 Profiling session {session.id} finished ({reason}): {self.last['stacks_file']}")
+        return self.last
+
+    def _expire(self, session: ProfileSession):
+        if self.session is session:
+            self.stop("time limit")
+
+    def request_done(self, timer: RequestTimer):
+        session = self.session
+        if session is None:
+            return
+        session.timings.append(timer.to_dict())
+        if not session.remaining:
+            self.stop("request limit")
+
+    def record_lag(self, lag: float):
+        if self.session is not None:
+            self.session.lag.append(lag)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "active": self.session.status() if self.session else None,
+            "last": self.last,
+        }
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes a sleeping task"""
+
+    def __init__(self, profiler: Optional[Profiler] = None, interval: float = EVENT_LOOP_LAG_INTERVAL):
+        self.profiler = profiler
+        self.interval = interval
+        self.last = 0.0
+        self.max = 0.0
+
+    async def run(self):
+        histogram = metrics.EVENT_LOOP_LAG.labels()
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self.last = lag
+            self.max = max(self.max, lag)
+            histogram.observe(lag)
+            if self.profiler is not None:
+                self.profiler.record_lag(lag)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "interval_s": self.interval,
+            "last_ms": round(self.last * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class ProfilingMiddleware:
+    """ASGI middleware timing each request while a profiling session runs"""
+
+    def __init__(self, app, profiler: Profiler, exclude: tuple = ("/admin/",)):
+        self.app = app
+        self.profiler = profiler
+        self.exclude = exclude
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or self.profiler.session is None
+                or scope["path"].startswith(self.exclude)):
+            await self.app(scope, receive, send)
+            return
+
+        # Only the step is kept from the query: it may carry a hire's name
+        step = None
+        for pair in scope.get("query_string", b"").decode("latin-1").split("&"):
+            if pair.startswith("step="):
+                step = pair[5:]
+        timer = RequestTimer(scope["method"], scope["path"], step)
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                timer.mark("response_start")
+                timer.status = message["status"]
+                for name, value in message.get("headers", []):
+                    if name.lower() == b"x-audio-cache":
+                        timer.cache = value.decode("latin-1")
+            elif message["type"] == "http.response.body" and message.get("body"):
+                timer.mark("first_body")
+                timer.bytes += len(message["body"])
+            await send(message)
+
+        token = _current_timer.set(timer)
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            _current_timer.reset(token)
+            timer.marks["total"] = time.perf_counter() - timer.start
+            self.profiler.request_done(timer)
@@ -0,0 +1,51 @@
+"""
+Retry classification and backoff for OpenAI API calls.
+
+Shared by the TTS server (tts_limiter, circuit_breaker) and the agent
+build CLIs, so neither has to import the other's modules.
+"""
+
+import random
+from typing import Optional
+
+
+def status_code(exc: BaseException) -> Optional[int]:
+    """HTTP status of a failed upstream call, if it carries one"""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def retry_reason(exc: BaseException) -> Optional[str]:
+    """Why an error is worth retrying, or None if it is not"""
+    status = status_code(exc)
+    if status is not None:
+        return str(status) if status == 429 or status >= 500 else None
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return "connection"
+    try:
+        from openai import APIConnectionError
+    except ImportError:
+        return None
+    return "connection" if isinstance(exc, APIConnectionError) else None
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds the server asked us to wait, from a Retry-After header"""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float, cap: float, exc: Optional[BaseException] = None) -> float:
+    """Full-jitter exponential backoff for a 1-based attempt number"""
+    delay = random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+    requested = retry_after(exc) if exc is not None else None
+    if requested is not None:
+        delay = max(delay, min(requested, cap))
+    return delay
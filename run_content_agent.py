@@ -6,15 +6,26 @@ Generates voice agent content from company documents.
 
 import os
 import sys
+import json
+import time
+import hashlib
+import argparse
 import asyncio
 from pathlib import Path
+from typing import Any, Dict, List, Optional
 from dotenv import load_dotenv
 from content_agent import create_voice_agent_content
-from agent_config import MODEL_NAME
+from agent_config import CONTENT_AGENT_MODE, MODEL_NAME
+from llm_cache import llm_cache
+from retry import backoff_delay, retry_reason
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Batch mode: agents built at once, and attempts per agent on rate-limit or server errors
+BATCH_CONCURRENCY = int(os.getenv("CONTENT_BATCH_CONCURRENCY", 4))
+BATCH_ATTEMPTS = int(os.getenv("CONTENT_BATCH_ATTEMPTS", 3))
+
 
 def list_available_documents():
     """List all available documents in ACME_docs."""
@@ -38,7 +49,7 @@ def get_user_input(prompt: str, default: str = None) -> str:
             print("This field is required. Please provide a value.")
 
 
-async def interactive_mode():
+async def interactive_mode(mode: str = CONTENT_AGENT_MODE):
     """Run the content agent in interactive mode."""
     print("\n🤖 ACME Content Agent - Voice Agent Generator")
     print("=" * 60)
@@ -107,9 +118,16 @@ async def interactive_mode():
         result = await create_voice_agent_content(
             source_document=str(selected_doc),
             agent_name=agent_name,
-            agent_personality=personality
+            agent_personality=personality,
+            mode=mode
         )
         
+        if result.get("status") == "failed":
+            print(f"\n❌ Generation failed: {'; '.join(result.get('issues') or [])}")
+            return
+        if result.get("status") == "completed_with_issues":
+            print(f"\n⚠️  Created with unresolved issues: {'; '.join(result['issues'])}")
+        
         print("\n✅ Success! Voice agent content created:")
         print(f"  📁 voice_agent/{agent_name}/")
         print(f"     📄 instructor.txt - Personality and tone instructions")
@@ -123,13 +141,94 @@ async def interactive_mode():
     # Offer to create another
     another = get_user_input("\n\nCreate another agent? (y/n)", "n").lower()
     if another == 'y':
-        await interactive_mode()
+        await interactive_mode(mode)
+
+
+def agent_fingerprint(config: Dict[str, Any], mode: str) -> str:
+    """Changes whenever an agent's inputs do, so edited entries are rebuilt"""
+    # An edited document rebuilds the agent even though its path is unchanged
+    try:
+        stat = os.stat(config["source_document"])
+        document = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    except OSError:
+        document = None
+    payload = json.dumps(
+        {
+            "agent_name": config["agent_name"],
+            "source_document": config["source_document"],
+            "document": document,
+            "personality": config["personality"],
+            "mode": mode,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class BatchJournal:
+    """Append-only JSON lines record of batch progress, read back to resume"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.completed: Dict[str, str] = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A line cut short by an interrupted run
+                        continue
+                    if entry.get("status") == "completed":
+                        self.completed[entry["agent"]] = entry["fingerprint"]
+                    elif entry.get("status") in ("failed", "completed_with_issues"):
+                        self.completed.pop(entry["agent"], None)
+
+    def is_done(self, agent_name: str, fingerprint: str) -> bool:
+        return self.completed.get(agent_name) == fingerprint
+
+    def record(self, agent_name: str, fingerprint: str, status: str, **fields):
+        entry = {"agent": agent_name, "fingerprint": fingerprint, "status": status, "time": time.time(), **fields}
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if status == "completed":
+            self.completed[agent_name] = fingerprint
+
+
+async def build_agent(config: Dict[str, Any], mode: str, attempts: int = BATCH_ATTEMPTS) -> Dict[str, Any]:
+    """Build one agent, retrying rate-limit, server and connection errors"""
+    for attempt in range(1, attempts + 1):
+        try:
+            return await create_voice_agent_content(
+                source_document=config['source_document'],
+                agent_name=config['agent_name'],
+                agent_personality=config['personality'],
+                mode=mode
+            )
+        except Exception as e:
+            reason = retry_reason(e)
+            if reason is None or attempt == attempts:
+                raise
+            delay = backoff_delay(attempt, base=2.0, cap=60.0, exc=e)
+            print(f"⏳ {config['agent_name']}: {reason} error, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
 
 
-async def batch_mode(config_file: str):
-    """Run the content agent in batch mode with a config file."""
-    import json
+async def batch_mode(
+    config_file: str,
+    concurrency: int = BATCH_CONCURRENCY,
+    journal_file: Optional[str] = None,
+    restart: bool = False,
+    mode: str = CONTENT_AGENT_MODE
+):
+    """Run the content agent in batch mode with a config file.
     
+    Up to `concurrency` agents are built at once. Progress is journaled next
+    to the config file, so re-running the same command after an interruption
+    or failures only builds the agents that have not completed.
+    """
     try:
         with open(config_file, 'r') as f:
             configs = json.load(f)
@@ -137,23 +236,83 @@ async def batch_mode(config_file: str):
         print(f"Error reading config file: {e}")
         return
     
-    print(f"\n🤖 Running batch generation for {len(configs)} agents...")
+    journal_path = Path(journal_file) if journal_file else Path(config_file).with_suffix(".journal.jsonl")
+    if restart:
+        journal_path.unlink(missing_ok=True)
+    journal = BatchJournal(journal_path)
     
-    for config in configs:
-        print(f"\n📍 Creating {config['agent_name']}...")
-        try:
-            await create_voice_agent_content(
-                source_document=config['source_document'],
-                agent_name=config['agent_name'],
-                agent_personality=config['personality']
-            )
-            print(f"✅ {config['agent_name']} created successfully")
-        except Exception as e:
-            print(f"❌ Error creating {config['agent_name']}: {e}")
+    pending = [config for config in configs if not journal.is_done(config['agent_name'], agent_fingerprint(config, mode))]
+    skipped = len(configs) - len(pending)
+    print(f"\n🤖 Running batch generation for {len(pending)} agents ({mode} mode, {concurrency} at a time)...")
+    if skipped:
+        print(f"⏭️  Skipping {skipped} agents already completed (journal: {journal_path})")
+    
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    results: List[Dict[str, Any]] = []
+    batch_start = time.perf_counter()
+    
+    async def run_one(config: Dict[str, Any]):
+        agent_name = config['agent_name']
+        fingerprint = agent_fingerprint(config, mode)
+        async with semaphore:
+            print(f"\n📍 Creating {agent_name}...")
+            journal.record(agent_name, fingerprint, "started")
+            start = time.perf_counter()
+            try:
+                result = await build_agent(config, mode)
+            except Exception as e:
+                seconds = round(time.perf_counter() - start, 2)
+                journal.record(agent_name, fingerprint, "failed", seconds=seconds, error=str(e))
+                results.append({"agent": agent_name, "status": "failed", "seconds": seconds})
+                print(f"❌ Error creating {agent_name} after {seconds}s: {e}")
+                return
+            seconds = round(time.perf_counter() - start, 2)
+            result = result if isinstance(result, dict) else {}
+            status = result.get("status", "completed")
+            issues = result.get("issues") or []
+            journal.record(agent_name, fingerprint, status, seconds=seconds, timings=result.get("timings"), issues=issues)
+            results.append({"agent": agent_name, "status": status, "seconds": seconds})
+            if status == "completed":
+                print(f"✅ {agent_name} created successfully in {seconds}s")
+            else:
+                # Not journaled as done, so the next run rebuilds it
+                print(f"{'⚠️ ' if status == 'completed_with_issues' else '❌'} {agent_name} {status} "
+                      f"in {seconds}s: {'; '.join(issues) or 'no details'}")
+    
+    await asyncio.gather(*(run_one(config) for config in pending))
+    
+    if results:
+        print(f"\n{'agent':<32}{'status':>22}{'seconds':>10}")
+        for result in sorted(results, key=lambda r: -r["seconds"]):
+            print(f"{result['agent']:<32}{result['status']:>22}{result['seconds']:>10}")
+    failed = sum(1 for result in results if result["status"] == "failed")
+    with_issues = sum(1 for result in results if result["status"] == "completed_with_issues")
+    print(f"\n✨ Done in {time.perf_counter() - batch_start:.1f}s: "
+          f"{len(results) - failed - with_issues} created, {with_issues} with issues, "
+          f"{failed} failed, {skipped} skipped")
+    if llm_cache.hits:
+        print(f"💾 {llm_cache.hits} model responses served from the LLM cache")
+    if failed or with_issues:
+        print("Re-run the same command to retry the failed agents and those with issues.")
 
 
 def main():
     """Main entry point."""
+    parser = argparse.ArgumentParser(description="Generate voice agent content from company documents")
+    parser.add_argument("--batch", metavar="CONFIG", help="Build every agent in a JSON config file")
+    parser.add_argument("--concurrency", "-c", type=int, default=BATCH_CONCURRENCY,
+                        help=f"Agents built at once in batch mode (default: {BATCH_CONCURRENCY})")
+    parser.add_argument("--journal", help="Batch progress journal (default: <config>.journal.jsonl)")
+    parser.add_argument("--restart", action="store_true", help="Ignore the journal and rebuild every agent")
+    parser.add_argument("--mode", choices=["handoff", "pipeline"], default=CONTENT_AGENT_MODE,
+                        help=f"Content generation mode (default: {CONTENT_AGENT_MODE})")
+    parser.add_argument("--no-llm-cache", action="store_true",
+                        help="Always call the model, ignoring cached responses")
+    args = parser.parse_args()
+    
+    if args.no_llm_cache:
+        llm_cache.disable()
+    
     # Check for OpenAI API key
     if not os.getenv("OPENAI_API_KEY"):
         print("❌ Error: OPENAI_API_KEY environment variable not set")
@@ -161,17 +320,14 @@ def main():
         print("  export OPENAI_API_KEY='your-api-key-here'")
         sys.exit(1)
     
-    # Check for batch mode
-    if len(sys.argv) > 1:
-        if sys.argv[1] == "--batch" and len(sys.argv) > 2:
-            asyncio.run(batch_mode(sys.argv[2]))
-        else:
-            print("Usage:")
-            print("  python run_content_agent.py          # Interactive mode")
-            print("  python run_content_agent.py --batch config.json  # Batch mode")
+    if args.batch:
+        try:
+            asyncio.run(batch_mode(args.batch, args.concurrency, args.journal, args.restart, args.mode))
+        except KeyboardInterrupt:
+            print("\n⏸️  Interrupted. Re-run the same command to resume.")
     else:
-        asyncio.run(interactive_mode())
+        asyncio.run(interactive_mode(args.mode))
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
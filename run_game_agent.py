@@ -13,7 +13,9 @@ from pathlib import Path
 from typing import List, Dict, Any
 from datetime import datetime
 
+from doc_digest import digest_sections, ensure_digest, needs_digest
 from game_generation_agent import GameGenerationAgent
+from llm_cache import llm_cache
 from game_agent_config import (
     GAME_MODEL_NAME, FALLBACK_MODELS, OUTPUT_PATHS, 
     GAME_SETTINGS, SCENE_TEMPLATES
@@ -37,26 +39,15 @@ async def generate_full_game(
     print(f"📄 Source document: {document_path}")
     print(f"🤖 Using model: {model}\n")
     
-    # Read the onboarding document
-    with open(document_path, 'r') as f:
-        content = f.read()
+    # Initialize the agent; the assistant is created on the first uncached prompt
+    agent = GameGenerationAgent(model=model, fallback_model=FALLBACK_MODELS[0])
     
-    # Initialize the agent
-    agent = GameGenerationAgent(model=model)
-    
-    try:
-        await agent.create_agent()
-    except Exception as e:
-        if "o3" in str(e) and model == "o3":
-            print(f"⚠️  Model {model} not available. Trying fallback...")
-            model = FALLBACK_MODELS[0]
-            agent = GameGenerationAgent(model=model)
-            await agent.create_agent()
-        else:
-            raise
-    
-    # Parse document sections
-    sections = parse_document_sections(content)
+    # Parse document sections; large documents are condensed into one topic per scene
+    if needs_digest(Path(document_path)):
+        sections = digest_sections(await ensure_digest(Path(document_path)))
+    else:
+        with open(document_path, 'r') as f:
+            sections = parse_document_sections(f.read())
     
     # Generate scenes for each section
     generated_scenes = []
@@ -104,7 +95,7 @@ async def generate_full_game(
     # Generate summary
     summary = {
         "game_name": game_name,
-        "model_used": model,
+        "model_used": agent.model,
         "source_document": document_path,
         "generated_at": datetime.now().isoformat(),
         "scenes": [
@@ -139,7 +130,6 @@ async def generate_single_scene(
     """Generate a single game scene"""
     
     agent = GameGenerationAgent(model=model)
-    await agent.create_agent()
     
     result = await agent.generate_game_scene(
         scene_name=scene_name,
@@ -170,7 +160,6 @@ async def enhance_scene(
         scene_code = f.read()
     
     agent = GameGenerationAgent(model=model)
-    await agent.create_agent()
     
     result = await agent.enhance_existing_scene(
         scene_code=scene_code,
@@ -343,9 +332,17 @@ async def main():
         choices=["visual", "gameplay", "accessibility", "educational", "performance"],
         help="Type of enhancement"
     )
+    parser.add_argument(
+        "--no-llm-cache",
+        action="store_true",
+        help="Always call the model, ignoring cached responses"
+    )
     
     args = parser.parse_args()
     
+    if args.no_llm_cache:
+        llm_cache.disable()
+    
     # Ensure output directories exist
     ensure_directories()
     
@@ -0,0 +1,217 @@
+"""
+Compiled index of voice agent scripts.
+
+Scripts are parsed once into sections, speakers and dialogue lines, and the
+text for every step is resolved up front so serving a step is a dict lookup.
+
+A step is what the agent says before the hire has to answer: it ends at the
+first stage direction after dialogue ("New Hire responds.", "If correct:")
+or at the first line with a placeholder such as <Name>, which would
+otherwise be read aloud in audio shared by every hire. The full lines of
+steps with placeholders are kept as templates for personalized renders.
+The compiled index is stored next to the script as a sidecar file and rebuilt
+whenever the script's modification time or size changes.
+
+Recognized section headers:
+    0. WARM-UP & NAME CONFIRMATION
+    #### 1. Introduction
+    Section 2: Benefits
+"""
+
+import json
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Bump when the index layout changes so stale sidecars are rebuilt
+INDEX_VERSION = 3
+SIDECAR_NAME = ".script_index.json"
+
+# Matches the number of dialogue lines the server has always used per step
+STEP_DIALOGUE_LINES = 5
+DEFAULT_DIALOGUE_LINES = 3
+
+SECTION_PATTERN = re.compile(r"^(?:#+\s*)?(?:Section\s+)?(\d+)\s*[.:]\s*(.*?)\s*$", re.IGNORECASE)
+SPEAKER_PATTERN = re.compile(
+    r"^([A-Z][\w.'’-]*(?:\s+[A-Z][\w.'’-]*)*)\s*(?:\([^)]*\))?\s*:\s*(.*)$"
+)
+RULE_PATTERN = re.compile(r"^[─━=\-_*]{3,}$")
+SLOT_PATTERN = re.compile(r"<([A-Za-z][A-Za-z_]*)>")
+# A slot with the comma or spaces before it, e.g. ", <Name>" in "Fantastic form, <Name>—"
+SLOT_CLAUSE_PATTERN = re.compile(r"[,\s]*<[A-Za-z][A-Za-z_]*>")
+OPEN_QUOTES = ('"', '“')
+CLOSE_QUOTES = ('"', '”')
+
+
+def _strip_quotes(text: str) -> str:
+    if text[:1] in OPEN_QUOTES:
+        text = text[1:]
+    if text[-1:] in CLOSE_QUOTES:
+        text = text[:-1]
+    return text.strip()
+
+
+def _closes_quote(text: str, opened_here: bool) -> bool:
+    """Whether a line of quoted text ends the quotation"""
+    stripped = text.rstrip('.,!?;')
+    if not stripped.endswith(CLOSE_QUOTES):
+        return False
+    # A lone opening quote on its own line does not close itself
+    return not (opened_here and len(stripped) == 1)
+
+
+def strip_slots(text: str) -> str:
+    """Text with its placeholders removed, for audio shared by every hire"""
+    return SLOT_CLAUSE_PATTERN.sub("", text).strip()
+
+
+def compile_script(script_content: str) -> Dict[str, Any]:
+    """Parse a script into sections, speakers and per-step dialogue"""
+    sections: List[Dict[str, Any]] = []
+    speakers: Counter = Counter()
+    current_speaker: Optional[str] = None
+    quote: Optional[List[str]] = None
+    # A stage direction after dialogue: the next line follows the hire's answer
+    after_reply = False
+
+    def add_line(text: str):
+        nonlocal after_reply
+        text = " ".join(_strip_quotes(text).split())
+        if not text:
+            return
+        if not sections:
+            sections.append({"number": None, "title": "", "lines": []})
+        sections[-1]["lines"].append({"speaker": current_speaker, "text": text, "after_reply": after_reply})
+        after_reply = False
+        if current_speaker:
+            speakers[current_speaker] += 1
+
+    for raw_line in script_content.split('\n'):
+        line = raw_line.strip()
+
+        # Continue a multi-line quotation until its closing quote
+        if quote is not None:
+            quote.append(line)
+            if _closes_quote(line, opened_here=False):
+                add_line(" ".join(quote))
+                quote = None
+            continue
+
+        if not line or RULE_PATTERN.match(line):
+            continue
+
+        section_match = SECTION_PATTERN.match(line)
+        if section_match:
+            sections.append({
+                "number": section_match.group(1),
+                "title": section_match.group(2),
+                "lines": [],
+            })
+            current_speaker = None
+            after_reply = False
+            continue
+
+        speaker_match = SPEAKER_PATTERN.match(line)
+        if speaker_match:
+            current_speaker = speaker_match.group(1)
+            line = speaker_match.group(2).strip()
+            if not line:
+                continue
+
+        if line.startswith(OPEN_QUOTES):
+            if _closes_quote(line, opened_here=True):
+                add_line(line)
+            else:
+                quote = [line]
+        elif speaker_match:
+            # Unquoted dialogue on the speaker line itself
+            add_line(line)
+        elif sections and sections[-1]["lines"]:
+            after_reply = True
+
+    if quote is not None:
+        add_line(" ".join(quote))
+
+    primary_speaker = speakers.most_common(1)[0][0] if speakers else None
+
+    def dialogue(lines: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [
+            line for line in lines
+            if primary_speaker is None or line["speaker"] in (primary_speaker, None)
+        ]
+
+    def shared(lines: List[Dict[str, Any]]) -> List[str]:
+        """Lines up to the first answer or placeholder"""
+        texts: List[str] = []
+        for line in lines:
+            if line["after_reply"]:
+                break
+            if SLOT_PATTERN.search(line["text"]):
+                # A step that opens with a placeholder is spoken without it
+                if not texts:
+                    texts.append(strip_slots(line["text"]))
+                break
+            texts.append(line["text"])
+        return texts
+
+    # Step N is the Nth section in the script; its lines are kept for segment rendering
+    steps = {}
+    step_lines = {}
+    step_templates = {}
+    for position, section in enumerate(sections, 1):
+        section_dialogue = dialogue(section["lines"])
+        lines = shared(section_dialogue)[:STEP_DIALOGUE_LINES]
+        if lines:
+            step_lines[str(position)] = lines
+            steps[str(position)] = " ".join(lines)
+        template = [line["text"] for line in section_dialogue[:STEP_DIALOGUE_LINES]]
+        if any(SLOT_PATTERN.search(text) for text in template):
+            step_templates[str(position)] = template
+
+    all_dialogue = dialogue([line for section in sections for line in section["lines"]])
+    default_lines = shared(all_dialogue)[:DEFAULT_DIALOGUE_LINES]
+
+    return {
+        "version": INDEX_VERSION,
+        "primary_speaker": primary_speaker,
+        "speakers": dict(speakers),
+        "sections": sections,
+        "steps": steps,
+        "step_lines": step_lines,
+        "step_templates": step_templates,
+        "default_input": " ".join(default_lines),
+        "default_lines": default_lines,
+    }
+
+
+def load_script_index(script_path: Path) -> Dict[str, Any]:
+    """Load the compiled index for a script, rebuilding the sidecar if stale"""
+    script_path = Path(script_path)
+    sidecar_path = script_path.parent / SIDECAR_NAME
+    stat = script_path.stat()
+    source = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+    try:
+        with open(sidecar_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get("version") == INDEX_VERSION and index.get("source") == source:
+            return index
+    except (OSError, ValueError):
+        pass
+
+    with open(script_path, 'r', encoding='utf-8') as f:
+        index = compile_script(f.read())
+    index["source"] = source
+
+    try:
+        tmp_path = sidecar_path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, sidecar_path)
+    except OSError as e:
+        # A read-only deployment still works, it just recompiles on startup
+        print(f"Could not write script index for {script_path}: {e}")
+
+    return index
@@ -0,0 +1,166 @@
+"""
+Single-flight coalescing of identical in-flight audio renders.
+
+The first request for a content key opens the upstream TTS stream in a
+background task. Identical requests that arrive while it is running attach
+to the same render instead of opening their own: recent bytes are served from
+a bounded in-memory ring buffer, and clients that fall behind the ring catch
+up from the spill file the render is written to. The upstream reader never
+waits for clients, so a slow client cannot hold back the others.
+"""
+
+import asyncio
+import os
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Optional, Tuple
+
+from audio_cache import READ_CHUNK_SIZE, AudioCache
+
+# Per-render memory bound for the shared ring buffer
+AUDIO_RING_BUFFER_BYTES = int(os.getenv("AUDIO_RING_BUFFER_BYTES", 1024 * 1024))
+
+
+class SharedStream:
+    """One upstream render shared by every request for the same content"""
+
+    def __init__(
+        self,
+        key: str,
+        ext: str,
+        cache: AudioCache,
+        source: AsyncIterator[bytes],
+        ring_bytes: int = AUDIO_RING_BUFFER_BYTES,
+    ):
+        self.key = key
+        self.ext = ext
+        self.size = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+
+        self._cache = cache
+        self._source = source
+        self._ring: Deque[Tuple[int, bytes]] = deque()
+        self._ring_start = 0
+        self._ring_bytes = 0
+        self._ring_limit = ring_bytes
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        # Every byte is spilled to disk so late joiners can replay the head
+        self.path = cache.tmp_path(key, ext)
+        self._spill = open(self.path, "wb", buffering=0)
+
+    def start(self, on_done=None):
+        self._task = asyncio.create_task(self._run(on_done))
+
+    async def _run(self, on_done):
+        try:
+            async for chunk in self._source:
+                self._spill.write(chunk)
+                self._append(chunk)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self._spill.close()
+
+        if self.error is None:
+            self.path = self._cache.put_file(self.key, self.ext, self.path)
+        else:
+            if not isinstance(self.error, asyncio.CancelledError):
+                print(f"Audio render failed for {self.key}: {self.error!r}")
+            self.path.unlink(missing_ok=True)
+
+        self.done = True
+        if on_done:
+            on_done()
+        self._notify()
+
+    async def wait(self):
+        """Wait for the render to finish without cancelling it if the waiter is"""
+        await asyncio.shield(self._task)
+
+    def cancel(self) -> bool:
+        """Abort the render, but only if no client is reading it"""
+        if self.subscribers or self.done:
+            return False
+        self._task.cancel()
+        return True
+
+    def _append(self, chunk: bytes):
+        self._ring.append((self.size, chunk))
+        self._ring_bytes += len(chunk)
+        self.size += len(chunk)
+
+        # Keep at least the newest chunk so live readers never touch disk
+        while self._ring_bytes > self._ring_limit and len(self._ring) > 1:
+            _, dropped = self._ring.popleft()
+            self._ring_bytes -= len(dropped)
+            self._ring_start += len(dropped)
+
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _ring_chunk(self, offset: int) -> bytes:
+        for start, chunk in self._ring:
+            if start + len(chunk) > offset:
+                return chunk[offset - start:]
+        return b""
+
+    def subscribe(self) -> AsyncIterator[bytes]:
+        """Attach a client, returning an iterator over the full rendering"""
+        # Open the spill file now, while it is guaranteed to exist; the
+        # handle stays valid after the file is renamed into the cache.
+        spill = open(self.path, "rb")
+        self.subscribers += 1
+        return self._iterate(spill)
+
+    async def _iterate(self, spill) -> AsyncIterator[bytes]:
+        offset = 0
+        try:
+            while True:
+                if offset < self._ring_start:
+                    # Fell behind the ring buffer: catch up from disk
+                    length = min(READ_CHUNK_SIZE, self._ring_start - offset)
+                    data = await asyncio.to_thread(os.pread, spill.fileno(), length, offset)
+                elif offset < self.size:
+                    data = self._ring_chunk(offset)
+                elif self.done:
+                    if self.error is not None:
+                        raise RuntimeError("Upstream audio render failed") from self.error
+                    return
+                else:
+                    await self._changed.wait()
+                    continue
+
+                offset += len(data)
+                yield data
+        finally:
+            spill.close()
+            self.subscribers -= 1
+
+
+class SingleFlight:
+    """Registry of in-flight renders keyed by content key and format"""
+
+    def __init__(self, cache: AudioCache, ring_bytes: int = AUDIO_RING_BUFFER_BYTES):
+        self.cache = cache
+        self.ring_bytes = ring_bytes
+        self._streams: Dict[str, SharedStream] = {}
+
+    def get(self, key: str, ext: str = "mp3") -> Optional[SharedStream]:
+        return self._streams.get(f"{key}.{ext}")
+
+    def start(self, key: str, source: AsyncIterator[bytes], ext: str = "mp3") -> SharedStream:
+        """Begin a new shared render; callers should check get() first"""
+        name = f"{key}.{ext}"
+        stream = SharedStream(key, ext, self.cache, source, self.ring_bytes)
+        self._streams[name] = stream
+        stream.start(on_done=lambda: self._streams.pop(name, None))
+        return stream
+
+    def __len__(self) -> int:
+        return len(self._streams)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Tests for the structural checks run on generated conversation states.
+
+check_consistency and parse_states must report malformed model output, not
+crash on it. Runs with pytest or directly: python test_check_consistency.py
+"""
+
+import json
+
+from content_agent import check_consistency, parse_states
+
+SCRIPT = """1. WELCOME
+Coach: "Welcome aboard!"
+
+2. BENEFITS
+Coach: "Let's talk benefits."
+"""
+
+
+def state(state_id, next_step=None):
+    return {
+        "id": state_id,
+        "description": "A step",
+        "examples": ["Hello"],
+        "transitions": [{"next_step": next_step}] if next_step else [],
+    }
+
+
+def test_valid_states():
+    states = json.dumps([state("1_welcome", "2_benefits"), state("2_benefits")])
+    assert check_consistency(SCRIPT, states) == []
+
+
+def test_state_that_is_not_an_object():
+    issues = check_consistency(SCRIPT, json.dumps(["1_intro"]))
+    assert "State #1 is not an object" in issues
+
+
+def test_transition_that_is_not_an_object():
+    broken = {**state("1_welcome"), "transitions": ["2_benefits"]}
+    states, issues = parse_states(json.dumps([broken, state("2_benefits")]))
+    assert states is not None
+    assert issues == ["State 1_welcome has a transition that is not an object"]
+
+
+def test_transitions_that_are_not_an_array():
+    broken = {**state("1_welcome"), "transitions": "2_benefits"}
+    _, issues = parse_states(json.dumps([broken, state("2_benefits")]))
+    assert issues == ["State 1_welcome transitions must be an array"]
+
+
+def test_mixed_entries():
+    issues = check_consistency(SCRIPT, json.dumps([state("1_welcome", "9_gone"), 42, None]))
+    assert "State 1_welcome transitions to unknown state 9_gone" in issues
+    assert "State #2 is not an object" in issues
+    assert "State #3 is not an object" in issues
+
+
+def test_not_an_array_or_not_json():
+    assert parse_states('{"id": "1_welcome"}') == (None, ["conversation_states must be a JSON array of states"])
+    states, issues = parse_states("[{")
+    assert states is None and issues[0].startswith("conversation_states is not valid JSON")
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
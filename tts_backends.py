@@ -0,0 +1,171 @@
+"""
+Text-to-speech backends for the audio server.
+
+The server streams every rendering through a TTSBackend, selected with the
+TTS_BACKEND environment variable:
+
+    openai  OpenAI's speech API (default)
+    fake    Offline, deterministic silent MP3 with a configurable bitrate and
+            latency profile, for CI and load tests without network access
+"""
+
+import asyncio
+import hashlib
+import math
+import os
+import random
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, Optional
+
+from mp3_frames import silent_frame
+
+# Backend selection
+TTS_BACKEND = os.getenv("TTS_BACKEND", "openai")
+
+# Fake backend profile
+FAKE_TTS_BITRATE = int(os.getenv("FAKE_TTS_BITRATE", 64))
+FAKE_TTS_FIRST_BYTE_LATENCY = float(os.getenv("FAKE_TTS_FIRST_BYTE_LATENCY", 0.3))
+FAKE_TTS_JITTER = float(os.getenv("FAKE_TTS_JITTER", 0.1))
+# How much faster than real time audio is produced; 0 streams without pacing
+FAKE_TTS_SPEED = float(os.getenv("FAKE_TTS_SPEED", 4.0))
+FAKE_TTS_CHARS_PER_SECOND = float(os.getenv("FAKE_TTS_CHARS_PER_SECOND", 15))
+FAKE_TTS_FRAMES_PER_CHUNK = int(os.getenv("FAKE_TTS_FRAMES_PER_CHUNK", 20))
+# Fraction of calls failing with a 429 before the first byte
+FAKE_TTS_ERROR_RATE = float(os.getenv("FAKE_TTS_ERROR_RATE", 0))
+
+FAKE_SAMPLE_RATE = 48000
+FAKE_SAMPLES_PER_FRAME = 1152
+
+
+class TTSBackendError(Exception):
+    """An upstream failure with the HTTP status it would have returned"""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TTSBackend(ABC):
+    """Streams synthesized audio for a step config"""
+
+    name = "base"
+    # Response formats the backend can produce
+    formats = ("mp3",)
+
+    def __init__(self, model: str):
+        self.model = model
+
+    @property
+    def model_id(self) -> str:
+        """Identifies this backend's renderings in audio cache keys"""
+        return self.model
+
+    @abstractmethod
+    def stream(self, step_config: Dict[str, str], response_format: str = "mp3") -> AsyncIterator[bytes]:
+        """Synthesize a step config's input as a stream of encoded audio"""
+
+
+class OpenAITTSBackend(TTSBackend):
+    """OpenAI speech API, streamed as it is generated"""
+
+    name = "openai"
+    formats = ("mp3", "opus", "aac", "flac", "wav")
+
+    def __init__(self, model: str, client=None):
+        super().__init__(model)
+        self._client = client
+
+    @property
+    def client(self):
+        # Created on first use so importing the server needs no API key
+        if self._client is None:
+            from openai import AsyncOpenAI
+            # Retries are scheduled by tts_limiter, outside the concurrency slot
+            self._client = AsyncOpenAI(max_retries=0)
+        return self._client
+
+    async def stream(self, step_config: Dict[str, str], response_format: str = "mp3") -> AsyncIterator[bytes]:
+        async with self.client.audio.speech.with_streaming_response.create(
+            model=self.model,
+            voice=step_config["voice"],
+            input=step_config["input"],
+            instructions=step_config["instructions"],
+            response_format=response_format,
+        ) as response:
+            async for chunk in response.iter_bytes():
+                yield chunk
+
+
+class FakeTTSBackend(TTSBackend):
+    """Deterministic offline backend emitting valid silent MP3 frames
+
+    Output length follows the input length (FAKE_TTS_CHARS_PER_SECOND) and
+    timing follows a simple profile: a first-byte latency with seeded jitter,
+    then frames paced at FAKE_TTS_SPEED times real time. The same input always
+    produces the same bytes and the same delays.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        model: str,
+        bitrate_kbps: int = FAKE_TTS_BITRATE,
+        first_byte_latency: float = FAKE_TTS_FIRST_BYTE_LATENCY,
+        jitter: float = FAKE_TTS_JITTER,
+        speed: float = FAKE_TTS_SPEED,
+        chars_per_second: float = FAKE_TTS_CHARS_PER_SECOND,
+        frames_per_chunk: int = FAKE_TTS_FRAMES_PER_CHUNK,
+        error_rate: float = FAKE_TTS_ERROR_RATE,
+    ):
+        super().__init__(model)
+        self.bitrate_kbps = bitrate_kbps
+        self.first_byte_latency = first_byte_latency
+        self.jitter = jitter
+        self.speed = speed
+        self.chars_per_second = chars_per_second
+        self.frames_per_chunk = frames_per_chunk
+        self.error_rate = error_rate
+        self._frame = silent_frame(bitrate_kbps)
+
+    @property
+    def model_id(self) -> str:
+        # Never share cache entries with real renderings
+        return f"fake-{self.bitrate_kbps}k:{self.model}"
+
+    def frame_count(self, text: str) -> int:
+        seconds = max(len(text), 1) / self.chars_per_second
+        return math.ceil(seconds * FAKE_SAMPLE_RATE / FAKE_SAMPLES_PER_FRAME)
+
+    async def stream(self, step_config: Dict[str, str], response_format: str = "mp3") -> AsyncIterator[bytes]:
+        if response_format != "mp3":
+            raise ValueError(f"Fake TTS backend only produces mp3, not {response_format}")
+
+        text = step_config["input"]
+        seed = hashlib.sha256(text.encode("utf-8")).digest()
+        rng = random.Random(seed)
+
+        latency = self.first_byte_latency * (1 + rng.uniform(-self.jitter, self.jitter))
+        if latency > 0:
+            await asyncio.sleep(latency)
+        # Unseeded so a retry of the same input can succeed
+        if self.error_rate and random.random() < self.error_rate:
+            raise TTSBackendError("Fake TTS rate limit exceeded", status_code=429)
+
+        frames = self.frame_count(text)
+        chunk_seconds = self.frames_per_chunk * FAKE_SAMPLES_PER_FRAME / FAKE_SAMPLE_RATE
+        for start in range(0, frames, self.frames_per_chunk):
+            count = min(self.frames_per_chunk, frames - start)
+            yield self._frame * count
+            if self.speed > 0 and start + count < frames:
+                await asyncio.sleep(chunk_seconds / self.speed)
+
+
+def create_backend(model: str, name: Optional[str] = None) -> TTSBackend:
+    """Create the configured TTS backend"""
+    name = name or TTS_BACKEND
+    if name == "openai":
+        return OpenAITTSBackend(model)
+    if name == "fake":
+        return FakeTTSBackend(model)
+    raise ValueError(f"Unknown TTS backend '{name}' (expected 'openai' or 'fake')")
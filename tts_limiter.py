@@ -0,0 +1,153 @@
+"""
+Concurrency limiting and retries for upstream TTS calls.
+
+Every render takes a slot from a TTSLimiter before it reaches the TTS
+backend: at most TTS_MAX_CONCURRENCY renders run at once, and at most
+TTS_MAX_PER_VOICE of them for any one voice. Renders beyond that wait in a
+fair queue (first come, first served, foreground before background) where a
+waiter blocked by its voice limit does not hold up other voices.
+
+Rate-limit (429), server (5xx) and connection errors are retried with
+jittered exponential backoff, honouring Retry-After, but only before the
+first audio byte: once a client has received audio the stream cannot be
+restarted. A burst therefore turns into queueing latency rather than errors.
+"""
+
+import asyncio
+import os
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, Optional
+
+import metrics
+from retry import backoff_delay, retry_reason
+
+# Upstream concurrency limits (0 disables the per-voice limit)
+TTS_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", 8))
+TTS_MAX_PER_VOICE = int(os.getenv("TTS_MAX_PER_VOICE", 4))
+
+# Retries before the first byte
+TTS_RETRY_ATTEMPTS = int(os.getenv("TTS_RETRY_ATTEMPTS", 4))
+TTS_RETRY_BASE_DELAY = float(os.getenv("TTS_RETRY_BASE_DELAY", 0.5))
+TTS_RETRY_MAX_DELAY = float(os.getenv("TTS_RETRY_MAX_DELAY", 8.0))
+
+# Queue priorities
+FOREGROUND = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {FOREGROUND: "foreground", BACKGROUND: "background"}
+
+
+class _Waiter:
+    __slots__ = ("voice", "priority", "future", "enqueued")
+
+    def __init__(self, voice: str, priority: int, future: asyncio.Future):
+        self.voice = voice
+        self.priority = priority
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+
+class TTSLimiter:
+    """Global and per-voice concurrency limits with a fair wait queue"""
+
+    def __init__(
+        self,
+        max_concurrency: int = TTS_MAX_CONCURRENCY,
+        max_per_voice: int = TTS_MAX_PER_VOICE,
+        attempts: int = TTS_RETRY_ATTEMPTS,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_per_voice = max_per_voice
+        self.attempts = max(1, attempts)
+        self.active = 0
+        self._per_voice: Counter = Counter()
+        self._queues: Dict[int, Deque[_Waiter]] = {FOREGROUND: deque(), BACKGROUND: deque()}
+
+    def _fits(self, voice: str) -> bool:
+        if self.active >= self.max_concurrency:
+            return False
+        return not self.max_per_voice or self._per_voice[voice] < self.max_per_voice
+
+    def _grant(self, voice: str):
+        self.active += 1
+        self._per_voice[voice] += 1
+        metrics.TTS_ACTIVE.labels(voice).inc()
+
+    def _dispatch(self):
+        """Hand free slots to the longest-waiting renders that fit"""
+        for priority, queue in sorted(self._queues.items()):
+            for waiter in list(queue):
+                if self.active >= self.max_concurrency:
+                    break
+                if waiter.future.done():
+                    queue.remove(waiter)
+                elif self._fits(waiter.voice):
+                    queue.remove(waiter)
+                    self._grant(waiter.voice)
+                    waiter.future.set_result(None)
+                    metrics.TTS_QUEUE_WAIT.labels(waiter.voice, PRIORITY_NAMES[priority]).observe(
+                        time.perf_counter() - waiter.enqueued
+                    )
+            metrics.TTS_QUEUE_DEPTH.labels(PRIORITY_NAMES[priority]).set(len(queue))
+
+    async def acquire(self, voice: str, priority: int = FOREGROUND):
+        waiter = _Waiter(voice, priority, asyncio.get_running_loop().create_future())
+        self._queues[priority].append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(voice)
+            elif waiter in self._queues[priority]:
+                self._queues[priority].remove(waiter)
+                metrics.TTS_QUEUE_DEPTH.labels(PRIORITY_NAMES[priority]).set(len(self._queues[priority]))
+            raise
+
+    def release(self, voice: str):
+        self.active -= 1
+        self._per_voice[voice] -= 1
+        if not self._per_voice[voice]:
+            del self._per_voice[voice]
+        metrics.TTS_ACTIVE.labels(voice).dec()
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, voice: str, priority: int = FOREGROUND):
+        await self.acquire(voice, priority)
+        try:
+            yield
+        finally:
+            self.release(voice)
+
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def stream(
+        self,
+        factory: Callable[[], AsyncIterator[bytes]],
+        voice: str,
+        priority: int = FOREGROUND,
+    ) -> AsyncIterator[bytes]:
+        """Run an upstream stream within the limits, retrying transient failures"""
+        for attempt in range(1, self.attempts + 1):
+            delay = None
+            async with self.slot(voice, priority):
+                source = factory()
+                started = False
+                try:
+                    async for chunk in source:
+                        started = True
+                        yield chunk
+                    return
+                except Exception as exc:
+                    reason = retry_reason(exc)
+                    if started or reason is None or attempt == self.attempts:
+                        raise
+                    metrics.TTS_RETRIES.labels(voice, reason).inc()
+                    delay = backoff_delay(attempt, TTS_RETRY_BASE_DELAY, TTS_RETRY_MAX_DELAY, exc=exc)
+                finally:
+                    await source.aclose()
+            # Back off without holding a slot other renders could use
+            await asyncio.sleep(delay)
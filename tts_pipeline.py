@@ -0,0 +1,111 @@
+"""
+Sentence-pipelined TTS synthesis.
+
+Long step inputs are split into sentence chunks that are synthesized
+concurrently with a small window. The first chunk is kept short so playback
+can start quickly, and chunks are streamed back in order as one contiguous
+MP3 stream: each clip is reduced to its bare audio frames so players see a
+single file rather than a sequence of tagged clips.
+"""
+
+import asyncio
+import os
+import re
+from typing import AsyncIterator, Callable, Dict, List
+
+from mp3_frames import FrameReader
+
+# Pipeline configuration
+PIPELINE_WINDOW = int(os.getenv("TTS_PIPELINE_WINDOW", 3))
+PIPELINE_FIRST_CHUNK_CHARS = int(os.getenv("TTS_PIPELINE_FIRST_CHUNK_CHARS", 120))
+PIPELINE_CHUNK_CHARS = int(os.getenv("TTS_PIPELINE_CHUNK_CHARS", 400))
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?…])[\"”’)]*\s+|\n\s*\n")
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+
+def split_chunks(
+    text: str,
+    first_chunk_chars: int = PIPELINE_FIRST_CHUNK_CHARS,
+    chunk_chars: int = PIPELINE_CHUNK_CHARS,
+) -> List[str]:
+    """Group sentences into chunks, keeping the first one short for fast playback"""
+    chunks: List[str] = []
+    current = ""
+    for sentence in split_sentences(text):
+        limit = first_chunk_chars if not chunks else chunk_chars
+        if current and len(current) + 1 + len(sentence) > limit:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def _synthesize_chunk(
+    synthesize: Callable[[Dict[str, str]], AsyncIterator[bytes]],
+    step_config: Dict[str, str],
+    queue: asyncio.Queue,
+):
+    """Feed one chunk's audio frames into its queue, ending with None"""
+    reader = FrameReader()
+    try:
+        async for data in synthesize(step_config):
+            frames = reader.feed(data)
+            if frames:
+                queue.put_nowait(frames)
+        frames = reader.flush()
+        if frames:
+            queue.put_nowait(frames)
+        queue.put_nowait(None)
+    except Exception as e:
+        queue.put_nowait(e)
+
+
+async def pipelined_stream(
+    step_config: Dict[str, str],
+    synthesize: Callable[[Dict[str, str]], AsyncIterator[bytes]],
+    window: int = PIPELINE_WINDOW,
+) -> AsyncIterator[bytes]:
+    """
+    Synthesize a step as concurrent sentence chunks and stream them in order.
+
+    At most `window` chunks are in flight at once: the chunk being streamed
+    to the client plus the ones synthesizing ahead of it.
+    """
+    chunks = split_chunks(step_config["input"])
+    if len(chunks) <= 1:
+        async for data in synthesize(step_config):
+            yield data
+        return
+
+    queues = [asyncio.Queue() for _ in chunks]
+    tasks: List[asyncio.Task] = []
+
+    def start_next():
+        i = len(tasks)
+        if i < len(chunks):
+            chunk_config = {**step_config, "input": chunks[i]}
+            tasks.append(asyncio.create_task(_synthesize_chunk(synthesize, chunk_config, queues[i])))
+
+    try:
+        for _ in range(max(1, window)):
+            start_next()
+
+        for queue in queues:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+            start_next()
+    finally:
+        for task in tasks:
+            task.cancel()
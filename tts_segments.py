@@ -0,0 +1,121 @@
+"""
+Line-level segment cache for step audio.
+
+With AUDIO_SEGMENTS enabled a step is rendered one dialogue line at a time.
+Each line is synthesized on its own and cached as bare MP3 frames under a
+key of its own (voice, instructions and line text), and the step is composed
+by concatenating its segments at frame boundaries, without re-encoding. When
+the content agent rewrites one line of a script only that line is
+synthesized again, and a line shared by several steps or agents with the
+same voice and instructions is rendered once.
+
+Lines are synthesized independently, so intonation does not carry across
+line boundaries the way it does when a whole step is rendered in one call.
+"""
+
+import os
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from audio_cache import content_key, read_file
+from mp3_frames import FrameReader
+from singleflight import SharedStream, SingleFlight
+from tts_pipeline import split_sentences
+
+# Segment rendering configuration (mp3 only: segments are joined as MP3 frames)
+AUDIO_SEGMENTS = os.getenv("AUDIO_SEGMENTS", "").lower() in ("1", "true", "yes")
+# Missing segments synthesized ahead of the one being streamed
+SEGMENT_WINDOW = int(os.getenv("AUDIO_SEGMENT_WINDOW", 3))
+
+# Segments hold bare frames, so they must never share a key with a whole
+# rendering of the same text
+SEGMENT_KEY_PREFIX = "segment:"
+SEGMENT_EXT = "mp3"
+
+
+def step_lines(step_config: Dict[str, Any]) -> List[str]:
+    """The lines a step is composed of: its script lines, or its sentences"""
+    return step_config.get("lines") or split_sentences(step_config["input"])
+
+
+def segment_key(step_config: Dict[str, Any], line: str, model: str) -> str:
+    return content_key({**step_config, "input": line}, SEGMENT_KEY_PREFIX + model)
+
+
+async def bare_frames(source: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Strip tags and header frames from a clip so it can be concatenated"""
+    reader = FrameReader()
+    async for data in source:
+        frames = reader.feed(data)
+        if frames:
+            yield frames
+    frames = reader.flush()
+    if frames:
+        yield frames
+
+
+async def compose_segments(
+    step_config: Dict[str, Any],
+    parts: List[Tuple[str, SingleFlight]],
+    synthesize: Callable[[Dict[str, Any]], AsyncIterator[bytes]],
+    model: str,
+    window: int = SEGMENT_WINDOW,
+) -> AsyncIterator[bytes]:
+    """
+    Stream (text, renders) parts in order as one MP3, rendering missing ones.
+
+    Each part is cached in its SingleFlight's cache and rendered through it,
+    so concurrent steps that need the same text synthesize it once. At most
+    `window` parts are looked up or started ahead of the one being streamed.
+    """
+    keys = [segment_key(step_config, text, model) for text, _ in parts]
+    started: Dict[int, SharedStream] = {}
+
+    def start(i: int) -> Optional[SharedStream]:
+        """Begin rendering part i unless it is cached; returns its render"""
+        if i in started:
+            return started[i]
+        text, flight = parts[i]
+        stream = flight.get(keys[i], SEGMENT_EXT)
+        if stream is None:
+            if flight.cache.get(keys[i], SEGMENT_EXT):
+                return None
+            part_config = {**step_config, "input": text}
+            part_config.pop("lines", None)
+            part_config.pop("template_lines", None)
+            stream = flight.start(keys[i], bare_frames(synthesize(part_config)), SEGMENT_EXT)
+        started[i] = stream
+        return stream
+
+    for i, (_, flight) in enumerate(parts):
+        for ahead in range(i, min(len(parts), i + max(1, window))):
+            start(ahead)
+
+        stream = started.get(i)
+        if stream is None or stream.done:
+            if stream is not None and stream.error is not None:
+                raise RuntimeError(f"Segment render failed for part {i + 1}") from stream.error
+            path = flight.cache.get(keys[i], SEGMENT_EXT)
+            if path is not None:
+                async for chunk in read_file(path):
+                    yield chunk
+                continue
+            # Evicted since it was checked: render it again
+            started.pop(i, None)
+            stream = start(i)
+
+        # Renders started ahead keep going if this step is abandoned, so
+        # the next request for any of these parts finds them cached
+        async for chunk in stream.subscribe():
+            yield chunk
+
+
+def segmented_stream(
+    step_config: Dict[str, Any],
+    synthesize: Callable[[Dict[str, Any]], AsyncIterator[bytes]],
+    inflight: SingleFlight,
+    model: str,
+    window: int = SEGMENT_WINDOW,
+) -> AsyncIterator[bytes]:
+    """Stream a step as its cached line segments, rendering the missing ones"""
+    parts = [(line, inflight) for line in step_lines(step_config)]
+    return compose_segments(step_config, parts, synthesize, model, window)
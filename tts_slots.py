@@ -0,0 +1,97 @@
+"""
+Personalized steps: per-hire slots spliced into cached template audio.
+
+Script lines may contain slots such as <Name>. When a request fills them
+(e.g. ?name=Alex), the step is split around its slots: the static text is
+rendered once and cached as line segments shared by every hire, and only
+the slot values are synthesized, as short clips kept in a small cache of
+their own. The clips are spliced between the static segments at MP3 frame
+boundaries while streaming, so a personalized greeting costs a fraction of
+a full render. Requests that leave a step's slots empty, or arrive while
+the TTS circuit breaker is open, get the shared render, in which each slot
+and the clause that leads into it are left out (see script_index.strip_slots).
+"""
+
+import os
+import re
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Mapping, Tuple
+
+from audio_cache import AUDIO_CACHE_DIR
+from script_index import SLOT_PATTERN
+from singleflight import SingleFlight
+from tts_segments import SEGMENT_WINDOW, compose_segments, step_lines
+
+# Cache of synthesized slot values (names are short, so this stays small)
+AUDIO_SLOT_CACHE_DIR = Path(os.getenv("AUDIO_SLOT_CACHE_DIR", AUDIO_CACHE_DIR / "slots"))
+AUDIO_SLOT_CACHE_MAX_BYTES = int(os.getenv("AUDIO_SLOT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Letters, spaces, hyphens, apostrophes and periods: enough for names, too
+# little to steer the TTS model
+SLOT_VALUE_PATTERN = re.compile(r"^[^\W\d_](?:[^\W\d_]|[ .'’-]){0,39}$")
+SPOKEN_TEXT = re.compile(r"\w")
+
+
+def template_lines(step_config: Dict[str, Any]) -> List[str]:
+    """A step's lines as written, slots included"""
+    return step_config.get("template_lines") or step_lines(step_config)
+
+
+def slot_names(step_config: Dict[str, Any]) -> List[str]:
+    """Lower-cased slot names used by a step, in order of appearance"""
+    names: List[str] = []
+    for name in SLOT_PATTERN.findall(" ".join(template_lines(step_config))):
+        if name.lower() not in names:
+            names.append(name.lower())
+    return names
+
+
+def slot_values(step_config: Dict[str, Any], params: Mapping[str, str]) -> Dict[str, str]:
+    """The request's values for a step's slots, or {} unless all are given
+
+    Raises ValueError for a value that is not a plausible name.
+    """
+    values = {}
+    for name in slot_names(step_config):
+        value = " ".join(params.get(name, "").split())
+        if not value:
+            return {}
+        if not SLOT_VALUE_PATTERN.match(value):
+            raise ValueError(f"Invalid value for <{name}>: letters, spaces, hyphens and apostrophes only")
+        values[name] = value
+    return values
+
+
+def fill_slots(text: str, values: Dict[str, str]) -> str:
+    return SLOT_PATTERN.sub(lambda match: values.get(match.group(1).lower(), match.group(0)), text)
+
+
+def template_parts(step_config: Dict[str, Any], values: Dict[str, str]) -> List[Tuple[str, bool]]:
+    """A step's lines split around slots into (text, is_slot) parts"""
+    parts: List[Tuple[str, bool]] = []
+    for line in template_lines(step_config):
+        # re.split alternates static text and captured slot names
+        for position, piece in enumerate(SLOT_PATTERN.split(line)):
+            if position % 2:
+                parts.append((values[piece.lower()], True))
+            elif SPOKEN_TEXT.search(piece):
+                parts.append((piece.strip(), False))
+    return parts
+
+
+def spliced_stream(
+    step_config: Dict[str, Any],
+    values: Dict[str, str],
+    synthesize: Callable[[Dict[str, Any]], AsyncIterator[bytes]],
+    inflight: SingleFlight,
+    slot_inflight: SingleFlight,
+    model: str,
+    window: int = SEGMENT_WINDOW,
+) -> AsyncIterator[bytes]:
+    """Stream a step with its slots filled, from cached static and slot segments"""
+    parts = [
+        (text, slot_inflight if is_slot else inflight)
+        for text, is_slot in template_parts(step_config, values)
+    ]
+    return compose_segments(step_config, parts, synthesize, model, window)
+
@@ -0,0 +1,326 @@
+"""
+Lazily loaded registry of voice agent configurations.
+
+Agents live in voice_agent/<name>/ (script.txt, instructor.txt and an
+optional conversation_states.json). Nothing is read at startup: an agent's
+files are loaded the first time it is requested and kept in an LRU of at
+most VOICE_AGENT_CACHE_SIZE configs, so startup time and memory do not grow
+with the number of agents.
+
+Listing agents (the / endpoint, pre-rendering) uses a compact on-disk index
+of per-agent metadata (voice and step ids) stored next to the agents. It is
+refreshed incrementally: only agents whose files changed are re-read.
+
+Loaded agents are hot-reloaded: watch() polls their files and, once a change
+has settled, reparses only that agent and swaps its config in one step.
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from script_index import load_script_index
+
+# Registry configuration
+VOICE_AGENT_DIR = Path(os.getenv("VOICE_AGENT_DIR", Path(__file__).parent / "voice_agent"))
+VOICE_AGENT_CACHE_SIZE = int(os.getenv("VOICE_AGENT_CACHE_SIZE", 256))
+# Seconds a directory listing is trusted before checking for changes
+VOICE_INDEX_TTL = float(os.getenv("VOICE_INDEX_TTL", 5))
+# Hot reload of loaded agents when their files change
+VOICE_AGENT_WATCH = os.getenv("VOICE_AGENT_WATCH", "1").lower() in ("1", "true", "yes")
+VOICE_AGENT_WATCH_INTERVAL = float(os.getenv("VOICE_AGENT_WATCH_INTERVAL", 2))
+
+INDEX_NAME = ".voice_index.json"
+# Bump when the index layout changes so stale indexes are rebuilt
+INDEX_VERSION = 1
+
+AGENT_FILES = ("script.txt", "instructor.txt", "conversation_states.json")
+AGENT_NAME_PATTERN = re.compile(r"^[A-Za-z0-9][\w-]*$")
+
+
+def voice_for(agent_name: str) -> str:
+    """Determine voice based on character"""
+    return "coral" if "coach" in agent_name.lower() else "onyx"
+
+
+def _signature(dir_path: Path) -> Optional[List[List[int]]]:
+    """(mtime, size) of an agent's files, or None if it is not a complete agent"""
+    signature = []
+    for name in AGENT_FILES:
+        try:
+            stat = (dir_path / name).stat()
+        except FileNotFoundError:
+            if name == "conversation_states.json":
+                signature.append([0, 0])
+                continue
+            return None
+        signature.append([stat.st_mtime_ns, stat.st_size])
+    return signature
+
+
+def _read_states(dir_path: Path) -> Optional[List[Dict[str, Any]]]:
+    conversation_states_path = dir_path / "conversation_states.json"
+    if not conversation_states_path.exists():
+        return None
+    with open(conversation_states_path, 'r') as f:
+        return json.load(f)
+
+
+def load_agent(dir_path: Path) -> Dict[str, Any]:
+    """Read one agent's files into a config"""
+    states = _read_states(dir_path)
+
+    # Compile the script once into a cached index of sections
+    script_index = load_script_index(dir_path / "script.txt")
+
+    # Read instructor file for voice instructions
+    with open(dir_path / "instructor.txt", 'r') as f:
+        instructions = f.read()
+
+    return {
+        "default_input": script_index["default_input"] or "Welcome to ACME Corporation!",
+        "instructions": instructions,
+        "voice": voice_for(dir_path.name),
+        "states": states,
+        "script_index": script_index,
+    }
+
+
+def agent_summary(dir_path: Path) -> Dict[str, Any]:
+    """The metadata kept in the on-disk index for one agent"""
+    states = _read_states(dir_path) or []
+    steps = []
+    for state in states:
+        step = state["id"].split("_")[0]
+        if step not in steps:
+            steps.append(step)
+    return {"voice": voice_for(dir_path.name), "steps": steps}
+
+
+class VoiceRegistry(Mapping):
+    """Agent name -> config, loaded on first use and bounded by an LRU"""
+
+    def __init__(
+        self,
+        directory: Path = VOICE_AGENT_DIR,
+        builtins: Optional[Dict[str, Dict[str, Any]]] = None,
+        max_loaded: int = VOICE_AGENT_CACHE_SIZE,
+        index_ttl: float = VOICE_INDEX_TTL,
+    ):
+        self.directory = Path(directory)
+        self.index_path = self.directory / INDEX_NAME
+        self.builtins = dict(builtins or {})
+        self.max_loaded = max(1, max_loaded)
+        self.index_ttl = index_ttl
+        self._loaded: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # File signatures the loaded configs were read from
+        self._signatures: Dict[str, List[List[int]]] = {}
+        self._index: Optional[Dict[str, Dict[str, Any]]] = None
+        self._index_checked = 0.0
+
+    def _agent_dir(self, name: str) -> Optional[Path]:
+        # Names come from URLs: never let them escape the agents directory
+        if not AGENT_NAME_PATTERN.match(name):
+            return None
+        dir_path = self.directory / name
+        return dir_path if dir_path.is_dir() else None
+
+    def get(self, name: str, default=None) -> Optional[Dict[str, Any]]:
+        if name in self.builtins:
+            return self.builtins[name]
+
+        config = self._loaded.get(name)
+        if config is not None:
+            self._loaded.move_to_end(name)
+            return config
+
+        dir_path = self._agent_dir(name)
+        signature = _signature(dir_path) if dir_path else None
+        if signature is None:
+            return default
+        try:
+            config = load_agent(dir_path)
+        except Exception as e:
+            print(f"Error loading config for {name}: {e}")
+            return default
+
+        self._store(name, config, signature)
+        return config
+
+    def _store(self, name: str, config: Dict[str, Any], signature: List[List[int]]):
+        self._loaded[name] = config
+        self._loaded.move_to_end(name)
+        self._signatures[name] = signature
+        while len(self._loaded) > self.max_loaded:
+            evicted, _ = self._loaded.popitem(last=False)
+            self._signatures.pop(evicted, None)
+
+    def __getitem__(self, name: str) -> Dict[str, Any]:
+        config = self.get(name)
+        if config is None:
+            raise KeyError(name)
+        return config
+
+    def __contains__(self, name) -> bool:
+        if name in self.builtins or name in self._loaded:
+            return True
+        dir_path = self._agent_dir(name) if isinstance(name, str) else None
+        return dir_path is not None and _signature(dir_path) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names())
+
+    def __len__(self) -> int:
+        return len(self.names())
+
+    def names(self) -> List[str]:
+        return list(self.builtins) + sorted(self.index())
+
+    def invalidate(self, name: Optional[str] = None):
+        """Forget loaded configs (all of them when no name is given)"""
+        if name is None:
+            self._loaded.clear()
+            self._signatures.clear()
+        else:
+            self._loaded.pop(name, None)
+            self._signatures.pop(name, None)
+        self._index_checked = 0.0
+
+    def changed(self) -> Dict[str, Optional[List[List[int]]]]:
+        """Loaded agents whose files differ from what was loaded (None if removed)"""
+        changes = {}
+        for name, signature in list(self._signatures.items()):
+            dir_path = self._agent_dir(name)
+            current = _signature(dir_path) if dir_path else None
+            if current != signature:
+                changes[name] = current
+        return changes
+
+    async def reload(self, name: str) -> Optional[Dict[str, Any]]:
+        """Reparse one agent off the event loop and swap in the new config
+
+        Returns the new config, or None if the agent is gone or no longer
+        loads (the old config is then dropped or kept, respectively).
+        """
+        dir_path = self._agent_dir(name)
+        signature = _signature(dir_path) if dir_path else None
+        self._index_checked = 0.0
+        if signature is None:
+            self.invalidate(name)
+            return None
+        try:
+            config = await asyncio.to_thread(load_agent, dir_path)
+        except Exception as e:
+            # Keep serving the previous content until the files change again
+            print(f"Error reloading config for {name}: {e}")
+            if name in self._signatures:
+                self._signatures[name] = signature
+            return None
+        self._store(name, config, signature)
+        return config
+
+    async def watch(
+        self,
+        on_change: Callable[[str, Optional[Dict[str, Any]], Optional[Dict[str, Any]]], Awaitable[None]],
+        interval: float = VOICE_AGENT_WATCH_INTERVAL,
+    ):
+        """Poll loaded agents and reload those whose files changed
+
+        A change is applied once the files are unchanged for one interval, so
+        an agent being rewritten file by file is reloaded once, complete.
+        on_change(name, old_config, new_config) runs after each swap.
+        """
+        pending: Dict[str, Optional[List[List[int]]]] = {}
+        while True:
+            await asyncio.sleep(interval)
+            changes = self.changed()
+            for name, signature in changes.items():
+                if name in pending and pending[name] == signature:
+                    del pending[name]
+                    old = self._loaded.get(name)
+                    new = await self.reload(name)
+                    if new is not None or name not in self._loaded:
+                        print(f"🔄 Reloaded voice agent {name}" if new else f"🗑️  Voice agent {name} removed")
+                        await on_change(name, old, new)
+                else:
+                    pending[name] = signature
+            for name in [name for name in pending if name not in changes]:
+                del pending[name]
+
+    def loaded(self) -> int:
+        return len(self._loaded)
+
+    def summary(self, name: str) -> Optional[Dict[str, Any]]:
+        """Voice and step ids for an agent, without loading its script"""
+        if name in self.builtins:
+            config = self.builtins[name]
+            steps = [state["id"].split("_")[0] for state in config.get("states") or []]
+            return {"voice": config["voice"], "steps": steps}
+        entry = self.index().get(name)
+        return {"voice": entry["voice"], "steps": entry["steps"]} if entry else None
+
+    def index(self) -> Dict[str, Dict[str, Any]]:
+        """The on-disk agent index, refreshed when agents change"""
+        now = time.monotonic()
+        if self._index is not None and now - self._index_checked < self.index_ttl:
+            return self._index
+        self._index_checked = now
+
+        if self._index is None:
+            self._index = self._read_index()
+
+        if not self.directory.exists():
+            self._index = {}
+            return self._index
+
+        index: Dict[str, Dict[str, Any]] = {}
+        changed = False
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_dir() or not AGENT_NAME_PATTERN.match(entry.name):
+                    continue
+                dir_path = Path(entry.path)
+                signature = _signature(dir_path)
+                if signature is None:
+                    continue
+                cached = self._index.get(entry.name)
+                if cached and cached["signature"] == signature:
+                    index[entry.name] = cached
+                    continue
+                try:
+                    index[entry.name] = {"signature": signature, **agent_summary(dir_path)}
+                except Exception as e:
+                    print(f"Error indexing voice agent {entry.name}: {e}")
+                    continue
+                changed = True
+
+        if changed or index.keys() != self._index.keys():
+            self._index = index
+            self._write_index()
+        return self._index
+
+    def _read_index(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                return data.get("agents", {})
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def _write_index(self):
+        try:
+            tmp_path = self.index_path.with_suffix(".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"version": INDEX_VERSION, "agents": self._index}, f, separators=(",", ":"))
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            # A read-only deployment still works, it just re-indexes on start
+            print(f"Could not write voice agent index: {e}")